@@ -50,6 +50,14 @@ async def application(scope, receive, send):
 					except Exception as e:
 						logger.error("ASGI startup: health check failed: %s", e, exc_info=True)
 
+					# Pre-open keep-alive connections to the active nodes so the first
+					# proxied requests do not pay TCP/TLS setup
+					try:
+						await mgr.warm_clients()
+						logger.info("ASGI startup: upstream connection pools warmed")
+					except Exception as e:
+						logger.warning("ASGI startup: upstream pool warm-up failed: %s", e)
+
 					# Start the background scheduler for periodic health checks and model refreshes
 					# Use leader lock to ensure only one worker starts the scheduler
 					try:
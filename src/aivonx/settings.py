@@ -173,6 +173,92 @@ LOG_JSON_PATH = str(BASE_DIR / 'logs' / 'django.json')
 # Path to proxy JSON log file
 PROXY_LOG_JSON_PATH = str(BASE_DIR / 'logs' / 'proxy.json')
 
+# Proxy upstream settings
+# Per-node connection pool limits (per worker process)
+PROXY_POOL_MAX_CONNECTIONS = int(os.getenv("PROXY_POOL_MAX_CONNECTIONS", "100"))
+PROXY_POOL_MAX_KEEPALIVE = int(os.getenv("PROXY_POOL_MAX_KEEPALIVE", "20"))
+PROXY_POOL_KEEPALIVE_EXPIRY = float(os.getenv("PROXY_POOL_KEEPALIVE_EXPIRY", "60"))
+# Connections opened to each active node at startup
+PROXY_POOL_WARM_CONNECTIONS = int(os.getenv("PROXY_POOL_WARM_CONNECTIONS", "2"))
+# Max seconds between checks of the shared routing version (worker-local snapshot)
+PROXY_ROUTING_SNAPSHOT_TTL = float(os.getenv("PROXY_ROUTING_SNAPSHOT_TTL", "1.0"))
+# Seconds between /api/ps polls used by the warm_model strategy
+PROXY_RESIDENCY_REFRESH_INTERVAL = int(os.getenv("PROXY_RESIDENCY_REFRESH_INTERVAL", "15"))
+# prefix_affinity strategy: prompt prefix hashed onto the node ring
+PROXY_AFFINITY_PREFIX_MESSAGES = int(os.getenv("PROXY_AFFINITY_PREFIX_MESSAGES", "1"))
+PROXY_AFFINITY_PREFIX_CHARS = int(os.getenv("PROXY_AFFINITY_PREFIX_CHARS", "512"))
+PROXY_AFFINITY_LOAD_FACTOR = float(os.getenv("PROXY_AFFINITY_LOAD_FACTOR", "1.25"))
+# Smoothing factor of the per-node, per-model response statistics (expected_time strategy)
+PROXY_TRAFFIC_EWMA_ALPHA = float(os.getenv("PROXY_TRAFFIC_EWMA_ALPHA", "0.2"))
+# Seconds after which a time-to-first-token sample counts half (lowest_ttft strategy)
+PROXY_TTFT_HALF_LIFE = float(os.getenv("PROXY_TTFT_HALF_LIFE", "60"))
+# Default per-node in-flight cap when node.max_concurrency is unset (0 = unlimited)
+PROXY_NODE_MAX_CONCURRENCY = int(os.getenv("PROXY_NODE_MAX_CONCURRENCY", "0"))
+# Admission queue for requests that find every eligible node at its cap
+PROXY_ADMISSION_MAX_WAIT = float(os.getenv("PROXY_ADMISSION_MAX_WAIT", "30"))
+PROXY_ADMISSION_MAX_DEPTH = int(os.getenv("PROXY_ADMISSION_MAX_DEPTH", "100"))
+# Adaptive (AIMD) per-node in-flight limits learned from latency and errors
+PROXY_ADAPTIVE_CONCURRENCY = os.getenv("PROXY_ADAPTIVE_CONCURRENCY", "false").lower() in ("1", "true", "yes")
+PROXY_ADAPTIVE_INITIAL_LIMIT = int(os.getenv("PROXY_ADAPTIVE_INITIAL_LIMIT", "4"))
+PROXY_ADAPTIVE_MIN_LIMIT = int(os.getenv("PROXY_ADAPTIVE_MIN_LIMIT", "1"))
+PROXY_ADAPTIVE_MAX_LIMIT = int(os.getenv("PROXY_ADAPTIVE_MAX_LIMIT", "32"))
+PROXY_ADAPTIVE_LATENCY_TOLERANCE = float(os.getenv("PROXY_ADAPTIVE_LATENCY_TOLERANCE", "2.0"))
+PROXY_ADAPTIVE_BACKOFF = float(os.getenv("PROXY_ADAPTIVE_BACKOFF", "0.7"))
+# In-flight leases: seconds a lease outlives a worker that stopped renewing it,
+# and how often the leader drops expired leases
+PROXY_LEASE_TTL = float(os.getenv("PROXY_LEASE_TTL", "60"))
+PROXY_LEASE_REAP_INTERVAL = int(os.getenv("PROXY_LEASE_REAP_INTERVAL", "15"))
+# Per-node circuit breaker fed by proxied request outcomes (errors, timeouts, 5xx)
+PROXY_CIRCUIT_BREAKER = os.getenv("PROXY_CIRCUIT_BREAKER", "true").lower() in ("1", "true", "yes")
+PROXY_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("PROXY_CIRCUIT_FAILURE_THRESHOLD", "5"))
+PROXY_CIRCUIT_SUCCESS_THRESHOLD = int(os.getenv("PROXY_CIRCUIT_SUCCESS_THRESHOLD", "2"))
+PROXY_CIRCUIT_OPEN_SECONDS = float(os.getenv("PROXY_CIRCUIT_OPEN_SECONDS", "10"))
+PROXY_CIRCUIT_MAX_OPEN_SECONDS = float(os.getenv("PROXY_CIRCUIT_MAX_OPEN_SECONDS", "120"))
+PROXY_CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("PROXY_CIRCUIT_HALF_OPEN_PROBES", "1"))
+# Temporary ejection of nodes much slower than the fleet median (per model)
+PROXY_OUTLIER_DETECTION = os.getenv("PROXY_OUTLIER_DETECTION", "true").lower() in ("1", "true", "yes")
+PROXY_OUTLIER_FACTOR = float(os.getenv("PROXY_OUTLIER_FACTOR", "2.0"))
+PROXY_OUTLIER_MIN_HOSTS = int(os.getenv("PROXY_OUTLIER_MIN_HOSTS", "3"))
+PROXY_OUTLIER_MIN_SAMPLES = int(os.getenv("PROXY_OUTLIER_MIN_SAMPLES", "5"))
+PROXY_OUTLIER_INTERVAL = float(os.getenv("PROXY_OUTLIER_INTERVAL", "10"))
+PROXY_OUTLIER_EJECTION_SECONDS = float(os.getenv("PROXY_OUTLIER_EJECTION_SECONDS", "30"))
+PROXY_OUTLIER_MAX_EJECTION_SECONDS = float(os.getenv("PROXY_OUTLIER_MAX_EJECTION_SECONDS", "300"))
+PROXY_OUTLIER_MAX_EJECTED_FRACTION = float(os.getenv("PROXY_OUTLIER_MAX_EJECTED_FRACTION", "0.34"))
+# Failover of generate/chat requests whose node fails before the first byte
+PROXY_RETRY_ATTEMPTS = int(os.getenv("PROXY_RETRY_ATTEMPTS", "3"))
+PROXY_RETRY_DEADLINE = float(os.getenv("PROXY_RETRY_DEADLINE", "15"))
+# Hedged requests: endpoints (embed, embeddings, generate) and models, empty = off / all models
+PROXY_HEDGE_ENDPOINTS = _split_env_list("PROXY_HEDGE_ENDPOINTS")
+PROXY_HEDGE_MODELS = _split_env_list("PROXY_HEDGE_MODELS")
+PROXY_HEDGE_BUDGET = float(os.getenv("PROXY_HEDGE_BUDGET", "0.05"))
+PROXY_HEDGE_QUANTILE = float(os.getenv("PROXY_HEDGE_QUANTILE", "0.95"))
+PROXY_HEDGE_DEFAULT_DELAY = float(os.getenv("PROXY_HEDGE_DEFAULT_DELAY", "1.0"))
+PROXY_HEDGE_MIN_DELAY = float(os.getenv("PROXY_HEDGE_MIN_DELAY", "0.02"))
+PROXY_HEDGE_MAX_PREDICT = int(os.getenv("PROXY_HEDGE_MAX_PREDICT", "64"))
+# Single-flight coalescing of identical deterministic non-streaming requests
+PROXY_COALESCE = os.getenv("PROXY_COALESCE", "true").lower() in ("1", "true", "yes")
+PROXY_COALESCE_REDIS = os.getenv("PROXY_COALESCE_REDIS", "false").lower() in ("1", "true", "yes")
+PROXY_COALESCE_WAIT = float(os.getenv("PROXY_COALESCE_WAIT", "120"))
+# Response cache of deterministic requests (keyed by model digest): endpoints embed, embeddings, generate, chat
+PROXY_RESPONSE_CACHE = os.getenv("PROXY_RESPONSE_CACHE", "true").lower() in ("1", "true", "yes")
+PROXY_RESPONSE_CACHE_ENDPOINTS = _split_env_list("PROXY_RESPONSE_CACHE_ENDPOINTS", "embed,embeddings")
+PROXY_RESPONSE_CACHE_TTL = float(os.getenv("PROXY_RESPONSE_CACHE_TTL", "600"))
+PROXY_RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("PROXY_RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+PROXY_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("PROXY_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+PROXY_RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("PROXY_RESPONSE_CACHE_MAX_ENTRY_BYTES", str(1024 * 1024)))
+PROXY_RESPONSE_CACHE_REDIS = os.getenv("PROXY_RESPONSE_CACHE_REDIS", "true").lower() in ("1", "true", "yes")
+# Micro-batching of concurrent /api/embed requests for the same model and options
+PROXY_EMBED_BATCH = os.getenv("PROXY_EMBED_BATCH", "false").lower() in ("1", "true", "yes")
+PROXY_EMBED_BATCH_WINDOW_MS = float(os.getenv("PROXY_EMBED_BATCH_WINDOW_MS", "5"))
+PROXY_EMBED_BATCH_MAX_INPUTS = int(os.getenv("PROXY_EMBED_BATCH_MAX_INPUTS", "32"))
+# Scatter-gather of large /api/embed inputs across nodes (chunk size, 0 = off)
+PROXY_EMBED_SHARD_SIZE = int(os.getenv("PROXY_EMBED_SHARD_SIZE", "128"))
+PROXY_EMBED_SHARD_PER_NODE = int(os.getenv("PROXY_EMBED_SHARD_PER_NODE", "2"))
+# Persistent embedding store (memory-mapped file shared by the workers of a host; empty path = off)
+PROXY_EMBED_STORE_PATH = os.getenv("PROXY_EMBED_STORE_PATH", "")
+PROXY_EMBED_STORE_DTYPE = os.getenv("PROXY_EMBED_STORE_DTYPE", "float32")
+PROXY_EMBED_STORE_MAX_BYTES = int(os.getenv("PROXY_EMBED_STORE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -5,7 +5,7 @@ from .models import node, ProxyConfig
 class NodeForm(forms.ModelForm):
     class Meta:
         model = node
-        fields = ['name', 'address', 'port']
+        fields = ['name', 'address', 'port', 'weight', 'max_concurrency']
 
 
 class ProxyConfigForm(forms.ModelForm):
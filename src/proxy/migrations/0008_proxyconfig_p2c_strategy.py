@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proxy', '0007_alter_node_active'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='proxyconfig',
+            name='strategy',
+            field=models.CharField(choices=[('least_active', 'Least active (default)'), ('lowest_latency', 'Lowest latency'), ('p2c', 'Power of two choices')], default='least_active', max_length=32),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proxy', '0008_proxyconfig_p2c_strategy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='proxyconfig',
+            name='strategy',
+            field=models.CharField(choices=[('least_active', 'Least active (default)'), ('lowest_latency', 'Lowest latency'), ('p2c', 'Power of two choices'), ('warm_model', 'Warm model (prefer nodes with the model loaded)')], default='least_active', max_length=32),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:55
+
+import proxy.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proxy', '0010_proxyconfig_prefix_affinity_strategy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[proxy.models.validate_positive]),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='weight',
+            field=models.FloatField(default=1.0, validators=[proxy.models.validate_positive]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('proxy', '0012_proxyconfig_expected_time_strategy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='proxyconfig',
+            name='strategy',
+            field=models.CharField(choices=[('least_active', 'Least active (default)'), ('lowest_latency', 'Lowest latency'), ('p2c', 'Power of two choices'), ('warm_model', 'Warm model (prefer nodes with the model loaded)'), ('prefix_affinity', 'Prompt prefix affinity'), ('expected_time', 'Expected completion time (measured traffic)'), ('lowest_ttft', 'Lowest time to first token (streaming)')], default='least_active', max_length=32),
+        ),
+    ]
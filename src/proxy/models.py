@@ -1,5 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
+
+def validate_positive(value):
+    if value is None or value <= 0:
+        raise ValidationError("must be greater than 0")
+
+
 class node(models.Model):
     id = models.AutoField(primary_key=True)
     name = models.CharField(max_length=100)
@@ -7,6 +14,10 @@ class node(models.Model):
     port = models.IntegerField()
     active = models.BooleanField(default=False)
     available_models = models.JSONField(blank=True, default=list)
+    # relative capacity: in-flight counts are divided by it when balancing
+    weight = models.FloatField(default=1.0, validators=[validate_positive])
+    # hard cap on concurrent proxied requests (None = unlimited)
+    max_concurrency = models.PositiveIntegerField(null=True, blank=True, validators=[validate_positive])
     created_at = models.DateTimeField(auto_now_add=True)
 
 class ProxyConfig(models.Model):
@@ -16,10 +27,20 @@ class ProxyConfig(models.Model):
     """
     STRATEGY_LEAST_ACTIVE = "least_active"
     STRATEGY_LOWEST_LATENCY = "lowest_latency"
+    STRATEGY_P2C = "p2c"
+    STRATEGY_WARM_MODEL = "warm_model"
+    STRATEGY_PREFIX_AFFINITY = "prefix_affinity"
+    STRATEGY_EXPECTED_TIME = "expected_time"
+    STRATEGY_LOWEST_TTFT = "lowest_ttft"
 
     STRATEGY_CHOICES = [
         (STRATEGY_LEAST_ACTIVE, "Least active (default)"),
         (STRATEGY_LOWEST_LATENCY, "Lowest latency"),
+        (STRATEGY_P2C, "Power of two choices"),
+        (STRATEGY_WARM_MODEL, "Warm model (prefer nodes with the model loaded)"),
+        (STRATEGY_PREFIX_AFFINITY, "Prompt prefix affinity"),
+        (STRATEGY_EXPECTED_TIME, "Expected completion time (measured traffic)"),
+        (STRATEGY_LOWEST_TTFT, "Lowest time to first token (streaming)"),
     ]
 
     id = models.AutoField(primary_key=True)
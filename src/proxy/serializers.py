@@ -27,6 +27,8 @@ class NodeSerializer(DynamicFieldsModelSerializer):
             'address',
             'port',
             'active',
+            'weight',
+            'max_concurrency',
             'created_at',
         ]
         read_only_fields = ['id', 'created_at']
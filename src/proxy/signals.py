@@ -1,6 +1,6 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import node as NodeModel
+from .models import node as NodeModel, ProxyConfig
 import logging
 logger = logging.getLogger('proxy')
 
@@ -94,3 +94,17 @@ def node_deleted(sender, instance, **kwargs):
             logger.exception("signals: failed to refresh HA manager after node delete: %s", e)
     except Exception:
         logger.debug("signals: get_global_manager failed during node delete handler")
+
+
+@receiver(post_save, sender=ProxyConfig)
+def proxy_config_saved(sender, instance, **kwargs):
+    """Publish strategy changes to every worker's routing snapshot."""
+    try:
+        mgr = get_global_manager()
+        if mgr is None:
+            logger.debug("signals: no global manager available to publish strategy")
+            return
+        mgr.publish_strategy(instance.strategy)
+        logger.info("signals: published proxy strategy %s", instance.strategy)
+    except Exception as e:
+        logger.debug("signals: failed to publish strategy after config save: %s", e)
@@ -7,6 +7,8 @@ const modalAction = document.getElementById('modal-action');
 const modalName = document.getElementById('modal-name');
 const modalAddress = document.getElementById('modal-address');
 const modalPort = document.getElementById('modal-port');
+const modalWeight = document.getElementById('modal-weight');
+const modalMaxConcurrency = document.getElementById('modal-max-concurrency');
 const openAddBtn = document.getElementById('open-add-node');
 const closeBtn = document.getElementById('modal-close');
 
@@ -19,6 +21,8 @@ function openModal(mode, data) {
     modalName.value = '';
     modalAddress.value = '';
     modalPort.value = '';
+    modalWeight.value = '1';
+    modalMaxConcurrency.value = '';
   } else {
     modalTitle.textContent = 'Edit Node';
     modalAction.value = 'edit_node';
@@ -26,6 +30,8 @@ function openModal(mode, data) {
     modalName.value = data.name || '';
     modalAddress.value = data.address || '';
     modalPort.value = data.port || '';
+    modalWeight.value = data.weight || '1';
+    modalMaxConcurrency.value = data.maxConcurrency || '';
   }
 }
 
@@ -39,7 +45,9 @@ document.querySelectorAll('.edit-node-btn').forEach(btn => {
     const name = btn.getAttribute('data-name');
     const address = btn.getAttribute('data-address');
     const port = btn.getAttribute('data-port');
-    openModal('edit', { id, name, address, port });
+    const weight = btn.getAttribute('data-weight');
+    const maxConcurrency = btn.getAttribute('data-max-concurrency');
+    openModal('edit', { id, name, address, port, weight, maxConcurrency });
   });
 });
 
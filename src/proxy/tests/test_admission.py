@@ -0,0 +1,64 @@
+from django.test import SimpleTestCase
+
+import asyncio
+import threading
+
+from proxy.utils.admission import AdmissionQueue, NodesSaturated
+
+
+class AdmissionQueueTests(SimpleTestCase):
+    """Tests for the bounded wait queue used when every node is at its cap."""
+
+    def test_waiter_woken_by_notify_from_another_thread(self):
+        queue = AdmissionQueue(max_wait=5.0, poll_interval=5.0)
+        slots = []
+
+        async def _try():
+            return slots.pop() if slots else None
+
+        async def _run():
+            task = asyncio.ensure_future(queue.wait_for_node(_try))
+            await asyncio.sleep(0.05)
+            self.assertEqual(queue.stats()["depth"], 1)
+            slots.append("http://192.168.0.10:11434")
+            threading.Thread(target=queue.notify).start()
+            return await asyncio.wait_for(task, timeout=1.0)
+
+        self.assertEqual(asyncio.run(_run()), "http://192.168.0.10:11434")
+        stats = queue.stats()
+        self.assertEqual((stats["depth"], stats["queued"], stats["admitted"]), (0, 1, 1))
+        self.assertLess(stats["max_wait"], 1.0)
+
+    def test_wakeup_claimed_at_timeout_is_passed_on(self):
+        async def _never():
+            return None
+
+        queue = AdmissionQueue(max_wait=0.2, poll_interval=0.05)
+        notified = []
+        queue.notify = lambda: notified.append(True)
+
+        async def _run():
+            task = asyncio.ensure_future(queue.wait_for_node(_never))
+            await asyncio.sleep(0.01)
+            # notify() takes the entry but its wake-up lands after the timeout
+            with queue._lock:
+                queue._waiters.popleft()
+            with self.assertRaises(NodesSaturated):
+                await task
+
+        asyncio.run(_run())
+        self.assertEqual(len(notified), 1)
+
+    def test_times_out_and_rejects_when_full(self):
+        async def _never():
+            return None
+
+        queue = AdmissionQueue(max_wait=0.05, poll_interval=0.01)
+        with self.assertRaises(NodesSaturated):
+            asyncio.run(queue.wait_for_node(_never))
+        self.assertEqual(queue.stats()["timeouts"], 1)
+
+        full = AdmissionQueue(max_depth=0)
+        with self.assertRaises(NodesSaturated):
+            asyncio.run(full.wait_for_node(_never))
+        self.assertEqual(full.stats()["rejected"], 1)
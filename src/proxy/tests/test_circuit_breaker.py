@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+
+from proxy.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    """Tests for the per-node circuit breakers fed by proxied requests."""
+
+    a = "http://192.168.0.10:11434"
+    b = "http://192.168.0.11:11434"
+
+    def _expire(self, breaker, addr):
+        breaker._circuits[addr].opened_at -= breaker._circuits[addr].cooldown
+
+    def test_consecutive_failures_open_the_circuit(self):
+        breaker = CircuitBreaker(failure_threshold=3)
+        breaker.record(self.a, False)
+        breaker.record(self.a, False)
+        breaker.record(self.a, True)  # a success resets the streak
+        breaker.record(self.a, False)
+        breaker.record(self.a, False)
+        self.assertEqual(breaker.state(self.a), CLOSED)
+        breaker.record(self.a, False)
+        self.assertEqual(breaker.state(self.a), OPEN)
+        self.assertEqual(breaker.filter([self.a, self.b]), [self.b])
+        self.assertEqual(breaker.stats()["nodes"][self.a]["trips"], 1)
+
+    def test_half_open_probes_close_or_reopen(self):
+        breaker = CircuitBreaker(failure_threshold=1, success_threshold=2, open_seconds=5.0)
+        breaker.record(self.a, False)
+        self._expire(breaker, self.a)
+        self.assertEqual(breaker.filter([self.a, self.b]), [self.a, self.b])
+        self.assertEqual(breaker.state(self.a), HALF_OPEN)
+
+        # one probe at a time
+        breaker.routed(self.a)
+        self.assertEqual(breaker.filter([self.a, self.b]), [self.b])
+        # a failed probe re-opens with a doubled cooldown
+        breaker.record(self.a, False)
+        self.assertEqual(breaker.state(self.a), OPEN)
+        self.assertEqual(breaker._circuits[self.a].cooldown, 10.0)
+
+        self._expire(breaker, self.a)
+        for _ in range(2):
+            self.assertEqual(breaker.filter([self.a]), [self.a])
+            breaker.routed(self.a)
+            breaker.record(self.a, True)
+        self.assertEqual(breaker.state(self.a), CLOSED)
+
+    def test_unknown_outcome_only_frees_the_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record(self.a, False)
+        self._expire(breaker, self.a)
+        self.assertEqual(breaker.state(self.a), HALF_OPEN)
+        breaker.routed(self.a)
+        breaker.record(self.a, None)
+        self.assertEqual(breaker.state(self.a), HALF_OPEN)
+        self.assertEqual(breaker.filter([self.a]), [self.a])
+
+    def test_all_open_routes_anyway_and_disabled_passes_through(self):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record(self.a, False)
+        breaker.record(self.b, False)
+        self.assertEqual(breaker.filter([self.a, self.b]), [self.a, self.b])
+
+        disabled = CircuitBreaker(enabled=False, failure_threshold=1)
+        disabled.record(self.a, False)
+        self.assertEqual(disabled.filter([self.a]), [self.a])
+        self.assertEqual(disabled.stats()["nodes"], {})
@@ -0,0 +1,62 @@
+from django.test import TestCase
+
+import asyncio
+
+from proxy.utils.client_pool import UpstreamClientPool
+
+
+class UpstreamClientPoolTests(TestCase):
+    """Tests for the per-node, per-event-loop upstream client pool."""
+
+    def test_client_reused_within_loop(self):
+        pool = UpstreamClientPool()
+
+        async def _get_twice():
+            c1 = pool.get("http://192.168.0.10:11434")
+            c2 = pool.get("http://192.168.0.10:11434/")
+            c3 = pool.get("http://192.168.0.11:11434")
+            await pool.aclose()
+            return c1, c2, c3
+
+        c1, c2, c3 = asyncio.run(_get_twice())
+        self.assertIs(c1, c2)
+        self.assertIsNot(c1, c3)
+        self.assertTrue(c1.is_closed)
+
+    def test_clients_are_per_event_loop(self):
+        pool = UpstreamClientPool()
+
+        async def _get():
+            return pool.get("http://192.168.0.10:11434")
+
+        c1 = asyncio.run(_get())
+        c2 = asyncio.run(_get())
+        self.assertIsNot(c1, c2)
+        # clients of closed loops are pruned from stats
+        self.assertEqual(pool.stats(), {})
+
+    def test_clients_closed_with_their_loop(self):
+        pool = UpstreamClientPool()
+
+        async def _get():
+            return pool.get("http://192.168.0.10:11434")
+
+        # asyncio.run shuts down async generators before closing the loop
+        client = asyncio.run(_get())
+        self.assertTrue(client.is_closed)
+        self.assertEqual(pool._clients, {})
+        self.assertEqual(pool._guards, {})
+
+    def test_stats_report_clients_per_node(self):
+        pool = UpstreamClientPool()
+
+        async def _stats():
+            pool.get("http://192.168.0.10:11434")
+            stats = pool.stats()
+            await pool.aclose()
+            return stats
+
+        stats = asyncio.run(_stats())
+        self.assertIn("http://192.168.0.10:11434", stats)
+        self.assertEqual(stats["http://192.168.0.10:11434"]["clients"], 1)
+        self.assertEqual(stats["http://192.168.0.10:11434"]["connections"], 0)
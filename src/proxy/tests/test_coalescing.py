@@ -0,0 +1,75 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from proxy.utils.coalescing import SingleFlight, pack_result, request_key, unpack_result
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Tests for the coalescing of concurrent identical requests."""
+
+    def test_request_key_ignores_key_order_and_whitespace(self):
+        a = request_key("embed", {"model": "m", "input": ["x", "y"]})
+        self.assertEqual(a, request_key("embed", {"input": ["x", "y"], "model": "m"}))
+        self.assertNotEqual(a, request_key("embeddings", {"model": "m", "input": ["x", "y"]}))
+        self.assertNotEqual(a, request_key("embed", {"model": "m", "input": ["y", "x"]}))
+
+    def test_pack_round_trip(self):
+        result = (200, "application/json; charset=utf-8", b'{"a":\n1}')
+        self.assertEqual(unpack_result(pack_result(result)), result)
+
+    def test_concurrent_calls_share_one_upstream_call(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 200, "application/json", b"{}"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(set(results), {(200, "application/json", b"{}")})
+        stats = flight.stats()
+        self.assertEqual((stats["flights"], stats["local_joins"], stats["in_flight"]), (1, 4, 0))
+
+        # a finished flight is not a cache
+        asyncio.run(flight.do("k", fn))
+        self.assertEqual(len(calls), 2)
+
+    def test_waiters_fall_back_when_the_leader_fails(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return 200, "application/json", b"{}"
+
+        async def main():
+            return await asyncio.gather(flight.do("k", fn), flight.do("k", fn), return_exceptions=True)
+
+        leader, waiter = asyncio.run(main())
+        self.assertIsInstance(leader, RuntimeError)
+        self.assertEqual(waiter, (200, "application/json", b"{}"))
+        self.assertEqual(flight.stats()["fallbacks"], 1)
+
+    def test_disabled_calls_every_time(self):
+        flight = SingleFlight(enabled=False)
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 200, "application/json", b"{}"
+
+        async def main():
+            await asyncio.gather(flight.do("k", fn), flight.do("k", fn))
+
+        asyncio.run(main())
+        self.assertEqual(len(calls), 2)
@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+
+from proxy.utils.concurrency import AdaptiveConcurrency
+
+
+class AdaptiveConcurrencyTests(SimpleTestCase):
+    """Tests for the AIMD per-node in-flight limits."""
+
+    node = "http://192.168.0.10:11434"
+
+    def test_grows_while_saturated_and_backs_off_on_errors(self):
+        limiter = AdaptiveConcurrency(enabled=True, initial_limit=2, max_limit=8)
+        for _ in range(40):
+            limiter.record(self.node, 0.5, inflight=limiter.limit(self.node))
+        self.assertEqual(limiter.limit(self.node), 8)
+
+        # one overload episode halves (x0.7) the limit once, not once per failure
+        limiter.record(self.node, None, ok=False)
+        limiter.record(self.node, None, ok=False)
+        self.assertEqual(limiter.limit(self.node), 5)
+        self.assertEqual(limiter.stats()["nodes"][self.node]["errors"], 2)
+
+    def test_latency_spike_backs_off_and_idle_node_does_not_grow(self):
+        limiter = AdaptiveConcurrency(enabled=True, initial_limit=4, warmup=3)
+        for _ in range(5):
+            limiter.record(self.node, 1.0, inflight=1)
+        self.assertEqual(limiter.limit(self.node), 4)
+        limiter.record(self.node, 5.0, inflight=4)
+        self.assertEqual(limiter.limit(self.node), 2)
+
+    def test_long_generation_is_not_congestion(self):
+        limiter = AdaptiveConcurrency(enabled=True, initial_limit=4, warmup=3)
+        short = {"eval_count": 20, "eval_duration": 1_000_000_000}
+        long = {"eval_count": 2000, "eval_duration": 100_000_000_000}
+        self.assertEqual(limiter.signal(1.5, short), ("ttft", 0.5))
+        self.assertEqual(limiter.signal(0.2, {"total_duration": 150_000_000}), ("latency", 0.2))
+        for _ in range(5):
+            signal, sample = limiter.signal(1.5, short)
+            limiter.record(self.node, sample, inflight=1, signal=signal)
+        # a 100s answer spends the usual 0.5s outside decoding: no backoff
+        signal, sample = limiter.signal(100.5, long)
+        limiter.record(self.node, sample, inflight=4, signal=signal)
+        self.assertEqual(limiter.limit(self.node), 4)
+        # queueing on the node shows up in the same signal
+        signal, sample = limiter.signal(4.0, short)
+        limiter.record(self.node, sample, inflight=4, signal=signal)
+        self.assertEqual(limiter.limit(self.node), 2)
+        # embeddings are judged against their own baseline
+        limiter.record(self.node, 0.2, inflight=1)
+        self.assertEqual(set(limiter.stats()["nodes"][self.node]["baselines"]), {"ttft", "latency"})
+
+    def test_static_cap_bounds_learned_limit(self):
+        other = "http://192.168.0.11:11434"
+        limiter = AdaptiveConcurrency(enabled=True, initial_limit=4)
+        self.assertEqual(limiter.caps({self.node: 2, other: 0}, [self.node, other]), {self.node: 2, other: 4})
+        disabled = AdaptiveConcurrency()
+        self.assertEqual(disabled.caps({self.node: 0}, [self.node]), {self.node: 0})
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+from django.test import SimpleTestCase
+
+from proxy.utils.embed_batcher import EmbedBatcher
+
+
+class EmbedBatcherTests(SimpleTestCase):
+    """Tests for the micro-batching of concurrent /api/embed requests."""
+
+    def _sender(self, sent, status=200):
+        async def send(body):
+            sent.append(body)
+            embeddings = [[float(len(text))] for text in body["input"]]
+            return status, json.dumps({"model": body["model"], "embeddings": embeddings}).encode()
+        return send
+
+    def test_concurrent_requests_share_one_call(self):
+        batcher = EmbedBatcher(enabled=True, window=0.02, max_inputs=32)
+        sent = []
+        payloads = [{"model": "m", "input": "a"}, {"model": "m", "input": ["bb", "ccc"]}, {"model": "m", "input": "dddd"}]
+
+        async def main():
+            send = self._sender(sent)
+            return await asyncio.gather(*(batcher.submit(batcher.key(p), p, send) for p in payloads))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(sent[0]["input"], ["a", "bb", "ccc", "dddd"])
+        self.assertEqual([r["embeddings"] for r in results], [[[1.0]], [[2.0], [3.0]], [[4.0]]])
+        stats = batcher.stats()
+        self.assertEqual((stats["batches"], stats["requests"], stats["inputs"]), (1, 3, 4))
+        self.assertEqual(stats["batch_size_histogram"]["<=4"], 1)
+
+    def test_full_batch_is_sent_without_waiting(self):
+        batcher = EmbedBatcher(enabled=True, window=10.0, max_inputs=2)
+        sent = []
+
+        async def main():
+            send = self._sender(sent)
+            p = {"model": "m", "input": "a"}
+            return await asyncio.wait_for(asyncio.gather(batcher.submit(batcher.key(p), p, send),
+                                                         batcher.submit(batcher.key(p), p, send)), 1.0)
+
+        asyncio.run(main())
+        self.assertEqual(len(sent), 1)
+
+    def test_keys_separate_models_and_options(self):
+        batcher = EmbedBatcher(enabled=True, max_inputs=4)
+        key = batcher.key({"model": "m", "input": "a"})
+        self.assertEqual(key, batcher.key({"model": "m", "input": ["b", "c"]}))
+        self.assertNotEqual(key, batcher.key({"model": "n", "input": "a"}))
+        self.assertNotEqual(key, batcher.key({"model": "m", "input": "a", "truncate": False}))
+        self.assertIsNone(batcher.key({"model": "m", "input": ["a"] * 4}))  # already a batch
+        self.assertIsNone(batcher.key({"model": "m", "input": [1, 2]}))
+        self.assertIsNone(EmbedBatcher().key({"model": "m", "input": "a"}))  # disabled
+
+    def test_failed_batch_returns_none(self):
+        batcher = EmbedBatcher(enabled=True, window=0.01)
+        p = {"model": "m", "input": "a"}
+
+        async def main():
+            return await batcher.submit(batcher.key(p), p, self._sender([], status=500))
+
+        self.assertIsNone(asyncio.run(main()))
+        self.assertEqual(batcher.stats()["failed_batches"], 1)
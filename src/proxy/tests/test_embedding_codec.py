@@ -0,0 +1,44 @@
+import base64
+
+from django.test import SimpleTestCase
+
+from proxy.utils.embedding_codec import base64_vectors, negotiate, pack_vectors, unpack_vectors
+
+
+class EmbeddingCodecTests(SimpleTestCase):
+    """Tests for the packed binary form of embedding vectors."""
+
+    vectors = [[0.5, -1.0, 2.0], [0.25, 0.0, 8.0]]
+
+    def test_float32_round_trip_is_little_endian(self):
+        data, shape = pack_vectors(self.vectors)
+        self.assertEqual(shape, (2, 3))
+        self.assertEqual(len(data), 24)
+        self.assertEqual(data[:4], b"\x00\x00\x00?")  # 0.5
+        self.assertEqual(unpack_vectors(data, shape), self.vectors)
+
+    def test_float16_halves_the_payload(self):
+        data, shape = pack_vectors(self.vectors, "float16")
+        self.assertEqual(len(data), 12)
+        self.assertEqual(unpack_vectors(data, shape, "float16"), self.vectors)
+
+    def test_base64_carries_shape_and_dtype(self):
+        encoded = base64_vectors(self.vectors, "float32")
+        self.assertEqual((encoded["encoding"], encoded["dtype"], encoded["shape"]), ("base64", "float32", [2, 3]))
+        self.assertEqual(unpack_vectors(base64.b64decode(encoded["data"]), (2, 3)), self.vectors)
+
+    def test_ragged_or_non_numeric_vectors_are_rejected(self):
+        with self.assertRaises(ValueError):
+            pack_vectors([[1.0], [1.0, 2.0]])
+        with self.assertRaises(ValueError):
+            pack_vectors([["a"]])
+
+    def test_negotiate(self):
+        self.assertIsNone(negotiate(None, None, "application/json"))
+        self.assertEqual(negotiate(None, None, "application/octet-stream"), ("binary", "float32"))
+        self.assertEqual(negotiate("base64", "float16", ""), ("base64", "float16"))
+        self.assertIsNone(negotiate("json", None, "application/octet-stream"))
+        with self.assertRaises(ValueError):
+            negotiate("msgpack", None, "")
+        with self.assertRaises(ValueError):
+            negotiate("binary", "float64", "")
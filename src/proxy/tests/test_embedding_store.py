@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from proxy.utils.embedding_store import MAGIC, RECORD, EmbeddingStore
+
+
+class EmbeddingStoreTests(SimpleTestCase):
+    """Tests for the memory-mapped embedding store shared by workers."""
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "embeddings.bin")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_vectors_written_by_one_worker_are_read_by_another(self):
+        writer, reader = EmbeddingStore(self.path), EmbeddingStore(self.path)
+        keys = [EmbeddingStore.key("sha256:a", "", text) for text in ("x", "y")]
+        self.assertEqual(reader.get_many(keys), [None, None])
+        writer.put_many([(keys[0], [0.5, -1.0, 2.0])])
+        self.assertEqual(reader.get_many(keys), [(0.5, -1.0, 2.0), None])
+        self.assertEqual(reader.stats()["hits"], 1)
+
+    def test_key_depends_on_digest_and_scope(self):
+        key = EmbeddingStore.key("sha256:a", "", "x")
+        self.assertNotEqual(key, EmbeddingStore.key("sha256:b", "", "x"))
+        self.assertNotEqual(key, EmbeddingStore.key("sha256:a", '{"truncate":false}', "x"))
+
+    def test_float16_halves_the_record(self):
+        store = EmbeddingStore(self.path, dtype="float16")
+        key = EmbeddingStore.key("d", "", "x")
+        store.put_many([(key, [0.25, 1.5])])
+        self.assertEqual(store.get_many([key]), [(0.25, 1.5)])
+        self.assertEqual(os.path.getsize(self.path), len(MAGIC) + RECORD.size + 4)
+
+    def test_write_racing_a_compaction_lands_in_the_new_file(self):
+        store = EmbeddingStore(self.path)
+        key = EmbeddingStore.key("d", "", "x")
+        refresh, replaced = store._refresh, []
+
+        def _refresh_then_compact_elsewhere():
+            refresh()
+            if not replaced:
+                # another worker replaces the file before we take the write lock
+                tmp = self.path + ".other"
+                with open(tmp, "wb") as f:
+                    f.write(MAGIC)
+                os.replace(tmp, self.path)
+                replaced.append(True)
+
+        store._refresh = _refresh_then_compact_elsewhere
+        store.put_many([(key, [1.0])])
+        self.assertEqual(EmbeddingStore(self.path).get_many([key]), [(1.0,)])
+
+    def test_compaction_keeps_the_newest_vectors(self):
+        store = EmbeddingStore(self.path, max_bytes=4096, compact_ratio=0.5)
+        other = EmbeddingStore(self.path)
+        keys = [EmbeddingStore.key("d", "", str(i)) for i in range(20)]
+        for key in keys:
+            store.put_many([(key, [1.0] * 64)])  # 280 bytes per record
+        self.assertEqual(store.stats()["compactions"], 1)
+        self.assertLessEqual(os.path.getsize(self.path), 4096)
+        found = other.get_many(keys)
+        self.assertIsNone(found[0])
+        self.assertIsNotNone(found[-1])
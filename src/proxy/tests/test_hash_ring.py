@@ -0,0 +1,27 @@
+from django.test import SimpleTestCase
+
+from proxy.utils.hash_ring import HashRing
+
+
+class HashRingTests(SimpleTestCase):
+    """Tests for the consistent-hash ring used by prefix affinity routing."""
+
+    nodes = [f"http://192.168.0.{i}:11434" for i in range(10, 15)]
+
+    def test_walk_yields_each_node_once(self):
+        ring = HashRing(self.nodes)
+        order = list(ring.walk("conversation-1"))
+        self.assertEqual(sorted(order), sorted(self.nodes))
+        self.assertEqual(order[0], ring.get("conversation-1"))
+        self.assertEqual(list(HashRing([]).walk("x")), [])
+
+    def test_removing_a_node_only_moves_its_keys(self):
+        keys = [f"conversation-{i}" for i in range(500)]
+        full = HashRing(self.nodes)
+        reduced = HashRing(self.nodes[1:])
+        before = {k: full.get(k) for k in keys}
+        for k in keys:
+            if before[k] != self.nodes[0]:
+                self.assertEqual(reduced.get(k), before[k])
+        # every node owns a share of the keys
+        self.assertEqual(set(before.values()), set(self.nodes))
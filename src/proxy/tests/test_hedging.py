@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from proxy.utils.hedging import Hedger
+
+
+class HedgerTests(SimpleTestCase):
+    """Tests for the hedged request policy and budget."""
+
+    def test_applies_per_endpoint_and_model(self):
+        hedger = Hedger(endpoints=["embed"], models=["nomic-embed-text:latest"])
+        self.assertTrue(hedger.applies("embed", "nomic-embed-text:latest"))
+        self.assertFalse(hedger.applies("embed", "llama3:latest"))
+        self.assertFalse(hedger.applies("generate", "nomic-embed-text:latest"))
+        self.assertTrue(Hedger(endpoints=["embed"]).applies("embed", "llama3:latest"))
+        self.assertFalse(Hedger().applies("embed", "llama3:latest"))
+
+    def test_delay_follows_recent_response_times(self):
+        hedger = Hedger(endpoints=["embed"], default_delay=1.0, min_samples=5)
+        self.assertEqual(hedger.delay("embed", "m"), 1.0)
+        for latency in [0.1] * 18 + [0.5, 0.5]:
+            hedger.observe("embed", "m", latency)
+        # p95 of twenty samples lands on the slow tail (bucket midpoint)
+        self.assertAlmostEqual(hedger.delay("embed", "m"), 0.5, delta=0.05)
+        self.assertEqual(hedger.delay("embed", "other"), 1.0)
+
+    def test_delay_after_a_long_idle_period(self):
+        hedger = Hedger(endpoints=["embed"], default_delay=1.0, min_samples=5, half_life=60.0)
+        with patch("proxy.utils.traffic_stats.time.monotonic", return_value=1000.0):
+            for _ in range(10):
+                hedger.observe("embed", "m", 0.1)
+        # 1100 half-lives later the samples have faded: back to the default delay
+        with patch("proxy.utils.traffic_stats.time.monotonic", return_value=1000.0 + 1100 * 60.0):
+            self.assertEqual(hedger.delay("embed", "m"), 1.0)
+            hedger.observe("embed", "m", 0.1)
+
+    def test_budget_limits_hedge_rate(self):
+        hedger = Hedger(endpoints=["embed"], budget=0.1)
+        hedged = 0
+        for _ in range(100):
+            hedger.started("embed")
+            hedged += hedger.try_hedge("embed")
+        self.assertEqual(hedged, 10)
+        stats = hedger.stats()["by_endpoint"]["embed"]
+        self.assertEqual((stats["requests"], stats["hedged"]), (100, 10))
+        self.assertAlmostEqual(stats["hedge_rate"], 0.1)
+
+        # a hedge that found no free node gives its token back
+        hedger.refund()
+        self.assertTrue(hedger.try_hedge("embed"))
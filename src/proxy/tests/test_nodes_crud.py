@@ -117,3 +117,17 @@ class NodeCRUDTests(TestCase):
         
         inactive_nodes = NodeModel.objects.filter(active=False)
         self.assertEqual(inactive_nodes.count(), 1)
+
+    def test_node_serializer_capacity_fields(self):
+        """Test NodeSerializer exposes and validates weight / max_concurrency."""
+        from proxy.serializers import NodeSerializer
+
+        data = NodeSerializer(NodeModel.objects.create(name="gpu", address="g", port=1)).data
+        self.assertEqual(data["weight"], 1.0)
+        self.assertIsNone(data["max_concurrency"])
+
+        ok = NodeSerializer(data={"name": "big", "address": "b", "port": 2, "weight": 8, "max_concurrency": 16})
+        self.assertTrue(ok.is_valid(), ok.errors)
+        bad = NodeSerializer(data={"name": "bad", "address": "b", "port": 2, "weight": 0, "max_concurrency": 0})
+        self.assertFalse(bad.is_valid())
+        self.assertEqual(set(bad.errors), {"weight", "max_concurrency"})
@@ -0,0 +1,59 @@
+import time
+
+from django.test import SimpleTestCase
+
+from proxy.utils.outliers import OutlierDetector
+from proxy.utils.traffic_stats import TrafficStats
+
+
+class OutlierDetectorTests(SimpleTestCase):
+    """Tests for the ejection of nodes much slower than the fleet median."""
+
+    nodes = [f"http://192.168.0.{i}:11434" for i in range(10, 14)]
+
+    def _traffic(self, tps_by_node, ttfb=0.2):
+        traffic = TrafficStats()
+        for addr, tps in tps_by_node.items():
+            for _ in range(5):
+                traffic.record(addr, "llama3:latest", 5.0, ttfb=ttfb,
+                               final={"eval_count": 100, "eval_duration": int(100 / tps * 1e9)})
+        return traffic
+
+    def test_slow_node_is_ejected_then_returns(self):
+        a, b, c, d = self.nodes
+        traffic = self._traffic({a: 40.0, b: 42.0, c: 38.0, d: 15.0})
+        detector = OutlierDetector(base_ejection=30.0)
+        now = time.time()
+        self.assertEqual(detector.evaluate(traffic.stats(), 4, now=now), [])
+        self.assertEqual(detector.ejected(now=now), [d])
+        self.assertEqual(detector.filter([a, d]), [a])
+        self.assertEqual(detector.filter([d]), [d])  # never leaves a model without nodes
+        ejection = detector.stats()["ejected"][d]
+        self.assertEqual((ejection["reason"], ejection["model"], ejection["ejections"]),
+                         ("throughput", "llama3:latest", 1))
+
+        # the ejection ends: the node is handed back for its stats to be reset
+        self.assertEqual(detector.evaluate(traffic.stats(), 4, now=now + 31), [d])
+        self.assertEqual(detector.ejected(now=now + 31), [])
+
+    def test_latency_outlier_and_ejection_cap(self):
+        a, b, c, d = self.nodes
+        traffic = self._traffic({a: 40.0, b: 40.0, c: 40.0})
+        for _ in range(5):
+            traffic.record(d, "llama3:latest", 5.0, ttfb=1.5)
+        # one third of four nodes: only the worst offender goes
+        detector = OutlierDetector(factor=1.5, max_ejected_fraction=0.34)
+        stats = traffic.stats()
+        stats[c]["llama3:latest"]["ttfb"] = 0.7
+        detector.evaluate(stats, 4)
+        self.assertEqual(detector.ejected(), [d])
+        self.assertEqual(detector.stats()["ejected"][d]["reason"], "latency")
+
+    def test_needs_enough_hosts_and_samples(self):
+        a, b, c, _ = self.nodes
+        detector = OutlierDetector(min_hosts=3)
+        detector.evaluate(self._traffic({a: 40.0, b: 10.0}).stats(), 2)
+        self.assertEqual(detector.ejected(), [])
+        detector = OutlierDetector(min_samples=10)
+        detector.evaluate(self._traffic({a: 40.0, b: 40.0, c: 10.0}).stats(), 3)
+        self.assertEqual(detector.ejected(), [])
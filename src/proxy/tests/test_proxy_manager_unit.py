@@ -1,13 +1,49 @@
 from django.test import TestCase
 from django.core.cache import cache
 
+import asyncio
+import json
 import sys
+import time
 import types
+from unittest.mock import patch
 
-from proxy.utils.proxy_manager import HAProxyManager
+from proxy.utils.async_redis import AsyncRedisClients
+from proxy.utils.proxy_manager import HAProxyManager, build_model_index, build_tags_payload, normalize_model_name
 from proxy.models import node as NodeModel
 
 
+def _set_inflight(addr: str, count: int) -> None:
+    """Hold `count` live leases on `addr` where the routing code counts them.
+
+    With Redis the in-flight count is derived from the node's lease set and
+    stored under a raw (unprefixed) key; the cache API is only the fallback.
+    """
+    count_key = HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + addr
+    try:
+        from django_redis import get_redis_connection
+        conn = get_redis_connection('default')
+        lease_key = HAProxyManager.LEASE_KEY_PREFIX + addr
+        conn.delete(lease_key)
+        if count:
+            expiry = time.time() + 60
+            conn.zadd(lease_key, {f"test-worker:{i}": expiry for i in range(count)})
+        conn.set(count_key, count)
+    except Exception:
+        cache.set(count_key, count)
+
+
+def _inflight(addr: str) -> int:
+    """In-flight count of `addr` as the routing code reads it."""
+    count_key = HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + addr
+    try:
+        from django_redis import get_redis_connection
+        value = get_redis_connection('default').get(count_key)
+    except Exception:
+        value = cache.get(count_key)
+    return int(value or 0)
+
+
 class HAProxyManagerUnitTests(TestCase):
     def setUp(self):
         cache.clear()
@@ -146,3 +182,498 @@ class HAProxyManagerUnitTests(TestCase):
             del sys.modules['django_redis']
         else:
             sys.modules['django_redis'] = orig
+
+    def test_routing_snapshot_rebuilt_only_on_version_change(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        mgr = HAProxyManager(nodes=[a])
+        mgr._is_leader = True
+
+        with self.settings(PROXY_ROUTING_SNAPSHOT_TTL=0):
+            mgr.publish_strategy("lowest_latency")
+            snap = mgr.routing_snapshot()
+            self.assertEqual(snap["active"], [a])
+            self.assertEqual(snap["strategy"], "lowest_latency")
+
+            # a pool change without a version bump is not picked up
+            cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+            self.assertIs(mgr.routing_snapshot(), snap)
+
+            # another worker bumping the version invalidates the snapshot
+            other = HAProxyManager(nodes=[a, b])
+            other._bump_routing_version()
+            self.assertEqual(mgr.routing_snapshot()["active"], [a, b])
+
+    def test_digest_change_invalidates_cached_responses(self):
+        a = "http://192.168.0.10:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        mgr = HAProxyManager(nodes=[a])
+        mgr._is_leader = True
+        mgr.response_cache.redis = False
+        ok = (200, "application/json", b"{}")
+
+        with self.settings(PROXY_ROUTING_SNAPSHOT_TTL=0):
+            mgr._publish_model_digests({"llama3:latest": {"sha256:a"}})
+            mgr._bump_routing_version()
+            self.assertEqual(mgr.model_digest("Llama3"), "sha256:a")
+            asyncio.run(mgr.response_cache.put("sha256:a", "k", "llama3:latest", ok))
+
+            # the model was re-pulled on one node
+            mgr._publish_model_digests({"llama3:latest": {"sha256:a", "sha256:b"}})
+            mgr._bump_routing_version()
+            self.assertEqual(mgr.model_digest("llama3"), "sha256:a,sha256:b")
+            self.assertEqual(mgr.response_cache.stats()["entries"], 0)
+            self.assertEqual(mgr.runtime_stats()["response_cache"]["invalidations"], 1)
+
+    def test_build_tags_payload_keeps_newest_entry_per_name(self):
+        old = {"name": "llama3:latest", "modified_at": "2025-01-01T00:00:00Z", "digest": "a"}
+        new = {"name": "llama3:latest", "modified_at": "2025-06-01T00:00:00Z", "digest": "b"}
+        other = {"name": "gemma3:1b", "modified_at": "2025-02-01T00:00:00Z"}
+        etag, body = build_tags_payload({"n1": [old, other], "n2": [new], "n3": []})
+        self.assertEqual(json.loads(body), {"models": [other, new]})
+        # same models from differently ordered nodes: same etag
+        self.assertEqual(build_tags_payload({"n2": [new], "n1": [other, old]})[0], etag)
+        self.assertNotEqual(build_tags_payload({"n1": [old, other]})[0], etag)
+
+    def test_published_tags_reach_workers_through_the_snapshot(self):
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [])
+        leader = HAProxyManager(nodes=["http://192.168.0.10:11434"])
+        worker = HAProxyManager(nodes=["http://192.168.0.10:11434"])
+        tags = build_tags_payload({"n1": [{"name": "llama3:latest"}]})
+
+        with self.settings(PROXY_ROUTING_SNAPSHOT_TTL=0):
+            self.assertIsNone(worker.tags_payload())
+            leader.publish_tags(tags)
+            self.assertEqual(worker.tags_payload(), tags)
+            # a worker serving from the event loop fetches the new body off the loop
+            self.assertEqual(asyncio.run(HAProxyManager(nodes=[]).atags_payload()), tags)
+            leader.publish_tags(None)
+            self.assertIsNone(worker.tags_payload())
+
+    def test_choose_node_uses_published_strategy(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + a, 0.3)
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + b, 0.1)
+        mgr = HAProxyManager(nodes=[a, b])
+        mgr._is_leader = True
+        mgr.publish_strategy("lowest_latency")
+
+        self.assertEqual(mgr.choose_node(), b)
+
+    def test_model_index_resolves_implicit_latest_tag(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, build_model_index({
+            a: ["llama3:latest"],
+            b: ["gemma3:270m-it-qat", "registry.local:5000/team/qwen3"],
+        }))
+        mgr = HAProxyManager(nodes=[a, b])
+        mgr._is_leader = True
+
+        self.assertEqual(mgr.choose_node(model_name="llama3", strategy="lowest_latency"), a)
+        self.assertEqual(mgr.choose_node(model_name="Gemma3:270m-it-qat", strategy="lowest_latency"), b)
+        self.assertEqual(mgr.choose_node(model_name="registry.local:5000/team/qwen3:latest", strategy="lowest_latency"), b)
+        self.assertIsNone(mgr.choose_node(model_name="mistral", strategy="lowest_latency"))
+
+    def test_normalize_model_name(self):
+        self.assertEqual(normalize_model_name("llama3"), "llama3:latest")
+        self.assertEqual(normalize_model_name(" llama3:8B "), "llama3:8b")
+        self.assertEqual(normalize_model_name("host:5000/ns/model"), "host:5000/ns/model:latest")
+
+    def test_least_active_uses_preloaded_route_script(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, build_model_index({a: ["llama3:latest"], b: ["llama3:latest"]}))
+        calls = {"register": 0, "load": 0, "run": []}
+
+        class FakeScript:
+            def __call__(self, keys=None, args=None, client=None):
+                calls["run"].append((list(keys), list(args)))
+                return [b.encode(), 1]
+
+        class FakeConn3:
+            def register_script(self, script):
+                calls["register"] += 1
+                return FakeScript()
+
+            def script_load(self, script):
+                calls["load"] += 1
+
+        fake_mod3 = types.ModuleType('django_redis')
+        fake_mod3.get_redis_connection = lambda name='default': FakeConn3()
+        orig = sys.modules.get('django_redis')
+        sys.modules['django_redis'] = fake_mod3
+        try:
+            mgr = HAProxyManager(nodes=[a, b])
+            self.assertEqual(mgr.choose_node(model_name="llama3", strategy="least_active"), b)
+            self.assertEqual(mgr.acquire_node("least_active"), b)
+            # unknown model: rejected from the snapshot without a Redis round-trip
+            self.assertIsNone(mgr.choose_node(model_name="mistral", strategy="least_active"))
+
+            self.assertEqual(calls["register"], 1)
+            self.assertEqual(calls["load"], 1)
+            self.assertEqual([keys for keys, _ in calls["run"]], [
+                [HAProxyManager.ROUTE_ACTIVE_SET_KEY, HAProxyManager.ROUTE_WEIGHT_KEY, HAProxyManager.ROUTE_CAP_KEY,
+                 HAProxyManager.ROUTE_MODEL_SET_PREFIX + "llama3:latest"],
+                [HAProxyManager.ROUTE_ACTIVE_SET_KEY, HAProxyManager.ROUTE_WEIGHT_KEY, HAProxyManager.ROUTE_CAP_KEY],
+            ])
+            for _, args in calls["run"]:
+                self.assertEqual(args[:3], [HAProxyManager.ACTIVE_COUNT_KEY_PREFIX, 0, HAProxyManager.LEASE_KEY_PREFIX])
+                self.assertTrue(args[3].startswith(mgr._lease_owner + ":"))
+                self.assertGreater(args[4], time.time())
+            # each pick holds its own lease on the chosen node
+            self.assertEqual(mgr.held_leases(), {b: 2})
+            self.assertNotEqual(calls["run"][0][1][3], calls["run"][1][1][3])
+        finally:
+            del sys.modules['django_redis']
+            if orig is not None:
+                sys.modules['django_redis'] = orig
+
+    def test_p2c_picks_lower_inflight_latency_score(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + a, 0.1)
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + b, 0.2)
+        store = {
+            HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + a: 3,
+            HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + b: 0,
+        }
+
+        class FakeLeaseScript:
+            def __call__(self, keys=None, args=None, client=None):
+                # LEASE_ACQUIRE_SCRIPT: KEYS = [lease key, count key]
+                store[keys[1]] = store.get(keys[1], 0) + 1
+                return store[keys[1]]
+
+        class FakeConn4:
+            def mget(self, keys):
+                return [store.get(k) for k in keys]
+
+            def register_script(self, script):
+                return FakeLeaseScript()
+
+            def script_load(self, script):
+                pass
+
+        fake_mod4 = types.ModuleType('django_redis')
+        fake_mod4.get_redis_connection = lambda name='default': FakeConn4()
+        orig = sys.modules.get('django_redis')
+        sys.modules['django_redis'] = fake_mod4
+        try:
+            mgr = HAProxyManager(nodes=[a, b])
+            # a: (3 + 1) * 0.1 = 0.4, b: (0 + 1) * 0.2 = 0.2
+            self.assertEqual(mgr.choose_node(strategy="p2c"), b)
+            self.assertEqual(store[HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + b], 1)
+            # b: (1 + 1) * 0.2 = 0.4 ties a; the first sampled node keeps the tie
+            self.assertIn(mgr.acquire_node("p2c"), (a, b))
+        finally:
+            del sys.modules['django_redis']
+            if orig is not None:
+                sys.modules['django_redis'] = orig
+
+    def test_warm_model_prefers_resident_then_free_vram(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, build_model_index({
+            a: ["llama3:70b", "gemma3:4b"],
+            b: ["llama3:70b", "gemma3:4b"],
+        }))
+        cache.set(HAProxyManager.RUNNING_KEY_PREFIX + a, {"llama3:70b": 40_000_000_000})
+        cache.set(HAProxyManager.RUNNING_KEY_PREFIX + b, {})
+        _set_inflight(a, 5)
+        mgr = HAProxyManager(nodes=[a, b])
+        mgr._is_leader = True
+
+        # resident on a: chosen despite more in-flight requests
+        self.assertEqual(mgr.choose_node(model_name="llama3:70b", strategy="warm_model"), a)
+        self.assertEqual(_inflight(a), 6)
+        # cold everywhere: the node with the least VRAM in use
+        self.assertEqual(mgr.choose_node(model_name="gemma3:4b", strategy="warm_model"), b)
+
+    def test_prefix_affinity_sticks_then_spills_over(self):
+        nodes = [f"http://192.168.0.{i}:11434" for i in range(10, 14)]
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, nodes)
+        mgr = HAProxyManager(nodes=nodes)
+        mgr._is_leader = True
+
+        first = mgr.choose_node(strategy="prefix_affinity", affinity_key="llama3\x1fsystem:be brief")
+        mgr.release_node(first)
+        self.assertEqual(mgr.choose_node(strategy="prefix_affinity", affinity_key="llama3\x1fsystem:be brief"), first)
+
+        # preferred node saturated relative to the mean: spill to the next ring node
+        _set_inflight(first, 10)
+        second = mgr.choose_node(strategy="prefix_affinity", affinity_key="llama3\x1fsystem:be brief")
+        self.assertNotEqual(second, first)
+        self.assertEqual(second, list(mgr.routing_snapshot()["ring"].walk("llama3\x1fsystem:be brief"))[1])
+
+    def test_least_active_normalizes_by_weight(self):
+        small = "http://192.168.0.10:11434"
+        big = "http://192.168.0.11:11434"
+        NodeModel.objects.create(name="laptop", address="192.168.0.10", port=11434, active=True)
+        NodeModel.objects.create(name="server", address="192.168.0.11", port=11434, active=True,
+                                 weight=4.0, max_concurrency=32)
+        mgr = HAProxyManager(nodes=[small, big])
+        mgr._is_leader = True
+        mgr.refresh_from_db()
+        self.assertEqual(cache.get(HAProxyManager.NODE_META_KEY)[big], {"weight": 4.0, "max_concurrency": 32})
+
+        picks = [mgr.choose_node(strategy="least_active") for _ in range(10)]
+        self.assertEqual(picks.count(big), 8)
+        self.assertEqual(picks.count(small), 2)
+
+    def test_expected_time_routes_on_measured_traffic(self):
+        fast = "http://192.168.0.10:11434"
+        slow = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [fast, slow])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, {"llama3:latest": [fast, slow]})
+        mgr = HAProxyManager(nodes=[fast, slow])
+        mgr._is_leader = True
+        # health-check pings say the opposite of real generation speed
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + fast, 0.9)
+        cache.set(HAProxyManager.LATENCY_KEY_PREFIX + slow, 0.01)
+
+        # released requests feed the traffic statistics
+        for addr, eval_ns in ((fast, 1_000_000_000), (slow, 4_000_000_000)):
+            mgr.release_node(addr, latency=eval_ns / 1e9, model="llama3", ttfb=0.1,
+                             final={"eval_count": 100, "eval_duration": eval_ns})
+        self.assertEqual(mgr.traffic_stats(fast)["llama3:latest"]["tokens_per_second"], 100.0)
+
+        self.assertEqual(mgr.choose_node(model_name="llama3", strategy="expected_time"), fast)
+        # a busy fast node yields once its queue outweighs the speed difference
+        _set_inflight(fast, 4)
+        self.assertEqual(mgr.choose_node(model_name="llama3", strategy="expected_time"), slow)
+
+    def test_lowest_ttft_probes_node_with_faded_samples(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, {"llama3:latest": [a, b]})
+        mgr = HAProxyManager(nodes=[a, b])
+        mgr._is_leader = True
+        mgr.traffic.record(a, "llama3:latest", 3.0, ttfb=0.2)
+        mgr.traffic.record(b, "llama3:latest", 9.0, ttfb=4.0)
+        self.assertEqual(mgr.choose_node(model_name="llama3", strategy="lowest_ttft"), a)
+        mgr.release_node(a)
+
+        # b's slow samples fade out: it is probed again like the fastest node
+        sketch = mgr.traffic._stats[(b, "llama3:latest")].ttft
+        sketch._t0 -= 10 * sketch.half_life
+        self.assertIsNone(mgr.traffic.ttft(b, "llama3:latest"))
+        _set_inflight(a, 1)
+        self.assertEqual(mgr.choose_node(model_name="llama3", strategy="lowest_ttft"), b)
+
+    def test_concurrency_cap_queues_until_release(self):
+        a = "http://192.168.0.10:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        cache.set(HAProxyManager.NODE_META_KEY, {a: {"weight": 1.0, "max_concurrency": 1}})
+        mgr = HAProxyManager(nodes=[a])
+        mgr._is_leader = True
+        mgr.admission.poll_interval = 5.0
+
+        self.assertEqual(mgr.choose_node(strategy="least_active"), a)
+        # at its cap: not chosen again, whatever the strategy
+        for strategy in ("least_active", "lowest_latency", "p2c"):
+            self.assertIsNone(mgr.choose_node(strategy=strategy))
+        self.assertEqual(_inflight(a), 1)
+
+        async def _run():
+            waiter = asyncio.ensure_future(mgr.achoose_node(strategy="least_active"))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiter.done())
+            mgr.release_node(a)
+            return await asyncio.wait_for(waiter, timeout=2.0)
+
+        self.assertEqual(asyncio.run(_run()), a)
+        self.assertEqual(mgr.runtime_stats()["admission"]["admitted"], 1)
+
+    def test_achoose_node_leases_on_the_async_redis_client(self):
+        a = "http://192.168.0.10:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        mgr = HAProxyManager(nodes=[a])
+        mgr._is_leader = True
+        if not mgr.aredis.enabled:
+            self.skipTest("the cache is not Redis-backed")
+        _set_inflight(a, 0)
+        mgr.routing_snapshot()
+
+        # neither the pick nor the release hops to a thread
+        with self.settings(PROXY_ROUTING_SNAPSHOT_TTL=60), \
+                patch("proxy.utils.proxy_manager.sync_to_async", side_effect=AssertionError("executor hop")):
+            for strategy in ("least_active", "p2c", "lowest_latency"):
+                chosen = asyncio.run(mgr.achoose_node(strategy=strategy))
+                self.assertEqual(chosen, a)
+                self.assertEqual(_inflight(a), 1)
+                self.assertEqual(mgr.held_leases(), {a: 1})
+                asyncio.run(mgr.arelease_node(a, latency=0.1, model="llama3"))
+                self.assertEqual(_inflight(a), 0)
+                self.assertEqual(mgr.held_leases(), {})
+
+    def test_arouting_snapshot_serves_the_cached_copy_while_refreshing(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        mgr = HAProxyManager(nodes=[a])
+        other = HAProxyManager(nodes=[a])
+
+        async def _run():
+            first = await mgr.arouting_snapshot()
+            cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+            other._bump_routing_version()
+            # the change is picked up in the background, not on the caller's time
+            stale = await mgr.arouting_snapshot()
+            await mgr._snapshot_refresh
+            return first, stale, await mgr.arouting_snapshot()
+
+        with self.settings(PROXY_ROUTING_SNAPSHOT_TTL=0):
+            first, stale, fresh = asyncio.run(_run())
+        self.assertIs(stale, first)
+        self.assertEqual(fresh["active"], [a, b])
+        self.assertEqual(asyncio.run(mgr.amodel_nodes()), [a, b])
+
+    def test_achoose_node_without_a_worker_snapshot(self):
+        a = "http://192.168.0.10:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        cache.set(HAProxyManager.MODEL_INDEX_KEY, {"llama3:latest": [a]})
+        mgr = HAProxyManager(nodes=[a])
+        # the pick failed before any snapshot was built
+        mgr.aredis = AsyncRedisClients()
+        mgr.choose_node = lambda **kwargs: None
+
+        async def _admit(try_choose):
+            return a
+        mgr.admission.wait_for_node = _admit
+
+        self.assertIsNone(mgr._snapshot)
+        self.assertEqual(asyncio.run(mgr.achoose_node(model_name="llama3", strategy="least_active")), a)
+        # no node serves the model: nothing to wait for
+        self.assertIsNone(asyncio.run(mgr.achoose_node(model_name="mistral", strategy="least_active")))
+
+    def test_leases_of_crashed_worker_expire(self):
+        a = "http://192.168.0.10:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a])
+        zsets, store = {}, {}
+
+        class FakeScript:
+            def __init__(self, source):
+                self.source = source
+
+            def __call__(self, keys=None, args=None, client=None):
+                leases = zsets.setdefault(keys[0], {})
+                if self.source == HAProxyManager.LEASE_ACQUIRE_SCRIPT:
+                    leases[args[0]] = args[1]
+                else:
+                    leases.pop(args[0], None)
+                    for lease, expiry in list(leases.items()):
+                        if expiry <= args[1]:
+                            del leases[lease]
+                store[keys[1]] = len(leases)
+                return store[keys[1]]
+
+        class FakeConn5:
+            def mget(self, keys):
+                return [store.get(k) for k in keys]
+
+            def register_script(self, script):
+                return FakeScript(script)
+
+            def script_load(self, script):
+                pass
+
+        fake_mod5 = types.ModuleType('django_redis')
+        fake_mod5.get_redis_connection = lambda name='default': FakeConn5()
+        orig = sys.modules.get('django_redis')
+        sys.modules['django_redis'] = fake_mod5
+        count_key = HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + a
+        lease_key = HAProxyManager.LEASE_KEY_PREFIX + a
+        try:
+            mgr = HAProxyManager(nodes=[a])
+            mgr._is_leader = True
+            self.assertEqual(mgr.choose_node(strategy="p2c"), a)
+            self.assertEqual(store[count_key], 1)
+            self.assertEqual(mgr.runtime_stats()["leases"], {a: 1})
+
+            # a worker that died mid-request leaves a lease that is never released
+            zsets[lease_key]["dead-worker:1"] = time.time() - 1
+            store[count_key] = 2
+            mgr.release_node(a)
+            self.assertEqual(store[count_key], 0)
+            self.assertEqual(zsets[lease_key], {})
+            self.assertEqual(mgr.held_leases(), {})
+
+            # the leader's reaper clears expired leases without any release
+            zsets[lease_key]["dead-worker:2"] = time.time() - 1
+            store[count_key] = 1
+            mgr.reap_leases()
+            self.assertEqual(store[count_key], 0)
+        finally:
+            asyncio.run(mgr.close())
+            del sys.modules['django_redis']
+            if orig is not None:
+                sys.modules['django_redis'] = orig
+
+    def test_open_circuit_is_skipped_until_probe_succeeds(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        fake_mod6 = types.ModuleType('django_redis')
+
+        def fake_conn_factory(*args, **kwargs):
+            raise Exception("force fallback")
+        fake_mod6.get_redis_connection = fake_conn_factory
+        orig = sys.modules.get('django_redis')
+        sys.modules['django_redis'] = fake_mod6
+        try:
+            mgr = HAProxyManager(nodes=[a, b])
+            mgr._is_leader = True
+            for _ in range(mgr.breaker.failure_threshold):
+                mgr.release_node(a, latency=0.1, ok=False)
+            self.assertEqual(mgr.runtime_stats()["circuits"]["nodes"][a]["state"], "open")
+            cache.set(HAProxyManager.ACTIVE_COUNT_KEY_PREFIX + b, 3)
+            for strategy in ("least_active", "lowest_latency", "p2c"):
+                self.assertEqual(mgr.choose_node(strategy=strategy), b)
+
+            # cooldown over: a single probe goes to the idle node
+            circuit = mgr.breaker._circuits[a]
+            circuit.opened_at -= circuit.cooldown
+            self.assertEqual(mgr.choose_node(strategy="least_active"), a)
+            self.assertEqual(mgr.choose_node(strategy="least_active"), b)
+            mgr.release_node(a, latency=0.1, ok=True)
+            self.assertEqual(mgr.breaker.state(a), "half_open")
+        finally:
+            del sys.modules['django_redis']
+            if orig is not None:
+                sys.modules['django_redis'] = orig
+
+    def test_slow_node_is_ejected_from_candidates(self):
+        nodes = [f"http://192.168.0.{i}:11434" for i in range(10, 14)]
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, nodes)
+        mgr = HAProxyManager(nodes=nodes)
+        mgr._is_leader = True
+        mgr.outliers.interval = 0
+        slow = nodes[3]
+        for addr, tps in zip(nodes, (40.0, 42.0, 38.0, 12.0)):
+            for _ in range(mgr.outliers.min_samples):
+                mgr.release_node(addr, latency=5.0, model="llama3", ttfb=0.2,
+                                 final={"eval_count": 100, "eval_duration": int(100 / tps * 1e9)})
+
+        self.assertEqual(list(mgr.runtime_stats()["outliers"]["ejected"]), [slow])
+        picks = {mgr.choose_node(strategy="lowest_latency") for _ in range(6)}
+        self.assertNotIn(slow, picks)
+
+    def test_choose_node_skips_excluded_nodes(self):
+        a = "http://192.168.0.10:11434"
+        b = "http://192.168.0.11:11434"
+        cache.set(HAProxyManager.ACTIVE_POOL_KEY, [a, b])
+        _set_inflight(b, 5)
+        mgr = HAProxyManager(nodes=[a, b])
+        mgr._is_leader = True
+        for strategy in ("least_active", "lowest_latency", "p2c"):
+            self.assertEqual(mgr.choose_node(strategy=strategy, exclude=[a]), b)
+        self.assertIsNone(mgr.choose_node(strategy="least_active", exclude=[a, b]))
@@ -0,0 +1,51 @@
+import asyncio
+
+from django.test import SimpleTestCase
+
+from proxy.utils.response_cache import ResponseCache
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Tests for the worker-local tier of the deterministic response cache."""
+
+    ok = (200, "application/json", b'{"embeddings": [[0.1]]}')
+
+    def test_hit_after_store_and_digest_in_key(self):
+        responses = ResponseCache(redis=False)
+        self.assertIsNone(asyncio.run(responses.get("sha256:a", "k", "m:latest")))
+        self.assertTrue(asyncio.run(responses.put("sha256:a", "k", "m:latest", self.ok)))
+        self.assertEqual(asyncio.run(responses.get("sha256:a", "k", "m:latest")), self.ok)
+        # a re-pulled model has a new digest and misses
+        self.assertIsNone(asyncio.run(responses.get("sha256:b", "k", "m:latest")))
+        stats = responses.stats()
+        self.assertEqual((stats["lru_hits"], stats["misses"]), (1, 2))
+        self.assertAlmostEqual(stats["hit_ratio"], 1 / 3)
+
+    def test_only_small_successful_responses_are_stored(self):
+        responses = ResponseCache(redis=False, max_entry_bytes=10)
+        self.assertFalse(asyncio.run(responses.put("d", "k", "m", (502, "application/json", b"{}"))))
+        self.assertFalse(asyncio.run(responses.put("d", "k", "m", self.ok)))
+        self.assertEqual(responses.stats()["entries"], 0)
+
+    def test_lru_bounds_and_expiry(self):
+        responses = ResponseCache(redis=False, max_entries=2)
+        for key in ("a", "b"):
+            asyncio.run(responses.put("d", key, "m", self.ok))
+        asyncio.run(responses.get("d", "a", "m"))  # refresh a: b is now least recently used
+        asyncio.run(responses.put("d", "c", "m", self.ok))
+        self.assertIsNone(asyncio.run(responses.get("d", "b", "m")))
+        self.assertIsNotNone(asyncio.run(responses.get("d", "a", "m")))
+
+        expiring = ResponseCache(redis=False, ttl=-1.0)
+        asyncio.run(expiring.put("d", "k", "m", self.ok))
+        self.assertIsNone(asyncio.run(expiring.get("d", "k", "m")))
+        self.assertEqual(expiring.stats()["bytes"], 0)
+
+    def test_digest_change_drops_the_models_entries(self):
+        responses = ResponseCache(redis=False)
+        responses.sync_digests({"m:latest": "sha256:a", "n:latest": "sha256:x"})
+        asyncio.run(responses.put("sha256:a", "k", "m:latest", self.ok))
+        asyncio.run(responses.put("sha256:x", "k", "n:latest", self.ok))
+        responses.sync_digests({"m:latest": "sha256:b", "n:latest": "sha256:x"})
+        self.assertEqual(responses.stats()["entries"], 1)
+        self.assertIsNotNone(asyncio.run(responses.get("sha256:x", "k", "n:latest")))
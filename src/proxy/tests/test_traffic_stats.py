@@ -0,0 +1,68 @@
+from django.test import SimpleTestCase
+
+from proxy.utils.traffic_stats import DecayingQuantiles, TrafficStats, parse_final_stats
+
+
+class TrafficStatsTests(SimpleTestCase):
+    """Tests for the EWMA response statistics behind the expected_time strategy."""
+
+    fast = "http://192.168.0.10:11434"
+    slow = "http://192.168.0.11:11434"
+
+    def test_parse_final_stats_from_truncated_tail(self):
+        # tail of a generate response: the head of `context` was cut off
+        tail = (b'{"model":"llama3:latest","response":"","done":false}\n'
+                b'{"model":"llama3:latest","done":true,"context":[1,2,3],"total_duration":5000000000,'
+                b'"load_duration":1000,"prompt_eval_count":12,"eval_count":100,"eval_duration":2000000000}\n')
+        stats = parse_final_stats(tail[-170:])
+        self.assertEqual(stats["eval_count"], 100)
+        self.assertEqual(stats["eval_duration"], 2000000000)
+        self.assertEqual(stats["total_duration"], 5000000000)
+        self.assertEqual(parse_final_stats(b'{"embeddings":[[0.1]]}'), {})
+
+    def test_expected_time_uses_model_output_length_and_node_speed(self):
+        traffic = TrafficStats(alpha=0.5)
+        self.assertIsNone(traffic.expected_time(self.fast, "llama3:latest"))
+        # the fast node only saw short answers, the slow node long ones
+        traffic.record(self.fast, "llama3:latest", 1.0, ttfb=0.2, final={"eval_count": 50, "eval_duration": 500_000_000})
+        traffic.record(self.slow, "llama3:latest", 8.0, ttfb=0.4, final={"eval_count": 250, "eval_duration": 5_000_000_000})
+        # both are judged on the model's typical output length (EWMA: 150 tokens)
+        self.assertAlmostEqual(traffic.expected_time(self.fast, "llama3:latest"), 0.2 + 150 / 100)
+        self.assertAlmostEqual(traffic.expected_time(self.slow, "llama3:latest"), 0.4 + 150 / 50)
+        # without generation counts (embeddings) the mean duration is used
+        traffic.record(self.fast, "nomic-embed-text:latest", 0.3)
+        self.assertAlmostEqual(traffic.expected_time(self.fast, "nomic-embed-text:latest"), 0.3)
+        self.assertEqual(set(traffic.node_stats(self.fast)), {"llama3:latest", "nomic-embed-text:latest"})
+        self.assertEqual(traffic.stats()[self.slow]["llama3:latest"]["samples"], 1)
+
+    def test_ttft_sketch_percentiles_and_decay(self):
+        sketch = DecayingQuantiles(half_life=10.0)
+        now = sketch._t0
+        for i in range(100):
+            sketch.add(0.1 if i < 90 else 2.0, now=now)
+        self.assertAlmostEqual(sketch.quantile(0.5), 0.1, delta=0.01)
+        self.assertAlmostEqual(sketch.quantile(0.95), 2.0, delta=0.15)
+        self.assertAlmostEqual(sketch.weight(now=now + 10.0), 50.0)
+        # fresh slow samples outweigh the decayed fast ones
+        for _ in range(10):
+            sketch.add(1.0, now=now + 60.0)
+        self.assertAlmostEqual(sketch.quantile(0.5), 1.0, delta=0.07)
+
+    def test_sketch_survives_a_long_idle_period(self):
+        sketch = DecayingQuantiles(half_life=60.0)
+        now = sketch._t0
+        sketch.add(0.2, now=now)
+        later = now + 1100 * 60.0
+        # the old sample has faded out without overflowing the decay scale
+        self.assertEqual(sketch.weight(now=later), 0.0)
+        self.assertIsNone(sketch.quantile(0.5, now=later))
+        sketch.add(0.5, now=later)
+        self.assertAlmostEqual(sketch.weight(now=later), 1.0)
+        self.assertAlmostEqual(sketch.quantile(0.5, now=later), 0.5, delta=0.04)
+
+    def test_ttft_only_from_streamed_responses(self):
+        traffic = TrafficStats()
+        traffic.record(self.fast, "llama3:latest", 2.0)
+        self.assertIsNone(traffic.ttft(self.fast, "llama3:latest"))
+        traffic.record(self.fast, "llama3:latest", 2.0, ttfb=0.3)
+        self.assertAlmostEqual(traffic.ttft(self.fast, "llama3:latest")["p95"], 0.3, delta=0.03)
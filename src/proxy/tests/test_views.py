@@ -81,6 +81,8 @@ class ProxyViewsTests(TestCase):
         self.mock_mgr.ACTIVE_COUNT_KEY_PREFIX = "ha_active_count:"
         self.mock_mgr._active_count_key = lambda addr: f"ha_active_count:{addr}"
         self.mock_mgr.refresh_from_db = MagicMock()
+        self.mock_mgr.runtime_stats = MagicMock(return_value={"pools": {}})
+        self.mock_mgr.traffic_stats = MagicMock(return_value={})
         
         mock_get_mgr.return_value = self.mock_mgr
         
@@ -125,6 +127,7 @@ class ProxyViewsTests(TestCase):
         self.assertIn("active", data)
         self.assertIn("standby", data)
         self.assertIn("http://ollama:11434", data["active"])
+        self.assertEqual(data["runtime"], {"pools": {}})
 
     def test_active_requests_endpoint(self):
         """Test /api/proxy/active-requests returns node info."""
@@ -139,6 +142,7 @@ class ProxyViewsTests(TestCase):
         self.assertIn("total_active_requests", data)
         self.assertEqual(len(data["nodes"]), 1)
         self.assertEqual(data["nodes"][0]["name"], "CPU")
+        self.assertEqual(data["nodes"][0]["traffic"], {})
 
     def test_active_requests_filter_by_node_id(self):
         """Test /api/proxy/active-requests?node_id=X filters correctly."""
@@ -183,6 +187,16 @@ class ProxyViewsTests(TestCase):
         cfg = ProxyConfig.objects.first()
         self.assertEqual(cfg.strategy, "lowest_latency")
 
+    def test_proxy_config_accepts_p2c(self):
+        """Test PUT /api/proxy/config accepts the power-of-two-choices strategy."""
+        test_pw = get_random_string(12)
+        user = User.objects.create_user(username='testuser', password=test_pw)
+        self.client.force_authenticate(user=user)
+
+        response = self.client.put('/api/proxy/config', {'strategy': 'p2c'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ProxyConfig.objects.first().strategy, "p2c")
+
     def test_pull_model_to_cpu_node_real(self):
         """Test /api/proxy/pull actually pulls gemma3:270m-it-qat to CPU node (REAL HTTP REQUEST)."""
         # This test makes a real HTTP request to ollama container
@@ -1,7 +1,8 @@
 from django.test import TestCase
 from rest_framework.test import APIClient
 from django.core.cache import cache
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+import json
 import logging
 
 # Module-level mock manager to prevent Redis/leader blocking during imports
@@ -19,6 +20,39 @@ _mock_manager._active_count_key = lambda addr: f"ha_active_count:{addr}"
 pm_module._global_manager = _mock_manager
 
 from proxy.models import node as NodeModel
+from proxy.utils.client_pool import UpstreamClientPool
+from proxy.utils.coalescing import SingleFlight
+from proxy.utils.embed_batcher import EmbedBatcher
+from proxy.utils.embedding_store import EmbeddingStore
+from proxy.utils.hedging import Hedger
+from proxy.utils.response_cache import ResponseCache
+
+
+class FakeUpstream:
+	"""Stand-in for `mgr.get_client`: every node answers through `answer`.
+
+	`answer(addr, payload)` is a coroutine function that gets the node and
+	the decoded JSON body of a POST and returns an `httpx.Response` (or
+	raises). Posts are recorded in `posted` as (addr, payload).
+	"""
+
+	def __init__(self, answer):
+		self.answer = answer
+		self.posted = []
+
+	def __call__(self, addr):
+		return _FakeClient(self, addr)
+
+
+class _FakeClient:
+	def __init__(self, upstream, addr):
+		self.upstream = upstream
+		self.addr = addr
+
+	async def post(self, url, content=None, **kwargs):
+		payload = json.loads(content)
+		self.upstream.posted.append((self.addr, payload))
+		return await self.upstream.answer(self.addr, payload)
 
 
 class ViewsProxyTests(TestCase):
@@ -66,6 +100,17 @@ class ViewsProxyTests(TestCase):
 		self.mgr.MODELS_KEY_PREFIX = _mock_manager.MODELS_KEY_PREFIX
 		self.mgr._active_count_key = _mock_manager._active_count_key
 		self.mgr.choose_node = MagicMock(return_value="http://ollama:11434")
+		self.mgr.achoose_node = AsyncMock(return_value="http://ollama:11434")
+		self.mgr.arelease_node = AsyncMock()
+		self.mgr.get_client = UpstreamClientPool().get
+		self.mgr.hedger = Hedger()
+		self.mgr.coalescer = SingleFlight()
+		self.mgr.response_cache = ResponseCache(redis=False)
+		self.mgr.amodel_digest = AsyncMock(return_value=None)
+		self.mgr.embed_batcher = EmbedBatcher()
+		self.mgr.embedding_store = EmbeddingStore()
+		self.mgr.amodel_nodes = AsyncMock(return_value=["http://ollama:11434"])
+		self.mgr.atags_payload = AsyncMock(return_value=None)
 		self.mock_get_mgr.return_value = self.mgr
 
 		# populate cache with models available
@@ -98,6 +143,224 @@ class ViewsProxyTests(TestCase):
 		resp = self.client.post('/api/embeddings', payload, format='json')
 		self.assertIn(resp.status_code, (200, 502, 503))
 
+	def test_generate_rejects_node_id(self):
+		payload = {'model': 'gemma3:270m-it-qat', 'prompt': 'hello', 'node_id': self.cpu_node.id}
+		resp = self.client.post('/api/generate', payload, format='json')
+		self.assertEqual(resp.status_code, 400)
+		self.mgr.achoose_node.assert_not_called()
+
+	def test_generate_unknown_model_returns_404(self):
+		self.mgr.achoose_node.return_value = None
+		payload = {'model': 'missing:latest', 'prompt': 'hello', 'stream': False}
+		resp = self.client.post('/api/generate', payload, format='json')
+		self.assertEqual(resp.status_code, 404)
+
+	def test_embed_releases_node_after_upstream_call(self):
+		payload = {'model': 'embeddinggemma:300m-qat-q4_0', 'input': 'hello'}
+		self.client.post('/api/embed', payload, format='json')
+		self.mgr.arelease_node.assert_awaited_once()
+		self.assertEqual(self.mgr.arelease_node.await_args.args, ("http://ollama:11434",))
+		self.assertGreaterEqual(self.mgr.arelease_node.await_args.kwargs['latency'], 0)
+		self.assertEqual(self.mgr.arelease_node.await_args.kwargs['model'], 'embeddinggemma:300m-qat-q4_0')
+
+	def test_chat_affinity_key_stable_across_turns(self):
+		from proxy.views_proxy import _affinity_key
+		turn1 = {'model': 'gemma3:270m-it-qat', 'messages': [
+			{'role': 'system', 'content': 'be brief'},
+			{'role': 'user', 'content': 'hi'},
+		]}
+		turn2 = {'model': 'gemma3:270m-it-qat', 'messages': turn1['messages'] + [
+			{'role': 'assistant', 'content': 'hello'},
+			{'role': 'user', 'content': 'and now?'},
+		]}
+		self.assertEqual(_affinity_key(turn1, "chat"), _affinity_key(turn2, "chat"))
+		other = {'model': 'gemma3:270m-it-qat', 'messages': [{'role': 'user', 'content': 'unrelated'}]}
+		self.assertNotEqual(_affinity_key(turn1, "chat"), _affinity_key(other, "chat"))
+
+		self.client.post('/api/chat', dict(turn2, stream=False), format='json')
+		self.assertEqual(
+			self.mgr.achoose_node.await_args.kwargs['affinity_key'], _affinity_key(turn1, "chat")
+		)
+
+	def test_generate_returns_503_when_nodes_saturated(self):
+		from proxy.utils.admission import NodesSaturated
+		self.mgr.achoose_node.side_effect = NodesSaturated("admission queue is full")
+		payload = {'model': 'gemma3:270m-it-qat', 'prompt': 'hello', 'stream': False}
+		resp = self.client.post('/api/generate', payload, format='json')
+		self.assertEqual(resp.status_code, 503)
+		self.assertEqual(resp['Retry-After'], '1')
+		self.mgr.arelease_node.assert_not_called()
+
+	def test_generate_fails_over_before_first_byte(self):
+		import httpx
+		dead, alive = "http://dead:11434", "http://ollama:11434"
+		self.mgr.achoose_node = AsyncMock(side_effect=[dead, alive])
+
+		async def answer(addr, payload):
+			if addr == dead:
+				raise httpx.ConnectError("connection refused")
+			return httpx.Response(200, json={"response": "hi", "done": True})
+
+		self.mgr.get_client = FakeUpstream(answer)
+		payload = {'model': 'gemma3:270m-it-qat', 'prompt': 'hello', 'stream': False}
+		resp = self.client.post('/api/generate', payload, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()["response"], "hi")
+		self.assertEqual(self.mgr.achoose_node.await_args.kwargs['exclude'], [dead])
+		released = self.mgr.arelease_node.await_args_list
+		self.assertEqual([c.args[0] for c in released], [dead, alive])
+		self.assertEqual([c.kwargs['ok'] for c in released], [False, True])
+
+	def test_slow_embed_is_hedged_to_another_node(self):
+		import asyncio
+		import httpx
+		slow, fast = "http://slow:11434", "http://ollama:11434"
+		self.mgr.achoose_node = AsyncMock(side_effect=[slow, fast])
+		self.mgr.hedger = Hedger(endpoints=["embed"], budget=1.0, default_delay=0.05)
+
+		async def answer(addr, payload):
+			if addr == slow:
+				await asyncio.sleep(5)
+			return httpx.Response(200, json={"embeddings": [[0.1]], "node": addr})
+
+		self.mgr.get_client = FakeUpstream(answer)
+		payload = {'model': 'embeddinggemma:300m-qat-q4_0', 'input': 'hello'}
+		resp = self.client.post('/api/embed', payload, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual(resp.json()["node"], fast)
+		self.assertEqual(self.mgr.achoose_node.await_args.kwargs['exclude'], [slow])
+		self.assertFalse(self.mgr.achoose_node.await_args.kwargs['wait'])
+		stats = self.mgr.hedger.stats()["by_endpoint"]["embed"]
+		self.assertEqual((stats["requests"], stats["hedged"], stats["wins"]), (1, 1, 1))
+		# the cancelled primary still releases its node
+		self.assertEqual({c.args[0] for c in self.mgr.arelease_node.await_args_list}, {slow, fast})
+		# the response time counts from the primary's start, not the hedge's
+		(sketch,) = self.mgr.hedger._latency.values()
+		self.assertGreaterEqual(sketch.quantile(0.5), 0.05)
+
+	def test_only_deterministic_buffered_requests_are_shared_response(self):
+		from proxy.views_proxy import _deterministic_key
+		embed = {'model': 'Embeddinggemma:300m-qat-q4_0', 'input': 'hello'}
+		self.assertEqual(_deterministic_key("embed", embed), _deterministic_key("embed", dict(embed, model='embeddinggemma:300m-qat-q4_0')))
+		generate = {'model': 'gemma3:270m-it-qat', 'prompt': 'hi'}
+		self.assertIsNone(_deterministic_key("generate", generate))
+		self.assertIsNotNone(_deterministic_key("generate", dict(generate, options={'temperature': 0})))
+		self.assertIsNotNone(_deterministic_key("generate", dict(generate, options={'seed': 42})))
+		self.assertIsNone(_deterministic_key("generate", dict(generate, stream=True, options={'seed': 42})))
+		chat = {'model': 'gemma3:270m-it-qat', 'messages': [{'role': 'user', 'content': 'hi'}], 'options': {'temperature': 0}}
+		self.assertIsNone(_deterministic_key("chat", chat))  # chat streams unless told otherwise
+		self.assertIsNotNone(_deterministic_key("chat", dict(chat, stream=False)))
+
+	def test_repeated_embed_is_served_from_the_response_cache(self):
+		import httpx
+
+		async def answer(addr, payload):
+			return httpx.Response(200, json={"embeddings": [[0.1]]})
+
+		self.mgr.get_client = upstream = FakeUpstream(answer)
+		self.mgr.amodel_digest = AsyncMock(return_value="sha256:abc")
+		payload = {'model': 'embeddinggemma:300m-qat-q4_0', 'input': 'hello'}
+		first = self.client.post('/api/embed', payload, format='json')
+		second = self.client.post('/api/embed', {'input': 'hello', 'model': 'embeddinggemma:300m-qat-q4_0'}, format='json')
+		self.assertEqual((first.status_code, second.status_code), (200, 200))
+		self.assertEqual(first.content, second.content)
+		self.assertEqual(len(upstream.posted), 1)
+		self.assertEqual(self.mgr.achoose_node.await_count, 1)
+		self.assertEqual(self.mgr.response_cache.stats()["lru_hits"], 1)
+
+	def test_large_embed_is_scattered_across_nodes_in_order(self):
+		import httpx
+		a, b = "http://ollama:11434", "http://ollama2:11434"
+		picks = iter([a, b] * 10)
+		failed = []
+
+		async def choose(model_name=None, exclude=None, **kwargs):
+			addr = next(picks)
+			return b if exclude and addr in exclude else addr
+
+		async def answer(addr, payload):
+			texts = payload["input"]
+			if addr == a and not failed:
+				failed.append(texts)
+				return httpx.Response(500, json={"error": "out of memory"})
+			return httpx.Response(200, json={"embeddings": [[float(t[1:])] for t in texts], "prompt_eval_count": len(texts)})
+
+		self.mgr.amodel_nodes = AsyncMock(return_value=[a, b])
+		self.mgr.achoose_node = AsyncMock(side_effect=choose)
+		self.mgr.get_client = upstream = FakeUpstream(answer)
+		payload = {'model': 'embeddinggemma:300m-qat-q4_0', 'input': [f"t{i}" for i in range(5)]}
+		with self.settings(PROXY_EMBED_SHARD_SIZE=2, PROXY_EMBED_SHARD_PER_NODE=1):
+			resp = self.client.post('/api/embed', payload, format='json')
+		self.assertEqual(resp.status_code, 200)
+		data = resp.json()
+		self.assertEqual(data["embeddings"], [[0.0], [1.0], [2.0], [3.0], [4.0]])
+		self.assertEqual(data["prompt_eval_count"], 5)
+		posted = [(addr, sent["input"]) for addr, sent in upstream.posted]
+		self.assertEqual({addr for addr, _ in posted}, {a, b})
+		# the chunk that failed on one node was retried on the other
+		self.assertIn((b, failed[0]), posted)
+
+	def test_embedding_store_sends_only_missing_inputs(self):
+		import tempfile
+		import httpx
+
+		async def answer(addr, payload):
+			return httpx.Response(200, json={"embeddings": [[float(len(t))] for t in payload["input"]]})
+
+		upstream = FakeUpstream(answer)
+
+		with tempfile.TemporaryDirectory() as tmp:
+			self.mgr.embedding_store = EmbeddingStore(tmp + "/embeddings.bin")
+			self.mgr.amodel_digest = AsyncMock(return_value="sha256:abc")
+			self.mgr.get_client = upstream
+			model = 'embeddinggemma:300m-qat-q4_0'
+			first = self.client.post('/api/embed', {'model': model, 'input': ['a', 'bb']}, format='json')
+			second = self.client.post('/api/embed', {'model': model, 'input': ['ccc', 'a']}, format='json')
+		self.assertEqual(first.json()["embeddings"], [[1.0], [2.0]])
+		self.assertEqual(second.json()["embeddings"], [[3.0], [1.0]])
+		self.assertEqual([sent["input"] for _, sent in upstream.posted], [['a', 'bb'], ['ccc']])
+
+	def test_embed_binary_and_base64_encodings(self):
+		import base64
+		import httpx
+		from proxy.utils.embedding_codec import unpack_vectors
+
+		async def answer(addr, payload):
+			return httpx.Response(200, json={"model": "m", "embeddings": [[0.5, 1.0], [2.0, -1.0]]})
+
+		self.mgr.get_client = FakeUpstream(answer)
+		payload = {'model': 'embeddinggemma:300m-qat-q4_0', 'input': ['a', 'b']}
+		resp = self.client.post('/api/embed?encoding=binary', payload, format='json')
+		self.assertEqual(resp['Content-Type'], 'application/octet-stream')
+		self.assertEqual((resp['X-Embedding-Shape'], resp['X-Embedding-Dtype']), ('2,2', 'float32'))
+		self.assertEqual(unpack_vectors(resp.content, (2, 2)), [[0.5, 1.0], [2.0, -1.0]])
+
+		resp = self.client.post('/api/embed?encoding=base64&dtype=float16', payload, format='json')
+		encoded = resp.json()["embeddings"]
+		self.assertEqual((encoded["dtype"], encoded["shape"]), ("float16", [2, 2]))
+		self.assertEqual(len(base64.b64decode(encoded["data"])), 8)
+
+		resp = self.client.post('/api/embed?encoding=msgpack', payload, format='json')
+		self.assertEqual(resp.status_code, 400)
+
+	def test_tags_served_from_the_published_aggregate(self):
+		etag, body = '"abc"', b'{"models": [{"name": "gemma3:270m-it-qat"}]}'
+		self.mgr.atags_payload.return_value = (etag, body)
+
+		resp = self.client.get('/api/tags')
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual((resp.content, resp['ETag']), (body, etag))
+
+		resp = self.client.get('/api/tags', HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 304)
+		resp = self.client.get('/api/tags', HTTP_IF_NONE_MATCH='"old"')
+		self.assertEqual(resp.status_code, 200)
+
+		# forcing a refresh is reserved to admins
+		resp = self.client.get('/api/tags?refresh=true')
+		self.assertEqual(resp.status_code, 403)
+		self.mgr.publish_tags.assert_not_called()
+
 	def test_tags_and_version(self):
 		# tags should list available models (at least those two)
 		tags_resp = self.client.get('/api/tags')
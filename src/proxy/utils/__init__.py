@@ -2,4 +2,18 @@
 
 __all__ = [
     "proxy_manager",
+    "client_pool",
+    "async_redis",
+    "hash_ring",
+    "admission",
+    "concurrency",
+    "traffic_stats",
+    "circuit_breaker",
+    "outliers",
+    "hedging",
+    "coalescing",
+    "response_cache",
+    "embed_batcher",
+    "embedding_store",
+    "embedding_codec",
 ]
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import logging
+logger = logging.getLogger('proxy')
+
+
+class NodesSaturated(Exception):
+    """Every eligible node is at its concurrency cap and no slot freed up in time."""
+
+
+class AdmissionQueue:
+    """Bounded wait queue for requests that found every eligible node at its cap.
+
+    Waiters park on a future of their own event loop. `notify()` (called from
+    `release_node`, possibly on another thread) wakes the oldest waiter, which
+    retries its node selection; a waiter that still finds no slot passes the
+    wake-up on to the next one. Slots freed by other worker processes are
+    noticed by polling every `poll_interval` seconds.
+    """
+
+    def __init__(self, max_wait: float = 30.0, max_depth: int = 100, poll_interval: float = 0.25) -> None:
+        self.max_wait = max_wait
+        self.max_depth = max_depth
+        self.poll_interval = poll_interval
+        self._waiters: deque = deque()  # (loop, future)
+        self._lock = threading.Lock()
+        self._depth = 0
+        self._peak_depth = 0
+        self._queued = 0
+        self._admitted = 0
+        self._timeouts = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionQueue":
+        from django.conf import settings
+        return cls(
+            max_wait=getattr(settings, 'PROXY_ADMISSION_MAX_WAIT', 30.0),
+            max_depth=getattr(settings, 'PROXY_ADMISSION_MAX_DEPTH', 100),
+        )
+
+    async def wait_for_node(self, try_acquire: Callable[[], Awaitable[Optional[str]]]) -> str:
+        """Wait until `try_acquire()` returns a node address.
+
+        Raises NodesSaturated when the queue is full or `max_wait` elapses.
+        """
+        with self._lock:
+            if self._depth >= self.max_depth:
+                self._rejected += 1
+                raise NodesSaturated("admission queue is full")
+            self._depth += 1
+            self._queued += 1
+            self._peak_depth = max(self._peak_depth, self._depth)
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        deadline = started + self.max_wait
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    with self._lock:
+                        self._timeouts += 1
+                    raise NodesSaturated(f"no node slot freed up within {self.max_wait}s")
+                fut = loop.create_future()
+                entry = (loop, fut)
+                claimed = False
+                with self._lock:
+                    self._waiters.append(entry)
+                try:
+                    await asyncio.wait_for(fut, timeout=min(remaining, self.poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    with self._lock:
+                        try:
+                            self._waiters.remove(entry)
+                        except ValueError:
+                            # notify() popped us, possibly just as the wait timed out
+                            claimed = True
+                woken = claimed or (fut.done() and not fut.cancelled())
+
+                addr = await try_acquire()
+                if addr:
+                    waited = time.monotonic() - started
+                    with self._lock:
+                        self._admitted += 1
+                        self._wait_total += waited
+                        self._wait_max = max(self._wait_max, waited)
+                    logger.debug("admission: admitted to %s after %.3fs", addr, waited)
+                    return addr
+                if woken:
+                    # the freed slot was not usable for us (other model / taken): pass it on
+                    self.notify()
+        finally:
+            with self._lock:
+                self._depth -= 1
+
+    def notify(self) -> None:
+        """Wake the oldest waiter; safe to call from any thread."""
+        with self._lock:
+            while self._waiters:
+                loop, fut = self._waiters.popleft()
+                if fut.done() or loop.is_closed():
+                    continue
+                loop.call_soon_threadsafe(_resolve, fut)
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self._depth,
+                "peak_depth": self._peak_depth,
+                "queued": self._queued,
+                "admitted": self._admitted,
+                "timeouts": self._timeouts,
+                "rejected": self._rejected,
+                "avg_wait": (self._wait_total / self._admitted) if self._admitted else 0.0,
+                "max_wait": self._wait_max,
+                "max_depth": self.max_depth,
+            }
+
+
+def _resolve(fut: asyncio.Future) -> None:
+    if not fut.done():
+        fut.set_result(True)
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+import logging
+logger = logging.getLogger('proxy')
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # pragma: no cover - redis is a hard dependency of django-redis
+    aioredis = None
+
+from .client_pool import close_with_loop
+
+
+class AsyncRedisClients:
+    """`redis.asyncio` clients for the cache's Redis server, one per event loop.
+
+    django-redis only offers a blocking client. Hot paths of the async proxy
+    views (routing scripts, lease release) await these clients instead of
+    hopping to a thread. Connections are bound to the loop that opened them,
+    so every loop gets its own client, closed when the loop shuts down.
+
+    `get()` returns None when the cache is not Redis-backed.
+    """
+
+    def __init__(self, url: str = "", password: Optional[str] = None) -> None:
+        self.url = url
+        self.password = password
+        self.enabled = bool(url) and aioredis is not None
+        self._clients: Dict[int, Tuple[asyncio.AbstractEventLoop, "aioredis.Redis"]] = {}
+        self._guards: dict = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "AsyncRedisClients":
+        from django.conf import settings
+        default = getattr(settings, 'CACHES', {}).get('default', {})
+        if not str(default.get('BACKEND', '')).startswith('django_redis.'):
+            return cls()
+        location = default.get('LOCATION') or ""
+        # django-redis takes a list (or comma-separated string) of servers; the first is the primary
+        if isinstance(location, (list, tuple)):
+            location = location[0] if location else ""
+        return cls(
+            url=location.split(",")[0].strip(),
+            password=(default.get('OPTIONS') or {}).get('PASSWORD'),
+        )
+
+    def get(self) -> Optional["aioredis.Redis"]:
+        """The client of the running event loop (created on first use), or None when disabled."""
+        if not self.enabled:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(id(loop))
+            if entry is not None and entry[0] is loop:
+                return entry[1]
+            for loop_id in [i for i, (l, _c) in self._clients.items() if l.is_closed()]:
+                # loops closed without shutdown_asyncgens(): nothing can await their sockets
+                self._clients.pop(loop_id, None)
+                self._guards.pop(loop_id, None)
+            kwargs = {"password": self.password} if self.password else {}
+            client = aioredis.from_url(self.url, **kwargs)
+            self._clients[id(loop)] = (loop, client)
+            self._guards[id(loop)] = close_with_loop(lambda: self._loop_closing(loop))
+            return client
+
+    async def _loop_closing(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._guards.pop(id(loop), None)
+            entry = self._clients.pop(id(loop), None)
+        if entry is not None:
+            try:
+                await entry[1].aclose()
+            except Exception as e:
+                logger.debug("async redis: aclose failed: %s", e)
+
+    async def aclose(self) -> None:
+        """Close the running loop's client."""
+        await self._loop_closing(asyncio.get_running_loop())
@@ -0,0 +1,162 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
+import logging
+logger = logging.getLogger('proxy')
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _Circuit:
+    __slots__ = ("state", "failures", "successes", "probes", "opened_at", "cooldown", "trips")
+
+    def __init__(self) -> None:
+        self.state = CLOSED
+        self.failures = 0  # consecutive failures while closed
+        self.successes = 0  # successful probes while half-open
+        self.probes = 0  # probes in flight while half-open
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.trips = 0
+
+
+class CircuitBreaker:
+    """Per-node circuit breakers fed by the outcome of proxied requests.
+
+    A closed circuit opens after `failure_threshold` consecutive failures
+    (connect errors, timeouts, 5xx answers) and the node stops receiving
+    traffic. After `open_seconds` the circuit turns half-open and lets up to
+    `half_open_probes` requests through at a time; `success_threshold`
+    successful probes close it again, a failed probe re-opens it with the
+    cooldown doubled (up to `max_open_seconds`).
+
+    Circuits are worker-local and safe to update from any thread. This
+    complements the periodic health check, which only notices a node that
+    stops answering `/health`.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        failure_threshold: int = 5,
+        success_threshold: int = 2,
+        open_seconds: float = 10.0,
+        max_open_seconds: float = 120.0,
+        half_open_probes: int = 1,
+    ) -> None:
+        self.enabled = enabled
+        self.failure_threshold = failure_threshold
+        self.success_threshold = success_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.half_open_probes = half_open_probes
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "CircuitBreaker":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_CIRCUIT_BREAKER', True),
+            failure_threshold=getattr(settings, 'PROXY_CIRCUIT_FAILURE_THRESHOLD', 5),
+            success_threshold=getattr(settings, 'PROXY_CIRCUIT_SUCCESS_THRESHOLD', 2),
+            open_seconds=getattr(settings, 'PROXY_CIRCUIT_OPEN_SECONDS', 10.0),
+            max_open_seconds=getattr(settings, 'PROXY_CIRCUIT_MAX_OPEN_SECONDS', 120.0),
+            half_open_probes=getattr(settings, 'PROXY_CIRCUIT_HALF_OPEN_PROBES', 1),
+        )
+
+    def _circuit(self, addr: str) -> _Circuit:
+        circuit = self._circuits.get(addr)
+        if circuit is None:
+            circuit = self._circuits[addr] = _Circuit()
+        return circuit
+
+    def _open(self, addr: str, circuit: _Circuit, cooldown: float, now: float) -> None:
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.cooldown = min(cooldown, self.max_open_seconds)
+        circuit.failures = 0
+        circuit.successes = 0
+        circuit.trips += 1
+        logger.warning("circuit breaker: %s opened for %.1fs", addr, circuit.cooldown)
+
+    def _allows(self, circuit: _Circuit, now: float) -> bool:
+        if circuit.state == OPEN and now - circuit.opened_at >= circuit.cooldown:
+            circuit.state = HALF_OPEN
+            circuit.probes = 0
+        if circuit.state == HALF_OPEN:
+            return circuit.probes < self.half_open_probes
+        return circuit.state == CLOSED
+
+    def filter(self, addrs: List[str]) -> List[str]:
+        """The nodes of `addrs` whose circuit lets a request through.
+
+        When every circuit is open the full list is returned: a request that
+        probably fails beats refusing all of them until a cooldown ends.
+        """
+        if not self.enabled or not self._circuits:
+            return addrs
+        now = time.monotonic()
+        with self._lock:
+            allowed = [a for a in addrs if a not in self._circuits or self._allows(self._circuits[a], now)]
+        return allowed or addrs
+
+    def routed(self, addr: str) -> None:
+        """Note that a request was sent to `addr` (takes a half-open probe slot)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            circuit = self._circuits.get(addr)
+            if circuit is not None and circuit.state == HALF_OPEN:
+                circuit.probes += 1
+
+    def record(self, addr: str, ok: Optional[bool]) -> None:
+        """Feed one finished request; `ok` None means the outcome is unknown
+        (the client went away) and only frees its probe slot."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(addr)
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+                if ok is False:
+                    self._open(addr, circuit, circuit.cooldown * 2, now)
+                elif ok:
+                    circuit.successes += 1
+                    if circuit.successes >= self.success_threshold:
+                        circuit.state = CLOSED
+                        circuit.failures = 0
+                        logger.info("circuit breaker: %s closed", addr)
+            elif circuit.state == CLOSED:
+                if ok is False:
+                    circuit.failures += 1
+                    if circuit.failures >= self.failure_threshold:
+                        self._open(addr, circuit, self.open_seconds, now)
+                elif ok:
+                    circuit.failures = 0
+
+    def state(self, addr: str) -> str:
+        with self._lock:
+            circuit = self._circuits.get(addr)
+            if circuit is None:
+                return CLOSED
+            self._allows(circuit, time.monotonic())
+            return circuit.state
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            nodes = {}
+            for addr, c in self._circuits.items():
+                self._allows(c, now)
+                nodes[addr] = {
+                    "state": c.state,
+                    "failures": c.failures,
+                    "trips": c.trips,
+                    "retry_in": max(0.0, c.cooldown - (now - c.opened_at)) if c.state == OPEN else 0.0,
+                }
+            return {"enabled": self.enabled, "nodes": nodes}
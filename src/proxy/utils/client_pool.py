@@ -0,0 +1,176 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+import logging
+logger = logging.getLogger('proxy')
+
+
+async def _closing_guard(close: Callable[[], Awaitable[None]]) -> AsyncIterator[None]:
+    try:
+        yield
+    finally:
+        await close()
+
+
+def close_with_loop(close: Callable[[], Awaitable[None]]) -> AsyncIterator[None]:
+    """Await `close()` on the running loop when it shuts down its async generators.
+
+    `loop.shutdown_asyncgens()` (run by ``asyncio.run`` before it closes the
+    loop) finalizes the returned guard while the loop can still await. The
+    loop only holds async generators weakly, so the caller must keep the
+    guard referenced until then.
+    """
+    guard = _closing_guard(close)
+    # Step the generator to its first yield synchronously: __anext__()
+    # registers it with the running loop's asyncgen hooks, and the step
+    # cannot be lost to a task cancelled before it ever ran.
+    try:
+        guard.__anext__().send(None)
+    except StopIteration:
+        pass
+    return guard
+
+
+class UpstreamClientPool:
+    """Long-lived upstream HTTP clients, one per (event loop, node address).
+
+    ``httpx.AsyncClient`` connections are bound to the event loop that opened
+    them, so clients are keyed by the running loop as well as the node. Under
+    ASGI every request of a worker shares the server loop and therefore reuses
+    the same keep-alive connections. A loop's clients are closed when it
+    shuts down (see `close_with_loop`); clients of loops closed without
+    ``shutdown_asyncgens()`` are dropped lazily.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 30.0,
+        warm_connections: int = 2,
+    ) -> None:
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.warm_connections = warm_connections
+        self._clients: Dict[Tuple[int, str], Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = {}
+        self._requests: Dict[str, int] = {}
+        self._created_at: Dict[str, float] = {}
+        self._guards: Dict[int, AsyncIterator[None]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "UpstreamClientPool":
+        from django.conf import settings
+        return cls(
+            max_connections=getattr(settings, 'PROXY_POOL_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(settings, 'PROXY_POOL_MAX_KEEPALIVE', 20),
+            keepalive_expiry=getattr(settings, 'PROXY_POOL_KEEPALIVE_EXPIRY', 60.0),
+            timeout=getattr(settings, 'PROXY_UPSTREAM_TIMEOUT', 30.0),
+            warm_connections=getattr(settings, 'PROXY_POOL_WARM_CONNECTIONS', 2),
+        )
+
+    @staticmethod
+    def _base_url(addr: str) -> str:
+        return addr.rstrip("/")
+
+    def get(self, addr: str) -> httpx.AsyncClient:
+        """Return the pooled client for `addr` on the running event loop."""
+        loop = asyncio.get_running_loop()
+        base = self._base_url(addr)
+        key = (id(loop), base)
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and entry[0] is loop and not entry[1].is_closed:
+                return entry[1]
+            self._prune_locked()
+
+            async def _count_request(request, _addr=base):
+                self._requests[_addr] = self._requests.get(_addr, 0) + 1
+
+            client = httpx.AsyncClient(
+                base_url=base,
+                limits=self.limits,
+                timeout=self.timeout,
+                event_hooks={'request': [_count_request]},
+            )
+            self._clients[key] = (loop, client)
+            if id(loop) not in self._guards:
+                self._guards[id(loop)] = close_with_loop(lambda: self._loop_closing(loop))
+            self._created_at.setdefault(base, time.time())
+            logger.debug("client_pool: created upstream client for %s (loop=%s)", base, id(loop))
+            return client
+
+    async def _loop_closing(self, loop: asyncio.AbstractEventLoop) -> None:
+        with self._lock:
+            self._guards.pop(id(loop), None)
+        await self._aclose_loop(loop)
+
+    def _prune_locked(self) -> None:
+        # Backstop for loops closed without shutdown_asyncgens(): their clients
+        # cannot be awaited anymore, so drop them together with the loop.
+        stale = [k for k, (loop, _c) in self._clients.items() if loop.is_closed()]
+        for k in stale:
+            self._clients.pop(k, None)
+        if stale:
+            logger.debug("client_pool: dropped %d client(s) of closed event loops", len(stale))
+        live = {id(loop) for loop, _c in self._clients.values()}
+        for loop_id in [i for i in self._guards if i not in live]:
+            self._guards.pop(loop_id, None)
+
+    async def warm(self, addrs: Iterable[str]) -> None:
+        """Open `warm_connections` keep-alive connections to every node."""
+        async def _warm_one(addr: str) -> None:
+            client = self.get(addr)
+            try:
+                await asyncio.gather(*[client.get("/", timeout=5.0) for _ in range(max(1, self.warm_connections))])
+            except Exception as e:
+                logger.debug("client_pool: warm-up failed for %s: %s", addr, e)
+
+        await asyncio.gather(*[_warm_one(a) for a in addrs], return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Per-node pool statistics (summed over event loops)."""
+        out: Dict[str, dict] = {}
+        with self._lock:
+            self._prune_locked()
+            entries = list(self._clients.items())
+        for (_loop_id, base), (_loop, client) in entries:
+            item = out.setdefault(base, {
+                'clients': 0,
+                'connections': 0,
+                'idle_connections': 0,
+                'requests': self._requests.get(base, 0),
+                'created_at': self._created_at.get(base),
+            })
+            item['clients'] += 1
+            try:
+                # httpcore pool introspection is best-effort (private transport attribute)
+                pool = getattr(getattr(client, '_transport', None), '_pool', None)
+                conns = list(getattr(pool, 'connections', []) or [])
+                item['connections'] += len(conns)
+                item['idle_connections'] += sum(1 for c in conns if c.is_idle())
+            except Exception as e:
+                logger.debug("client_pool: stats introspection failed for %s: %s", base, e)
+        return out
+
+    async def aclose(self, addr: Optional[str] = None) -> None:
+        """Close clients owned by the running loop (optionally only for `addr`)."""
+        await self._aclose_loop(asyncio.get_running_loop(), self._base_url(addr) if addr else None)
+
+    async def _aclose_loop(self, loop: asyncio.AbstractEventLoop, base: Optional[str] = None) -> None:
+        with self._lock:
+            keys = [k for k, (l, _c) in self._clients.items() if l is loop and (base is None or k[1] == base)]
+            clients = [self._clients.pop(k)[1] for k in keys]
+        for client in clients:
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.debug("client_pool: aclose failed: %s", e)
@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Tuple
+
+from asgiref.sync import sync_to_async
+
+import logging
+logger = logging.getLogger('proxy')
+
+# (status code, content type, body) of a finished proxied request
+Result = Tuple[int, str, bytes]
+
+
+def request_key(endpoint: str, payload: dict) -> str:
+    """Canonical hash of `endpoint` and a JSON body (key order and whitespace ignored)."""
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{endpoint}\x00{body}".encode()).hexdigest()
+
+
+def pack_result(result: Result) -> bytes:
+    status, content_type, body = result
+    return f"{status}\n{content_type}\n".encode() + body
+
+
+def unpack_result(data: bytes) -> Result:
+    status, content_type, body = data.split(b"\n", 2)
+    return int(status), content_type.decode(), body
+
+
+class SingleFlight:
+    """Shares one upstream call between concurrent identical requests.
+
+    The first request for a key (the leader) runs it, later ones wait for
+    its result. Within a worker waiters share an asyncio future. With
+    `distributed` the leader also takes a Redis lock and publishes its
+    result for `result_ttl` seconds, and leaders of other workers poll for
+    it instead of calling upstream. A waiter whose leader fails, or that
+    waited `wait_timeout` seconds, makes the call itself.
+    """
+
+    LOCK_PREFIX = "ha_flight:"  # + key -> token of the worker running the call
+    RESULT_PREFIX = "ha_flight_result:"  # + key -> packed result
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        distributed: bool = False,
+        wait_timeout: float = 120.0,
+        result_ttl: float = 5.0,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.enabled = enabled
+        self.distributed = distributed
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._flights: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._counts = {"flights": 0, "local_joins": 0, "remote_joins": 0, "fallbacks": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "SingleFlight":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_COALESCE', True),
+            distributed=getattr(settings, 'PROXY_COALESCE_REDIS', False),
+            wait_timeout=getattr(settings, 'PROXY_COALESCE_WAIT', 120.0),
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Result]]) -> Result:
+        """Return `fn()`'s result, shared with concurrent calls for the same `key`."""
+        if not self.enabled:
+            return await fn()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight[0] is not loop:
+                future = loop.create_future()
+                self._flights[key] = (loop, future)
+                flight = None
+        if flight is not None:
+            self._count("local_joins")
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight[1]), self.wait_timeout)
+            except Exception as e:
+                logger.debug("single flight %s: leader failed (%r), calling upstream", key[:12], e)
+                self._count("fallbacks")
+                return await fn()
+
+        try:
+            result = await (self._remote(key, fn) if self.distributed else self._lead(fn))
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # a cancelled leader must not look like a cancelled waiter
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("leader cancelled"))
+            future.exception()  # mark retrieved: waiters fall back to their own call
+            raise
+        finally:
+            with self._lock:
+                if self._flights.get(key, (None, None))[1] is future:
+                    del self._flights[key]
+
+    async def _lead(self, fn: Callable[[], Awaitable[Result]]) -> Result:
+        self._count("flights")
+        return await fn()
+
+    async def _remote(self, key: str, fn: Callable[[], Awaitable[Result]]) -> Result:
+        """Coordinate with the other workers through Redis (falls back to `fn` on errors)."""
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            token = uuid.uuid4().hex
+            lock_key = self.LOCK_PREFIX + key
+            leader = await sync_to_async(conn.set, thread_sensitive=False)(
+                lock_key, token, nx=True, px=int(self.wait_timeout * 1000)
+            )
+        except Exception as e:
+            logger.debug("single flight: redis unavailable (%s), coalescing within the worker only", e)
+            return await self._lead(fn)
+
+        if leader:
+            try:
+                result = await self._lead(fn)
+                await sync_to_async(conn.set, thread_sensitive=False)(
+                    self.RESULT_PREFIX + key, pack_result(result), px=int(self.result_ttl * 1000)
+                )
+                return result
+            finally:
+                try:
+                    owner = await sync_to_async(conn.get, thread_sensitive=False)(lock_key)
+                    if owner is not None and (owner.decode() if isinstance(owner, bytes) else owner) == token:
+                        await sync_to_async(conn.delete, thread_sensitive=False)(lock_key)
+                except Exception as e:
+                    logger.debug("single flight: failed to drop lock %s: %s", lock_key, e)
+
+        # another worker runs the call: wait for its result
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while time.monotonic() < deadline:
+                packed = await sync_to_async(conn.get, thread_sensitive=False)(self.RESULT_PREFIX + key)
+                if packed is not None:
+                    self._count("remote_joins")
+                    return unpack_result(packed)
+                if not await sync_to_async(conn.exists, thread_sensitive=False)(lock_key):
+                    # the leader finished without a result (failed or cancelled)
+                    break
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.debug("single flight: polling %s failed: %s", key[:12], e)
+        self._count("fallbacks")
+        return await fn()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "distributed": self.distributed,
+                "in_flight": len(self._flights),
+                **self._counts,
+            }
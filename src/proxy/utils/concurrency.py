@@ -0,0 +1,179 @@
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import logging
+logger = logging.getLogger('proxy')
+
+
+class _NodeLimit:
+    __slots__ = ("limit", "baselines", "signal_samples", "samples", "increases", "drops", "errors", "last_drop")
+
+    def __init__(self, limit: float) -> None:
+        self.limit = limit
+        # slow EWMA of successful samples, per signal (see `AdaptiveConcurrency.signal`)
+        self.baselines: Dict[str, float] = {}
+        self.signal_samples: Dict[str, int] = {}
+        self.samples = 0
+        self.increases = 0
+        self.drops = 0
+        self.errors = 0
+        self.last_drop = 0.0
+
+
+class AdaptiveConcurrency:
+    """Per-node in-flight limits learned from completed requests (AIMD).
+
+    Every released request is a sample of its node's latency and outcome.
+    The latency signal depends on the request (see `signal`): generation is
+    judged on the time it spent outside decoding, which grows with queueing
+    on the node but not with the length of the answer; other requests on
+    their end-to-end latency. Each signal keeps its own baseline.
+
+    A success whose signal stays within `tolerance` times the node's
+    baseline (a slow EWMA of past successes) grows the limit by `1 / limit`,
+    i.e. about one slot per round of `limit` requests, but only while the
+    node actually runs close to its limit. An error or a latency above the
+    tolerance multiplies the limit by `backoff`; drops are spaced at least
+    one baseline latency apart so one overload episode counts once.
+
+    Limits are worker-local and safe to update from any thread; every worker
+    learns from the same nodes, so their limits converge.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        initial_limit: int = 4,
+        min_limit: int = 1,
+        max_limit: int = 32,
+        tolerance: float = 2.0,
+        backoff: float = 0.7,
+        smoothing: float = 0.05,
+        warmup: int = 10,
+    ) -> None:
+        self.enabled = enabled
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.warmup = warmup
+        self._nodes: Dict[str, _NodeLimit] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "AdaptiveConcurrency":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_ADAPTIVE_CONCURRENCY', False),
+            initial_limit=getattr(settings, 'PROXY_ADAPTIVE_INITIAL_LIMIT', 4),
+            min_limit=getattr(settings, 'PROXY_ADAPTIVE_MIN_LIMIT', 1),
+            max_limit=getattr(settings, 'PROXY_ADAPTIVE_MAX_LIMIT', 32),
+            tolerance=getattr(settings, 'PROXY_ADAPTIVE_LATENCY_TOLERANCE', 2.0),
+            backoff=getattr(settings, 'PROXY_ADAPTIVE_BACKOFF', 0.7),
+        )
+
+    def _node(self, addr: str) -> _NodeLimit:
+        state = self._nodes.get(addr)
+        if state is None:
+            state = self._nodes[addr] = _NodeLimit(float(self.initial_limit))
+        return state
+
+    def limit(self, addr: str) -> int:
+        """Current in-flight limit for `addr`."""
+        with self._lock:
+            return int(self._node(addr).limit)
+
+    def caps(self, static_caps: dict, addrs: Iterable[str]) -> dict:
+        """Combine the static caps (0 = unlimited) with the learned limits.
+
+        A static cap also bounds the learned limit from above, so it stays a
+        hard ceiling. Returns `static_caps` unchanged while disabled.
+        """
+        if not self.enabled:
+            return static_caps
+        caps = dict(static_caps)
+        with self._lock:
+            for a in addrs:
+                learned = int(self._node(a).limit)
+                static = static_caps.get(a) or 0
+                caps[a] = min(static, learned) if static else learned
+        return caps
+
+    @staticmethod
+    def signal(latency: Optional[float], final: Optional[dict] = None) -> Tuple[str, Optional[float]]:
+        """The (signal name, value) a completed request contributes.
+
+        With Ollama's `eval_duration` (generate/chat) that is `ttft`: the
+        end-to-end latency minus the decoding time, i.e. queueing, model load
+        and prompt evaluation. Otherwise `latency`, the end-to-end latency.
+        """
+        eval_duration = (final or {}).get("eval_duration")
+        if latency is not None and eval_duration:
+            return "ttft", max(0.0, latency - eval_duration / 1e9)
+        return "latency", latency
+
+    def record(
+        self,
+        addr: str,
+        latency: Optional[float],
+        ok: bool = True,
+        inflight: Optional[int] = None,
+        max_limit: Optional[int] = None,
+        signal: str = "latency",
+    ) -> None:
+        """Feed one completed request into `addr`'s limit.
+
+        `latency` is the value of `signal` (see `signal()`), `inflight` the
+        node's in-flight count including this request (None when unknown)
+        and `max_limit` its static cap, if any.
+        """
+        if not self.enabled or (ok and latency is None):
+            return
+        ceiling = min(max_limit, self.max_limit) if max_limit else self.max_limit
+        now = time.monotonic()
+        with self._lock:
+            state = self._node(addr)
+            state.samples += 1
+            baseline = state.baselines.get(signal)
+            if ok:
+                state.baselines[signal] = latency if baseline is None else baseline + self.smoothing * (latency - baseline)
+                state.signal_samples[signal] = state.signal_samples.get(signal, 0) + 1
+            else:
+                state.errors += 1
+            congested = not ok or (
+                baseline is not None
+                and state.signal_samples[signal] > self.warmup
+                and latency > self.tolerance * baseline
+            )
+            if congested:
+                if now - state.last_drop >= (baseline or 0.0):
+                    state.limit = max(float(self.min_limit), state.limit * self.backoff)
+                    state.last_drop = now
+                    state.drops += 1
+                    logger.debug("adaptive concurrency: %s limit -> %.2f (ok=%s %s=%s baseline=%s)",
+                                 addr, state.limit, ok, signal, latency, baseline)
+            elif inflight is None or inflight >= state.limit - 1:
+                # only grow while the limit is what holds the node back
+                state.limit = min(float(ceiling), state.limit + 1.0 / state.limit)
+                state.increases += 1
+            state.limit = min(state.limit, float(ceiling))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "nodes": {
+                    addr: {
+                        "limit": int(s.limit),
+                        "baselines": dict(s.baselines),
+                        "samples": s.samples,
+                        "increases": s.increases,
+                        "drops": s.drops,
+                        "errors": s.errors,
+                    }
+                    for addr, s in self._nodes.items()
+                },
+            }
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .coalescing import request_key
+
+import logging
+logger = logging.getLogger('proxy')
+
+# sends one batched /api/embed body upstream; returns (status code, body)
+Sender = Callable[[dict], Awaitable[Tuple[int, bytes]]]
+
+
+class _Batch:
+    __slots__ = ("loop", "payload", "send", "items", "size", "timer")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, payload: dict, send: Sender) -> None:
+        self.loop = loop
+        self.payload = payload
+        self.send = send
+        self.items: List[Tuple[List[str], asyncio.Future]] = []
+        self.size = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class EmbedBatcher:
+    """Merges concurrent `/api/embed` requests into one upstream call.
+
+    Requests for the same model and options (everything but `input`) that
+    arrive within `window` seconds of the first are sent together as one
+    array `input`, or as soon as `max_inputs` inputs are collected, and the
+    returned `embeddings` are split back per request. A request gets None
+    when the batch failed and should then be sent on its own.
+
+    Worker-local; the first request's `send` (and so its headers) carries
+    the batch.
+    """
+
+    # upper bounds of the batch size histogram (inputs per upstream call)
+    BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+    def __init__(self, enabled: bool = False, window: float = 0.005, max_inputs: int = 32) -> None:
+        self.enabled = enabled
+        self.window = window
+        self.max_inputs = max_inputs
+        self._pending: Dict[str, _Batch] = {}
+        self._histogram = {b: 0 for b in self.BUCKETS}
+        self._overflow = 0
+        self._counts = {"batches": 0, "requests": 0, "inputs": 0, "failed_batches": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "EmbedBatcher":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_EMBED_BATCH', False),
+            window=getattr(settings, 'PROXY_EMBED_BATCH_WINDOW_MS', 5.0) / 1000.0,
+            max_inputs=getattr(settings, 'PROXY_EMBED_BATCH_MAX_INPUTS', 32),
+        )
+
+    @staticmethod
+    def inputs(payload: dict) -> Optional[List[str]]:
+        """The `input` of an embed payload as a list of strings (None if not text)."""
+        value = payload.get("input")
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, list) and value and all(isinstance(v, str) for v in value):
+            return list(value)
+        return None
+
+    def key(self, payload) -> Optional[str]:
+        """Batch key of a mergeable embed request, or None."""
+        if not self.enabled or not isinstance(payload, dict) or not payload.get("model"):
+            return None
+        inputs = self.inputs(payload)
+        if inputs is None or len(inputs) >= self.max_inputs:
+            return None
+        return request_key("embed", {k: v for k, v in payload.items() if k != "input"})
+
+    async def submit(self, key: str, payload: dict, send: Sender) -> Optional[dict]:
+        """Queue `payload` on the batch for `key`; returns its own embed response (or None)."""
+        inputs = self.inputs(payload)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None or batch.loop is not loop:
+                batch = self._pending[key] = _Batch(loop, payload, send)
+                batch.timer = loop.call_later(self.window, self._expire, key, batch)
+            batch.items.append((inputs, future))
+            batch.size += len(inputs)
+            full = batch.size >= self.max_inputs
+            if full:
+                del self._pending[key]
+                batch.timer.cancel()
+        if full:
+            loop.create_task(self._flush(batch))
+        return await asyncio.shield(future)
+
+    def _expire(self, key: str, batch: _Batch) -> None:
+        with self._lock:
+            if self._pending.get(key) is not batch:
+                return
+            del self._pending[key]
+        batch.loop.create_task(self._flush(batch))
+
+    async def _flush(self, batch: _Batch) -> None:
+        inputs = [text for texts, _ in batch.items for text in texts]
+        self._record(len(batch.items), len(inputs))
+        results: List[Optional[dict]] = [None] * len(batch.items)
+        try:
+            status, content = await batch.send(dict(batch.payload, input=inputs))
+            data = json.loads(content) if status == 200 else None
+            embeddings = data.get("embeddings") if isinstance(data, dict) else None
+            if isinstance(embeddings, list) and len(embeddings) == len(inputs):
+                # durations and counts describe the whole batch
+                start = 0
+                for i, (texts, _) in enumerate(batch.items):
+                    results[i] = dict(data, embeddings=embeddings[start:start + len(texts)])
+                    start += len(texts)
+            else:
+                logger.debug("embed batch of %d inputs failed upstream (status=%s)", len(inputs), status)
+        except Exception as e:
+            logger.debug("embed batch of %d inputs failed: %s", len(inputs), e)
+        if results[0] is None:
+            with self._lock:
+                self._counts["failed_batches"] += 1
+        for (_, future), result in zip(batch.items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _record(self, requests: int, inputs: int) -> None:
+        with self._lock:
+            self._counts["batches"] += 1
+            self._counts["requests"] += requests
+            self._counts["inputs"] += inputs
+            for bound in self.BUCKETS:
+                if inputs <= bound:
+                    self._histogram[bound] += 1
+                    break
+            else:
+                self._overflow += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            histogram = {f"<={b}": n for b, n in self._histogram.items()}
+            histogram[f">{self.BUCKETS[-1]}"] = self._overflow
+            batches = self._counts["batches"]
+            return {
+                "enabled": self.enabled,
+                "window_ms": self.window * 1000.0,
+                "max_inputs": self.max_inputs,
+                **self._counts,
+                "mean_batch_inputs": self._counts["inputs"] / batches if batches else 0.0,
+                "batch_size_histogram": histogram,
+            }
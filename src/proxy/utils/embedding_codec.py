@@ -0,0 +1,64 @@
+import array
+import base64
+import itertools
+import struct
+import sys
+from typing import List, Optional, Sequence, Tuple
+
+DTYPES = ("float32", "float16")
+ENCODINGS = ("binary", "base64")
+BINARY_CONTENT_TYPE = "application/octet-stream"
+
+
+def pack_vectors(vectors: Sequence[Sequence[float]], dtype: str = "float32") -> Tuple[bytes, Tuple[int, int]]:
+    """Pack equal-length vectors into little-endian `dtype` bytes; returns (data, (rows, dim)).
+
+    Raises ValueError for ragged or non-numeric vectors.
+    """
+    rows = len(vectors)
+    dim = len(vectors[0]) if rows else 0
+    if any(len(v) != dim for v in vectors):
+        raise ValueError("embeddings have different dimensions")
+    flat = itertools.chain.from_iterable(vectors)
+    try:
+        if dtype == "float32":
+            packed = array.array("f", flat)
+            if sys.byteorder == "big":
+                packed.byteswap()
+            return packed.tobytes(), (rows, dim)
+        if dtype == "float16":
+            return struct.pack(f"<{rows * dim}e", *flat), (rows, dim)
+    except (TypeError, OverflowError, struct.error) as e:
+        raise ValueError(f"embeddings are not numeric: {e}") from e
+    raise ValueError(f"unsupported dtype: {dtype}")
+
+
+def unpack_vectors(data: bytes, shape: Tuple[int, int], dtype: str = "float32") -> List[List[float]]:
+    """Inverse of `pack_vectors` (for clients and tests)."""
+    rows, dim = shape
+    values = struct.unpack(f"<{rows * dim}{'f' if dtype == 'float32' else 'e'}", data)
+    return [list(values[i * dim:(i + 1) * dim]) for i in range(rows)]
+
+
+def base64_vectors(vectors: Sequence[Sequence[float]], dtype: str = "float32") -> dict:
+    """JSON-embeddable form of packed vectors: `{"encoding", "dtype", "shape", "data"}`."""
+    data, shape = pack_vectors(vectors, dtype)
+    return {"encoding": "base64", "dtype": dtype, "shape": list(shape), "data": base64.b64encode(data).decode()}
+
+
+def negotiate(query_encoding: Optional[str], query_dtype: Optional[str], accept: str) -> Optional[Tuple[str, str]]:
+    """(encoding, dtype) requested through the query string or `Accept`, or None for plain JSON.
+
+    Raises ValueError for an unknown encoding or dtype.
+    """
+    encoding = (query_encoding or "").lower() or None
+    if encoding is None and BINARY_CONTENT_TYPE in (accept or "").lower():
+        encoding = "binary"
+    if encoding in (None, "json"):
+        return None
+    if encoding not in ENCODINGS:
+        raise ValueError(f"unsupported encoding: {encoding} (use one of json, {', '.join(ENCODINGS)})")
+    dtype = (query_dtype or "float32").lower()
+    if dtype not in DTYPES:
+        raise ValueError(f"unsupported dtype: {dtype} (use one of {', '.join(DTYPES)})")
+    return encoding, dtype
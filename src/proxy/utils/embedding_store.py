@@ -0,0 +1,247 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import logging
+logger = logging.getLogger('proxy')
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+MAGIC = b"AVXEMB1\x00"
+# record header: key (16 bytes), vector length, dtype code, padding
+RECORD = struct.Struct("<16sIB3x")
+DTYPES = {"float32": (0, "f", 4), "float16": (1, "e", 2)}
+_FORMATS = {code: (fmt, size) for code, fmt, size in DTYPES.values()}
+
+
+class _FileLock:
+    """Exclusive flock on the store file, taken by the workers of a host to write."""
+
+    def __init__(self, fd: int) -> None:
+        self.fd = fd
+
+    def __enter__(self) -> None:
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc) -> None:
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Persistent embedding cache in a memory-mapped, append-only file.
+
+    Vectors are appended as little-endian float32 (or float16) records
+    keyed by a 16-byte hash of the model digest, the request options and
+    the input text. Every worker maps the same file read-only and keeps a
+    hash index of record offsets, extended by scanning what other workers
+    appended since its last look, so lookups read straight from the page
+    cache. When the file outgrows `max_bytes` it is compacted to the newest
+    `compact_ratio` of its records and atomically replaced; workers notice
+    the new inode and remap.
+
+    Safe to use from any thread.
+    """
+
+    def __init__(
+        self,
+        path: str = "",
+        dtype: str = "float32",
+        max_bytes: int = 1024 * 1024 * 1024,
+        compact_ratio: float = 0.5,
+    ) -> None:
+        if dtype not in DTYPES:
+            raise ValueError(f"unsupported embedding store dtype: {dtype}")
+        self.path = path
+        self.enabled = bool(path)
+        self.dtype = dtype
+        self.max_bytes = max_bytes
+        self.compact_ratio = compact_ratio
+        self._fd: Optional[int] = None
+        self._inode: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._scanned = 0
+        self._index: Dict[bytes, Tuple[int, int, int]] = {}  # key -> (vector offset, length, dtype code)
+        self._counts = {"hits": 0, "misses": 0, "stores": 0, "compactions": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "EmbeddingStore":
+        from django.conf import settings
+        return cls(
+            path=getattr(settings, 'PROXY_EMBED_STORE_PATH', ""),
+            dtype=getattr(settings, 'PROXY_EMBED_STORE_DTYPE', "float32"),
+            max_bytes=getattr(settings, 'PROXY_EMBED_STORE_MAX_BYTES', 1024 * 1024 * 1024),
+        )
+
+    @staticmethod
+    def key(digest: str, scope: str, text: str) -> bytes:
+        """Record key of `text` embedded by the model at `digest` with request `scope` (options)."""
+        return hashlib.sha256(f"{digest}\x00{scope}\x00{text}".encode()).digest()[:16]
+
+    # -- file handling (callers hold self._lock) --
+
+    def _open(self) -> None:
+        """(Re)open the store file, creating it, and remap it if another worker replaced it."""
+        try:
+            inode = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+        if self._fd is not None and inode == self._inode:
+            return
+        self._close()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        with _FileLock(fd):
+            if os.fstat(fd).st_size == 0:
+                os.write(fd, MAGIC)
+        self._fd = fd
+        self._inode = os.fstat(fd).st_ino
+
+    def _close(self) -> None:
+        # lookups copy the vectors out under the lock, so nothing outlives the map
+        if self._map is not None:
+            self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = self._map = None
+        self._scanned = 0
+        self._index = {}
+
+    def _refresh(self) -> None:
+        """Map the current file and index the records appended since the last scan."""
+        self._open()
+        size = os.fstat(self._fd).st_size
+        if size <= self._scanned:
+            return
+        if self._map is None or len(self._map) < size:
+            self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        view = self._map
+        if self._scanned == 0:
+            if view[:len(MAGIC)] != MAGIC:
+                logger.warning("embedding store %s has an unknown format; ignoring it", self.path)
+                self._scanned = size
+                return
+            self._scanned = len(MAGIC)
+        offset = self._scanned
+        while offset + RECORD.size <= size:
+            key, length, code = RECORD.unpack_from(view, offset)
+            if code not in _FORMATS:
+                logger.warning("embedding store %s is corrupt at %d; ignoring the rest", self.path, offset)
+                offset = size
+                break
+            end = offset + RECORD.size + length * _FORMATS[code][1]
+            if end > size:
+                break  # a record still being written
+            self._index[key] = (offset + RECORD.size, length, code)
+            offset = end
+        self._scanned = offset
+
+    # -- public API --
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[Tuple[float, ...]]]:
+        """The stored vectors of `keys` (None for misses), copied out of the mapped file."""
+        if not self.enabled:
+            return [None] * len(keys)
+        with self._lock:
+            try:
+                self._refresh()
+            except OSError as e:
+                logger.debug("embedding store: cannot read %s: %s", self.path, e)
+                return [None] * len(keys)
+            found: List[Optional[Tuple[float, ...]]] = []
+            for key in keys:
+                entry = self._index.get(key)
+                if entry is None:
+                    found.append(None)
+                    continue
+                offset, length, code = entry
+                fmt, _ = _FORMATS[code]
+                found.append(struct.unpack_from(f"<{length}{fmt}", self._map, offset))
+            hits = sum(1 for v in found if v is not None)
+            self._counts["hits"] += hits
+            self._counts["misses"] += len(keys) - hits
+            return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, Sequence[float]]]) -> None:
+        """Append vectors (keys already stored are skipped) and compact when over budget."""
+        if not self.enabled:
+            return
+        code, fmt, _ = DTYPES[self.dtype]
+        items = list(items)
+        with self._lock:
+            try:
+                while True:
+                    self._refresh()
+                    chunks = []
+                    for key, vector in items:
+                        if key in self._index:
+                            continue
+                        chunks.append(RECORD.pack(key, len(vector), code))
+                        chunks.append(struct.pack(f"<{len(vector)}{fmt}", *vector))
+                    if not chunks:
+                        return
+                    data = memoryview(b"".join(chunks))
+                    with _FileLock(self._fd):
+                        # another worker may have compacted between our open and the lock:
+                        # appending to the unlinked inode would lose the vectors
+                        if os.stat(self.path).st_ino != self._inode:
+                            continue
+                        while data:
+                            data = data[os.write(self._fd, data):]
+                    break
+                self._counts["stores"] += len(chunks) // 2
+                if os.fstat(self._fd).st_size > self.max_bytes:
+                    self._compact()
+            except (OSError, struct.error) as e:
+                logger.warning("embedding store: cannot write %s: %s", self.path, e)
+
+    def _compact(self) -> None:
+        """Rewrite the store with its newest records, up to `compact_ratio` of `max_bytes`."""
+        with _FileLock(self._fd):
+            if os.stat(self.path).st_ino != self._inode:
+                return  # another worker compacted already
+            self._refresh()
+            budget = int(self.max_bytes * self.compact_ratio)
+            # newest first (records are appended in time order)
+            records = sorted(self._index.values(), key=lambda e: -e[0])
+            kept, used = [], 0
+            for offset, length, code in records:
+                size = RECORD.size + length * _FORMATS[code][1]
+                if used + size > budget:
+                    break
+                kept.append((offset, length, code))
+                used += size
+            inverse = {e[0]: k for k, e in self._index.items()}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(MAGIC)
+                for offset, length, code in reversed(kept):
+                    f.write(RECORD.pack(inverse[offset], length, code))
+                    f.write(self._map[offset:offset + length * _FORMATS[code][1]])
+            os.replace(tmp, self.path)
+        self._counts["compactions"] += 1
+        logger.info("embedding store %s compacted to %d records (%d bytes)", self.path, len(kept), used)
+        self._close()
+        self._refresh()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._counts["hits"] + self._counts["misses"]
+            return {
+                "enabled": self.enabled,
+                "path": self.path,
+                "dtype": self.dtype,
+                "vectors": len(self._index),
+                "bytes": self._scanned,
+                "max_bytes": self.max_bytes,
+                **self._counts,
+                "hit_ratio": self._counts["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,44 @@
+import bisect
+import hashlib
+from typing import Iterable, Iterator, List
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent-hash ring over node addresses.
+
+    Every node is placed on the ring `vnodes` times so keys spread evenly and
+    adding/removing a node only moves the keys that node owned. `walk(key)`
+    yields the distinct nodes in ring order starting at the key's position,
+    which gives the preferred node first and the spillover order after it.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 64) -> None:
+        self.nodes: List[str] = list(dict.fromkeys(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._points = [p for p, _n in points]
+        self._owners = [n for _p, n in points]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def walk(self, key: str) -> Iterator[str]:
+        if not self._points:
+            return
+        start = bisect.bisect(self._points, _hash(key))
+        seen = set()
+        total = len(self._owners)
+        for i in range(total):
+            node = self._owners[(start + i) % total]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self.nodes):
+                    return
+
+    def get(self, key: str):
+        """Return the node owning `key`, or None for an empty ring."""
+        return next(self.walk(key), None)
@@ -0,0 +1,131 @@
+import threading
+from typing import Dict, Iterable, Tuple
+
+from .traffic_stats import DecayingQuantiles
+
+
+class _HedgeCounters:
+    __slots__ = ("requests", "hedged", "wins")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0  # hedges that answered before the primary
+
+
+class Hedger:
+    """Policy and bookkeeping for hedged requests.
+
+    A request on an enabled endpoint (and model, if a model list is set)
+    gets a second copy sent to another node when the first has not answered
+    within the `quantile` of recent response times for that endpoint and
+    model (`default_delay` until enough samples exist). Every request earns
+    `budget` hedge tokens, up to `burst`, and a hedge spends one, so hedges
+    add at most about `budget` extra load.
+
+    Worker-local and safe to use from any thread.
+    """
+
+    def __init__(
+        self,
+        endpoints: Iterable[str] = (),
+        models: Iterable[str] = (),
+        budget: float = 0.05,
+        burst: float = 10.0,
+        quantile: float = 0.95,
+        default_delay: float = 1.0,
+        min_delay: float = 0.02,
+        min_samples: float = 5.0,
+        half_life: float = 60.0,
+    ) -> None:
+        self.endpoints = frozenset(endpoints)
+        self.models = frozenset(models)
+        self.budget = budget
+        self.burst = burst
+        self.quantile = quantile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.half_life = half_life
+        self._tokens = 0.0
+        self._latency: Dict[Tuple[str, str], DecayingQuantiles] = {}
+        self._counters: Dict[str, _HedgeCounters] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "Hedger":
+        from django.conf import settings
+        from .proxy_manager import normalize_model_name
+        return cls(
+            endpoints=getattr(settings, 'PROXY_HEDGE_ENDPOINTS', ()),
+            models=[normalize_model_name(m) for m in getattr(settings, 'PROXY_HEDGE_MODELS', ())],
+            budget=getattr(settings, 'PROXY_HEDGE_BUDGET', 0.05),
+            quantile=getattr(settings, 'PROXY_HEDGE_QUANTILE', 0.95),
+            default_delay=getattr(settings, 'PROXY_HEDGE_DEFAULT_DELAY', 1.0),
+            min_delay=getattr(settings, 'PROXY_HEDGE_MIN_DELAY', 0.02),
+        )
+
+    def applies(self, endpoint: str, model: str) -> bool:
+        """Whether requests of `endpoint` for `model` (normalized) are hedged."""
+        return endpoint in self.endpoints and (not self.models or model in self.models)
+
+    def delay(self, endpoint: str, model: str) -> float:
+        """Seconds to wait for the primary before sending the hedge."""
+        with self._lock:
+            sketch = self._latency.get((endpoint, model))
+            if sketch is None or sketch.weight() < self.min_samples:
+                return self.default_delay
+            return max(self.min_delay, sketch.quantile(self.quantile))
+
+    def started(self, endpoint: str) -> None:
+        """Count a hedgeable request and earn its share of the hedge budget."""
+        with self._lock:
+            self._counter(endpoint).requests += 1
+            self._tokens = min(self.burst, self._tokens + self.budget)
+
+    def try_hedge(self, endpoint: str) -> bool:
+        """Spend a hedge token; False when the budget is used up."""
+        with self._lock:
+            if self._tokens < 1.0 - 1e-9:  # tolerate float drift of the accumulated budget
+                return False
+            self._tokens -= 1.0
+            self._counter(endpoint).hedged += 1
+            return True
+
+    def refund(self) -> None:
+        """Return the token of a hedge that could not be sent (no free node)."""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1.0)
+
+    def observe(self, endpoint: str, model: str, latency: float, hedge_won: bool = False) -> None:
+        """Record the response time of a request, from its primary attempt's start."""
+        with self._lock:
+            sketch = self._latency.get((endpoint, model))
+            if sketch is None:
+                sketch = self._latency[(endpoint, model)] = DecayingQuantiles(self.half_life)
+            sketch.add(latency)
+            if hedge_won:
+                self._counter(endpoint).wins += 1
+
+    def _counter(self, endpoint: str) -> _HedgeCounters:
+        counter = self._counters.get(endpoint)
+        if counter is None:
+            counter = self._counters[endpoint] = _HedgeCounters()
+        return counter
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "endpoints": sorted(self.endpoints),
+                "budget": self.budget,
+                "tokens": self._tokens,
+                "by_endpoint": {
+                    endpoint: {
+                        "requests": c.requests,
+                        "hedged": c.hedged,
+                        "wins": c.wins,
+                        "hedge_rate": c.hedged / c.requests if c.requests else 0.0,
+                    }
+                    for endpoint, c in self._counters.items()
+                },
+            }
@@ -0,0 +1,171 @@
+import statistics
+import threading
+import time
+from typing import Dict, List, Optional
+
+import logging
+logger = logging.getLogger('proxy')
+
+
+class _Ejection:
+    __slots__ = ("until", "model", "reason", "count")
+
+    def __init__(self) -> None:
+        self.until = 0.0
+        self.model = ""
+        self.reason = ""
+        self.count = 0  # ejections so far; scales the next ejection time
+
+
+class OutlierDetector:
+    """Temporarily ejects nodes that are much slower than the rest of the fleet.
+
+    Every `interval` seconds the per-node, per-model traffic statistics are
+    compared against the median of the nodes serving the same model (with
+    at least `min_hosts` of them and `min_samples` recent samples each). A
+    node whose time to first byte exceeds `factor` times the median, or
+    whose tokens per second drop below the median divided by `factor`, is
+    ejected from candidate sets for `base_ejection` seconds times the number
+    of times it has been ejected (capped at `max_ejection`). At most
+    `max_ejected_fraction` of the nodes are ejected at once.
+
+    This catches nodes that pass the health check but serve slowly
+    (throttled GPU, shared host). Worker-local and safe to use from any
+    thread.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        factor: float = 2.0,
+        min_hosts: int = 3,
+        min_samples: int = 5,
+        interval: float = 10.0,
+        base_ejection: float = 30.0,
+        max_ejection: float = 300.0,
+        max_ejected_fraction: float = 0.34,
+        max_age: float = 300.0,
+    ) -> None:
+        self.enabled = enabled
+        self.factor = factor
+        self.min_hosts = min_hosts
+        self.min_samples = min_samples
+        self.interval = interval
+        self.base_ejection = base_ejection
+        self.max_ejection = max_ejection
+        self.max_ejected_fraction = max_ejected_fraction
+        self.max_age = max_age  # seconds after which a node's stats no longer count
+        self._ejections: Dict[str, _Ejection] = {}
+        self._last_run = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "OutlierDetector":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_OUTLIER_DETECTION', True),
+            factor=getattr(settings, 'PROXY_OUTLIER_FACTOR', 2.0),
+            min_hosts=getattr(settings, 'PROXY_OUTLIER_MIN_HOSTS', 3),
+            min_samples=getattr(settings, 'PROXY_OUTLIER_MIN_SAMPLES', 5),
+            interval=getattr(settings, 'PROXY_OUTLIER_INTERVAL', 10.0),
+            base_ejection=getattr(settings, 'PROXY_OUTLIER_EJECTION_SECONDS', 30.0),
+            max_ejection=getattr(settings, 'PROXY_OUTLIER_MAX_EJECTION_SECONDS', 300.0),
+            max_ejected_fraction=getattr(settings, 'PROXY_OUTLIER_MAX_EJECTED_FRACTION', 0.34),
+        )
+
+    def due(self, now: Optional[float] = None) -> bool:
+        """True when `interval` seconds have passed since the last evaluation."""
+        now = time.time() if now is None else now
+        return self.enabled and now - self._last_run >= self.interval
+
+    def ejected(self, now: Optional[float] = None) -> List[str]:
+        now = time.time() if now is None else now
+        with self._lock:
+            return [a for a, e in self._ejections.items() if e.until > now]
+
+    def filter(self, addrs: List[str]) -> List[str]:
+        """`addrs` without the ejected nodes (all of them if none would remain)."""
+        if not self.enabled or not self._ejections:
+            return addrs
+        ejected = set(self.ejected())
+        return [a for a in addrs if a not in ejected] or addrs
+
+    def _outliers(self, stats: dict, now: float) -> Dict[str, tuple]:
+        """{addr: (ratio, model, reason)} of the nodes deviating from their model's median."""
+        by_model: Dict[str, Dict[str, dict]] = {}
+        for addr, models in stats.items():
+            for model, s in models.items():
+                if s.get("samples", 0) >= self.min_samples and now - s.get("updated_at", 0.0) <= self.max_age:
+                    by_model.setdefault(model, {})[addr] = s
+        found: Dict[str, tuple] = {}
+        for model, nodes in by_model.items():
+            if len(nodes) < self.min_hosts:
+                continue
+            for field, reason in (("ttfb", "latency"), ("tokens_per_second", "throughput")):
+                values = {a: s[field] for a, s in nodes.items() if s.get(field)}
+                if len(values) < self.min_hosts:
+                    continue
+                median = statistics.median(values.values())
+                for addr, value in values.items():
+                    # how many times worse than the median (latency up, throughput down)
+                    ratio = value / median if reason == "latency" else median / value
+                    if ratio > self.factor and ratio > found.get(addr, (0.0,))[0]:
+                        found[addr] = (ratio, model, reason)
+        return found
+
+    def evaluate(self, stats: dict, total_nodes: int, now: Optional[float] = None) -> List[str]:
+        """Eject the outliers found in `stats` ({addr: {model: traffic stats}}).
+
+        `total_nodes` bounds the number of simultaneous ejections. Returns
+        the nodes whose ejection has ended since the last evaluation; their
+        statistics predate the ejection and should be discarded.
+        """
+        now = time.time() if now is None else now
+        self._last_run = now
+        if not self.enabled:
+            return []
+        outliers = self._outliers(stats, now)
+        with self._lock:
+            returned = [a for a, e in self._ejections.items() if e.until and e.until <= now]
+            for a in returned:
+                self._ejections[a].until = 0.0
+            for a, e in self._ejections.items():
+                if not e.until and e.count and a not in outliers and a not in returned:
+                    # a node that keeps up again slowly earns back short ejections
+                    e.count -= 1
+            ejected = sum(1 for e in self._ejections.values() if e.until > now)
+            budget = max(1, int(total_nodes * self.max_ejected_fraction)) - ejected
+            # worst offenders first, within the ejection budget
+            for addr, (ratio, model, reason) in sorted(outliers.items(), key=lambda kv: -kv[1][0]):
+                if budget <= 0:
+                    break
+                if addr in returned:
+                    continue
+                state = self._ejections.setdefault(addr, _Ejection())
+                if state.until > now:
+                    continue
+                state.count += 1
+                state.until = now + min(self.base_ejection * state.count, self.max_ejection)
+                state.model = model
+                state.reason = reason
+                budget -= 1
+                logger.warning("outlier detection: ejected %s until %.0f (%s %.1fx the median for %s)",
+                               addr, state.until, reason, ratio, model)
+        return returned
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "ejected": {
+                    addr: {
+                        "remaining": e.until - now,
+                        "model": e.model,
+                        "reason": e.reason,
+                        "ejections": e.count,
+                    }
+                    for addr, e in self._ejections.items()
+                    if e.until > now
+                },
+            }
@@ -1,6 +1,14 @@
 import asyncio
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import socket
+import threading
 import time
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 
 import httpx
 from apscheduler.schedulers.background import BackgroundScheduler
@@ -9,21 +17,227 @@ logger = logging.getLogger('proxy')
 from django.core.cache import cache
 from asgiref.sync import sync_to_async
 
+from .admission import AdmissionQueue
+from .async_redis import AsyncRedisClients
+from .client_pool import UpstreamClientPool
+from .coalescing import SingleFlight
+from .circuit_breaker import CircuitBreaker
+from .concurrency import AdaptiveConcurrency
+from .embed_batcher import EmbedBatcher
+from .embedding_store import EmbeddingStore
+from .hash_ring import HashRing
+from .hedging import Hedger
+from .outliers import OutlierDetector
+from .response_cache import ResponseCache
+from .traffic_stats import TrafficStats
+
+
+def normalize_model_name(name: str) -> str:
+    """Normalize an Ollama model reference for index lookups.
+
+    Names are compared case-insensitively and an omitted tag means
+    `:latest`, so `llama3`, `Llama3` and `llama3:latest` share one key. A
+    colon in a registry host (`host:5000/ns/model`) is not mistaken for a tag.
+    """
+    name = (name or "").strip().lower()
+    if name and ":" not in name.rsplit("/", 1)[-1]:
+        name += ":latest"
+    return name
+
+
+def build_model_index(models_by_addr: dict) -> dict:
+    """Invert `{addr: [model names]}` into `{normalized name: [addrs]}`."""
+    index: dict[str, list[str]] = {}
+    for addr, models in models_by_addr.items():
+        for m in models or []:
+            addrs = index.setdefault(normalize_model_name(m), [])
+            if addr not in addrs:
+                addrs.append(addr)
+    return index
+
+
+def build_tags_payload(tags_by_addr: dict) -> Tuple[str, bytes]:
+    """Merge `{addr: [/api/tags model entries]}` into one serialized `/api/tags` body.
+
+    Models are deduplicated by name, keeping the most recently modified
+    entry, and sorted by name. Returns `(etag, body)`; the ETag is a hash of
+    the body, so it only changes when the aggregated list does.
+    """
+    models: dict[str, dict] = {}
+    for entries in tags_by_addr.values():
+        for m in entries or []:
+            if not isinstance(m, dict) or not m.get("name"):
+                continue
+            name = m["name"]
+            # string comparison works for RFC3339 timestamps
+            if name not in models or m.get("modified_at", "") > models[name].get("modified_at", ""):
+                models[name] = m
+    body = json.dumps({"models": sorted(models.values(), key=lambda m: m["name"])}).encode()
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"', body
+
+
+class _Plan:
+    """How a routing strategy claims a node, independent of the Redis client.
+
+    - `route`: ROUTE_SCRIPT over the published route sets (`addrs` is the
+      snapshot's view, scanned when the sets are not published)
+    - `tiers`: CANDIDATE_SCRIPT over each of `tiers` in turn until one has a
+      node below its cap
+    - `score`: MGET the in-flight counts of `addrs`, let `choose(counts)`
+      pick a node and claim it
+    """
+
+    __slots__ = ("kind", "addrs", "weights", "caps", "model", "tiers", "choose")
+
+    def __init__(self, kind: str, addrs: List[str], weights: Optional[dict], caps: Optional[dict]) -> None:
+        self.kind = kind
+        self.addrs = addrs
+        self.weights = weights
+        self.caps = caps
+        self.model: Optional[str] = None
+        self.tiers: List[List[str]] = []
+        self.choose = None
+
+    @classmethod
+    def route(cls, addrs: List[str], model: Optional[str], weights: Optional[dict], caps: Optional[dict]) -> "_Plan":
+        plan = cls("route", addrs, weights, caps)
+        plan.model = model
+        return plan
+
+    @classmethod
+    def tiered(cls, tiers: List[List[str]], weights: Optional[dict], caps: Optional[dict]) -> "_Plan":
+        plan = cls("tiers", [a for tier in tiers for a in tier], weights, caps)
+        plan.tiers = tiers
+        return plan
+
+    @classmethod
+    def scored(cls, addrs: List[str], choose, weights: Optional[dict], caps: Optional[dict]) -> "_Plan":
+        plan = cls("score", addrs, weights, caps)
+        plan.choose = choose
+        return plan
+
+
 class HAProxyManager:
     """High-availability manager for Ollama nodes.
 
     Stores simple state in Django cache (LocMemCache). Provides:
     - periodic health checks (async)
     - pools: active / standby
-    - selection strategies: least_active, lowest_latency
+    - selection strategies: least_active, lowest_latency, p2c, warm_model, prefix_affinity,
+      expected_time, lowest_ttft
     """
 
     ACTIVE_POOL_KEY = "ha_active_pool"
     STANDBY_POOL_KEY = "ha_standby_pool"
-    ACTIVE_COUNT_KEY_PREFIX = "ha_active_count:"  # + address
+    ACTIVE_COUNT_KEY_PREFIX = "ha_active_count:"  # + address; derived from the node's live leases
+    LEASE_KEY_PREFIX = "ha_leases:"  # + address -> sorted set {lease id: expiry timestamp}
     LATENCY_KEY_PREFIX = "ha_latency:"  # + address
     NODE_ID_MAP_KEY = "ha_node_id_map"  # stores {str(id): address}
+    NODE_META_KEY = "ha_node_meta"  # {address: {"weight": float, "max_concurrency": int | None}}
     MODELS_KEY_PREFIX = "ha_models:"  # + address -> list of model names
+    MODEL_INDEX_KEY = "ha_model_index"  # normalized model name -> list of addresses
+    MODEL_DIGESTS_KEY = "ha_model_digests"  # normalized model name -> digests across nodes
+    TAGS_KEY = "ha_tags"  # (etag, body) of the aggregated /api/tags response
+    TAGS_ETAG_KEY = "ha_tags_etag"  # etag of TAGS_KEY, read with the routing snapshot
+    RUNNING_KEY_PREFIX = "ha_running:"  # + address -> {normalized model: size_vram} from /api/ps
+    # raw Redis sets read by ROUTE_SCRIPT (not Django-cache encoded)
+    ROUTE_ACTIVE_SET_KEY = "ha_route_active"  # set of active addresses
+    ROUTE_MODEL_SET_PREFIX = "ha_route_model:"  # + normalized model -> set of addresses
+    ROUTE_MODEL_REGISTRY_KEY = "ha_route_models"  # set of published ROUTE_MODEL_SET_PREFIX keys
+    ROUTE_WEIGHT_KEY = "ha_route_weights"  # hash address -> weight
+    ROUTE_CAP_KEY = "ha_route_caps"  # hash address -> max_concurrency
+
+    # In-flight requests are leases: a sorted set per node maps lease ids to
+    # expiry timestamps. Every script that adds or removes a lease rewrites the
+    # node's in-flight count key from ZCARD, so the count can not drift, and
+    # leases of a crashed worker expire and are reaped.
+
+    # Least-active selection executed atomically inside Redis:
+    # healthy-pool membership, optional model membership, the per-node
+    # in-flight cap, min weighted in-flight count (count / weight) and the
+    # lease on the chosen node happen in one EVALSHA.
+    # KEYS[1]: active pool set, KEYS[2]: weights hash, KEYS[3]: caps hash,
+    # KEYS[4] (optional): model nodes set
+    # ARGV[1]: in-flight count key prefix, ARGV[2]: default cap (0 = unlimited),
+    # ARGV[3]: lease key prefix, ARGV[4]: lease id, ARGV[5]: lease expiry
+    # Returns {address, new_count}, 0 when every node is at its cap, or nil
+    # when no node qualifies.
+    ROUTE_SCRIPT = """
+    local members
+    if #KEYS > 3 then
+        members = redis.call('SINTER', KEYS[1], KEYS[4])
+    else
+        members = redis.call('SMEMBERS', KEYS[1])
+    end
+    local best = nil
+    local best_load = nil
+    for _, addr in ipairs(members) do
+        local count = tonumber(redis.call('GET', ARGV[1] .. addr) or '0')
+        local weight = tonumber(redis.call('HGET', KEYS[2], addr) or '1')
+        local cap = tonumber(redis.call('HGET', KEYS[3], addr) or ARGV[2])
+        local load = count / weight
+        if (cap <= 0 or count < cap) and (best_load == nil or load < best_load) then
+            best = addr
+            best_load = load
+        end
+    end
+    if best == nil then
+        if #members > 0 then
+            return 0
+        end
+        return nil
+    end
+    redis.call('ZADD', ARGV[3] .. best, ARGV[5], ARGV[4])
+    local new_count = redis.call('ZCARD', ARGV[3] .. best)
+    redis.call('SET', ARGV[1] .. best, new_count)
+    return {best, new_count}
+    """
+    # Least-active selection over an explicit candidate list. KEYS are the n
+    # candidates' in-flight count keys followed by their lease keys; ARGV their
+    # weights, their caps (0 = unlimited), then the lease id and expiry.
+    # Returns {1-based index, new_count} or 0 when every candidate is at its cap.
+    CANDIDATE_SCRIPT = """
+    local n = #KEYS / 2
+    local best = nil
+    local best_load = nil
+    for i = 1, n do
+        local count = tonumber(redis.call('GET', KEYS[i]) or '0')
+        local cap = tonumber(ARGV[n + i] or '0')
+        local load = count / tonumber(ARGV[i] or '1')
+        if (cap <= 0 or count < cap) and (best_load == nil or load < best_load) then
+            best = i
+            best_load = load
+        end
+    end
+    if best == nil then
+        return 0
+    end
+    redis.call('ZADD', KEYS[n + best], ARGV[2 * n + 2], ARGV[2 * n + 1])
+    local new_count = redis.call('ZCARD', KEYS[n + best])
+    redis.call('SET', KEYS[best], new_count)
+    return {best, new_count}
+    """
+    # Add a lease. KEYS[1]: lease key, KEYS[2]: count key;
+    # ARGV[1]: lease id, ARGV[2]: expiry. Returns the new count.
+    LEASE_ACQUIRE_SCRIPT = """
+    redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+    local count = redis.call('ZCARD', KEYS[1])
+    redis.call('SET', KEYS[2], count)
+    return count
+    """
+    # Drop a lease (ARGV[1], may be empty) and every lease expired at ARGV[2].
+    # KEYS as for LEASE_ACQUIRE_SCRIPT. Returns the remaining count.
+    LEASE_RELEASE_SCRIPT = """
+    if ARGV[1] ~= '' then
+        redis.call('ZREM', KEYS[1], ARGV[1])
+    end
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+    local count = redis.call('ZCARD', KEYS[1])
+    redis.call('SET', KEYS[2], count)
+    return count
+    """
+    ROUTING_VERSION_KEY = "ha_routing_version"  # bumped whenever routing inputs change
+    STRATEGY_KEY = "ha_strategy"  # configured ProxyConfig.strategy
 
     def __init__(self, nodes: Optional[List[str]] = None, health_path: str = "/api/health") -> None:
         # nodes may be a list of base addresses (e.g. http://host:port)
@@ -35,13 +249,55 @@ class HAProxyManager:
             cache.set(self.ACTIVE_POOL_KEY, list(self.nodes))
         if cache.get(self.STANDBY_POOL_KEY) is None:
             cache.set(self.STANDBY_POOL_KEY, [])
-        self._client = httpx.AsyncClient(timeout=5.0)
+        # long-lived upstream clients (per node, per event loop) used by the proxy views
+        self.client_pool = UpstreamClientPool.from_settings()
         self._scheduler: Optional[BackgroundScheduler] = None
         # flag set for the process that acquires the leader lock — only that process
         # should perform CRUD operations against Redis (writes). Other workers
         # should only read from cache/Redis.
         self._is_leader = False
         self._leader_owner = None
+        # worker-local copy of the routing inputs (see `routing_snapshot`)
+        self._snapshot: Optional[dict] = None
+        self._snapshot_checked_at = 0.0
+        self._snapshot_lock = threading.Lock()
+        # background version check started by `arouting_snapshot`
+        self._snapshot_refresh: Optional[asyncio.Future] = None
+        # redis-py Script objects keyed by source (EVALSHA with NOSCRIPT fallback)
+        self._scripts: dict = {}
+        # the same scripts on the async clients of `aredis`
+        self._ascripts: dict = {}
+        # redis.asyncio clients for the routing and lease scripts of the async views
+        self.aredis = AsyncRedisClients.from_settings()
+        # requests waiting for a node below its concurrency cap
+        self.admission = AdmissionQueue.from_settings()
+        # per-node in-flight limits learned from latency and errors
+        self.concurrency = AdaptiveConcurrency.from_settings()
+        # lease ids held by this worker, per node (see `_new_lease`)
+        self._leases: dict[str, list[str]] = {}
+        self._leases_lock = threading.Lock()
+        self._lease_seq = itertools.count(1)
+        self._lease_owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._heartbeat: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+        # EWMA timings of proxied responses per node and model
+        self.traffic = TrafficStats.from_settings()
+        # per-node circuits opened by failing proxied requests
+        self.breaker = CircuitBreaker.from_settings()
+        # nodes temporarily ejected for being much slower than the fleet
+        self.outliers = OutlierDetector.from_settings()
+        # when to send a second copy of a slow request to another node
+        self.hedger = Hedger.from_settings()
+        # shares one upstream call between concurrent identical requests
+        self.coalescer = SingleFlight.from_settings()
+        # deterministic responses keyed by model digest
+        self.response_cache = ResponseCache.from_settings()
+        # merges concurrent small /api/embed requests into one upstream call
+        self.embed_batcher = EmbedBatcher.from_settings()
+        # on-disk embedding vectors shared by the workers of this host
+        self.embedding_store = EmbeddingStore.from_settings()
+        # worker-local copy of the published /api/tags aggregate (see `tags_payload`)
+        self._tags: Optional[Tuple[str, bytes]] = None
 
     def _can_write_cache(self) -> bool:
         """Return True if this manager instance is allowed to perform cache writes.
@@ -117,6 +373,7 @@ class HAProxyManager:
                 qs = NodeModel.objects.filter(active=True)
                 nodes_list = []
                 id_map = {}
+                meta = {}
                 for n in qs:
                     addr = (n.address or "").strip()
                     if n.port:
@@ -127,6 +384,7 @@ class HAProxyManager:
                     if addr:
                         nodes_list.append(addr)
                         id_map[str(n.id)] = addr
+                        meta[addr] = {"weight": n.weight, "max_concurrency": n.max_concurrency}
                 
                 # Also load inactive nodes for standby pool
                 standby_list = []
@@ -141,16 +399,21 @@ class HAProxyManager:
                     if addr:
                         standby_list.append(addr)
                         id_map[str(n.id)] = addr  # include in id_map
+                        meta[addr] = {"weight": n.weight, "max_concurrency": n.max_concurrency}
                 
-                return nodes_list, standby_list, id_map
+                return nodes_list, standby_list, id_map, meta
 
-            nodes, standby_nodes, id_map = await get_nodes()
+            nodes, standby_nodes, id_map, meta = await get_nodes()
+            strategy = await self._aget_strategy()
             self.nodes = nodes
             # only the leader should perform cache writes
             if self._can_write_cache():
                 cache.set(self.ACTIVE_POOL_KEY, list(nodes))
                 cache.set(self.STANDBY_POOL_KEY, standby_nodes)
                 cache.set(self.NODE_ID_MAP_KEY, id_map)
+                cache.set(self.NODE_META_KEY, meta)
+                cache.set(self.STRATEGY_KEY, strategy, None)
+                self._publish_routing_state()
             logger.info("HA manager refreshed nodes from DB (async): active=%s, standby=%s", nodes, standby_nodes)
             logger.debug("refresh_from_db_async: set ACTIVE_POOL_KEY=%s, STANDBY_POOL_KEY=%s, NODE_ID_MAP_KEY=%s", nodes, standby_nodes, id_map)
         except Exception as e:
@@ -179,6 +442,7 @@ class HAProxyManager:
 
             nodes: List[str] = []
             id_map: dict[str, str] = {}
+            meta: dict[str, dict] = {}
             for n in qs:
                 addr = (n.address or "").strip()
                 if n.port:
@@ -190,6 +454,7 @@ class HAProxyManager:
                 if addr:
                     nodes.append(addr)
                     id_map[str(n.id)] = addr
+                    meta[addr] = {"weight": n.weight, "max_concurrency": n.max_concurrency}
 
             # Also load inactive nodes into standby pool
             standby_nodes: List[str] = []
@@ -204,14 +469,21 @@ class HAProxyManager:
                 if addr:
                     standby_nodes.append(addr)
                     id_map[str(n.id)] = addr  # include in id_map
+                    meta[addr] = {"weight": n.weight, "max_concurrency": n.max_concurrency}
+
+            from proxy.models import ProxyConfig
+            cfg = ProxyConfig.objects.order_by("-updated_at").first()
 
             # update internal list and set cache active pool (leader only)
             self.nodes = nodes
             if self._can_write_cache():
                 cache.set(self.ACTIVE_POOL_KEY, list(nodes))
                 cache.set(self.NODE_ID_MAP_KEY, id_map)
+                cache.set(self.NODE_META_KEY, meta)
                 # Set standby pool from DB inactive nodes
                 cache.set(self.STANDBY_POOL_KEY, standby_nodes)
+                cache.set(self.STRATEGY_KEY, cfg.strategy if cfg else "least_active", None)
+                self._publish_routing_state()
             logger.info("HA manager refreshed nodes from DB: active=%s, standby=%s", nodes, standby_nodes)
             logger.debug("refresh_from_db: set ACTIVE_POOL_KEY=%s, STANDBY_POOL_KEY=%s, NODE_ID_MAP_KEY=%s", nodes, standby_nodes, id_map)
         except Exception as e:
@@ -290,6 +562,10 @@ class HAProxyManager:
                 # Always sync DB active=False for unhealthy nodes (ensure consistency)
                 await _sync_db_active_state(addr, False)
 
+        # latencies and pools changed: let workers rebuild their routing snapshot
+        if self._can_write_cache():
+            self._publish_routing_state()
+
     async def refresh_models_all(self) -> None:
         """Query each known node's `/api/tags` and store available model names.
 
@@ -308,6 +584,12 @@ class HAProxyManager:
 
         # track nodes that failed during model refresh
         failed_nodes = []
+        # collected model lists used to rebuild the inverted index
+        models_by_addr: dict[str, list[str]] = {}
+        # normalized model name -> digests reported by the nodes
+        digests: dict[str, set] = {}
+        # full /api/tags entries of the nodes that answered, for the aggregate
+        tags_by_addr: dict[str, list] = {}
 
         # query each node with a small retry/backoff
         for addr in all_nodes:
@@ -335,9 +617,12 @@ class HAProxyManager:
                     data = resp.json()
                     models = data.get("models") if isinstance(data, dict) else None
                     if isinstance(models, list):
+                        tags_by_addr[addr] = models
                         for m in models:
                             if isinstance(m, dict) and m.get("name"):
                                 models_list.append(m.get("name"))
+                                if m.get("digest"):
+                                    digests.setdefault(normalize_model_name(m["name"]), set()).add(m["digest"])
                 except Exception:
                     logger.debug("failed to parse /api/tags from %s", addr)
             else:
@@ -349,6 +634,7 @@ class HAProxyManager:
                 failed_nodes.append(addr)
                 logger.warning("node %s failed during model refresh - will mark as inactive immediately", addr)
 
+            models_by_addr[addr] = models_list
             # update cache and DB (cache writes only by leader)
             if self._can_write_cache():
                 cache.set(self.MODELS_KEY_PREFIX + addr, models_list)
@@ -373,6 +659,12 @@ class HAProxyManager:
                     logger.debug("failed to update node.available_models for %s: %s", addr, e)
 
         logger.info("model refresh complete (found %d failed nodes)", len(failed_nodes))
+        if self._can_write_cache():
+            cache.set(self.MODEL_INDEX_KEY, build_model_index(models_by_addr))
+            self._publish_model_digests(digests)
+            # with no node answering, drop the aggregate so /api/tags reports the outage
+            self.publish_tags(build_tags_payload(tags_by_addr) if tags_by_addr else None)
+            self._publish_routing_state()
 
         # Immediately move failed nodes to standby and update DB active=False
         if failed_nodes:
@@ -417,12 +709,316 @@ class HAProxyManager:
                 # Update cache pools
                 cache.set(self.ACTIVE_POOL_KEY, active)
                 cache.set(self.STANDBY_POOL_KEY, standby)
-    def choose_node(self, model_name: Optional[str] = None, strategy: Optional[str] = None) -> Optional[str]:
+                self._publish_routing_state()
+
+    async def refresh_running_all(self) -> None:
+        """Query each active node's `/api/ps` and store its resident models.
+
+        Stores {normalized model name: size_vram} under `ha_running:{addr}`
+        for the `warm_model` strategy. Leader only; unreachable nodes are left
+        to the health check.
+        """
+        if not self._can_write_cache():
+            return
+        active = cache.get(self.ACTIVE_POOL_KEY, []) or []
+
+        async def _fetch(client: httpx.AsyncClient, addr: str):
+            try:
+                resp = await client.get(addr.rstrip("/") + "/api/ps")
+                if resp.status_code != 200:
+                    return addr, None
+                data = resp.json()
+            except Exception as e:
+                logger.debug("refresh_running_all: /api/ps failed for %s: %s", addr, e)
+                return addr, None
+            running = {}
+            models = data.get("models") if isinstance(data, dict) else None
+            for m in models or []:
+                name = (m.get("name") or m.get("model")) if isinstance(m, dict) else None
+                if name:
+                    running[normalize_model_name(name)] = int(m.get("size_vram") or 0)
+            return addr, running
+
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            results = await asyncio.gather(*[_fetch(client, a) for a in active])
+
+        changed = False
+        for addr, running in results:
+            if running is None:
+                continue
+            key = self.RUNNING_KEY_PREFIX + addr
+            if cache.get(key) != running:
+                cache.set(key, running)
+                changed = True
+        if changed:
+            self._bump_routing_version()
+
+    def _load_model_index(self, active: List[str]) -> dict:
+        index = cache.get(self.MODEL_INDEX_KEY)
+        if isinstance(index, dict):
+            return index
+        # index not published yet (e.g. before the first model refresh): derive it
+        model_keys = [self.MODELS_KEY_PREFIX + a for a in active]
+        model_values = cache.get_many(model_keys) if model_keys else {}
+        return build_model_index({a: model_values.get(self.MODELS_KEY_PREFIX + a) for a in active})
+
+    def _publish_model_digests(self, digests: Dict[str, set]) -> None:
+        """Store `{model: digests}` for response cache keys, logging models that changed.
+
+        A model present on nodes with different digests gets all of them
+        (sorted and joined), so a re-pull on any node changes its key.
+        """
+        current = {name: ",".join(sorted(ds)) for name, ds in digests.items()}
+        previous = cache.get(self.MODEL_DIGESTS_KEY) or {}
+        changed = sorted(n for n in previous if previous[n] != current.get(n))
+        if changed:
+            logger.info("model digests changed for %s: cached responses invalidated", ", ".join(changed))
+        if current != previous:
+            cache.set(self.MODEL_DIGESTS_KEY, current, None)
+
+    def publish_tags(self, tags: Optional[Tuple[str, bytes]]) -> None:
+        """Store the aggregated `/api/tags` `(etag, body)` for every worker (None clears it).
+
+        Written by the leader's model refresh and by forced refreshes from
+        any process (like `publish_strategy`); workers pick up a new ETag with
+        their next routing snapshot.
+        """
+        try:
+            if cache.get(self.TAGS_ETAG_KEY) == (tags[0] if tags else None):
+                return
+            if tags is None:
+                cache.delete_many([self.TAGS_KEY, self.TAGS_ETAG_KEY])
+            else:
+                cache.set(self.TAGS_KEY, tags, None)
+                cache.set(self.TAGS_ETAG_KEY, tags[0], None)
+        except Exception as e:
+            logger.debug("publish_tags: cache write failed: %s", e)
+            return
+        self._tags = tags
+        self._bump_routing_version()
+
+    def tags_payload(self) -> Optional[Tuple[str, bytes]]:
+        """The published `/api/tags` `(etag, body)`, or None before the first model refresh.
+
+        The body is fetched from the cache only when the snapshot's ETag
+        differs from the worker-local copy.
+        """
+        etag = self.routing_snapshot().get("tags_etag")
+        if etag is None:
+            return None
+        tags = self._tags
+        if tags is not None and tags[0] == etag:
+            return tags
+        return self._load_tags()
+
+    async def atags_payload(self) -> Optional[Tuple[str, bytes]]:
+        """Async counterpart of `tags_payload`; a changed body is fetched off the event loop."""
+        etag = (await self.arouting_snapshot()).get("tags_etag")
+        if etag is None:
+            return None
+        tags = self._tags
+        if tags is not None and tags[0] == etag:
+            return tags
+        return await sync_to_async(self._load_tags, thread_sensitive=False)()
+
+    def _load_tags(self) -> Optional[Tuple[str, bytes]]:
+        try:
+            tags = cache.get(self.TAGS_KEY)
+        except Exception as e:
+            logger.debug("tags_payload: cache read failed: %s", e)
+            return None
+        if tags is not None:
+            self._tags = tags
+        return tags
+
+    def _publish_routing_state(self) -> None:
+        """Mirror pools and the model index into the raw sets used by ROUTE_SCRIPT.
+
+        Leader only; also bumps the routing version for worker snapshots.
+        """
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            active = cache.get(self.ACTIVE_POOL_KEY, []) or []
+            index = self._load_model_index(active)
+            meta = cache.get(self.NODE_META_KEY) or {}
+            published = {k.decode() if isinstance(k, bytes) else k for k in conn.smembers(self.ROUTE_MODEL_REGISTRY_KEY)}
+            wanted = {self.ROUTE_MODEL_SET_PREFIX + name for name, addrs in index.items() if addrs}
+            pipe = conn.pipeline(transaction=True)
+            pipe.delete(
+                self.ROUTE_ACTIVE_SET_KEY, self.ROUTE_WEIGHT_KEY, self.ROUTE_CAP_KEY,
+                *(published | wanted), self.ROUTE_MODEL_REGISTRY_KEY,
+            )
+            if active:
+                pipe.sadd(self.ROUTE_ACTIVE_SET_KEY, *active)
+            weights = {a: m.get("weight") or 1.0 for a, m in meta.items()}
+            if weights:
+                pipe.hset(self.ROUTE_WEIGHT_KEY, mapping=weights)
+            caps = {a: m["max_concurrency"] for a, m in meta.items() if m.get("max_concurrency")}
+            if caps:
+                pipe.hset(self.ROUTE_CAP_KEY, mapping=caps)
+            for name, addrs in index.items():
+                if addrs:
+                    pipe.sadd(self.ROUTE_MODEL_SET_PREFIX + name, *addrs)
+            if wanted:
+                pipe.sadd(self.ROUTE_MODEL_REGISTRY_KEY, *wanted)
+            pipe.execute()
+        except Exception as e:
+            logger.debug("_publish_routing_state: raw route sets not updated: %s", e)
+        self._bump_routing_version()
+
+    def _bump_routing_version(self) -> None:
+        """Signal all workers that pools/models/latencies/strategy changed."""
+        try:
+            cache.add(self.ROUTING_VERSION_KEY, 0, None)
+            cache.incr(self.ROUTING_VERSION_KEY)
+        except Exception as e:
+            logger.debug("_bump_routing_version failed: %s", e)
+        # our own writes are visible immediately in this worker
+        self._snapshot = None
+
+    def publish_strategy(self, strategy: str) -> None:
+        """Publish a ProxyConfig strategy change to every worker's snapshot.
+
+        Called from the process that saved the config (not only the leader),
+        so the change takes effect without waiting for the next DB refresh.
+        """
+        try:
+            cache.set(self.STRATEGY_KEY, strategy, None)
+        except Exception as e:
+            logger.debug("publish_strategy: cache write failed: %s", e)
+        self._bump_routing_version()
+
+    @staticmethod
+    def _default_cap() -> int:
+        from django.conf import settings
+        return getattr(settings, 'PROXY_NODE_MAX_CONCURRENCY', 0)
+
+    def _build_snapshot(self, version) -> dict:
+        active = cache.get(self.ACTIVE_POOL_KEY, []) or []
+        keys = [self.LATENCY_KEY_PREFIX + a for a in active]
+        keys += [self.RUNNING_KEY_PREFIX + a for a in active]
+        keys += [self.STRATEGY_KEY, self.MODEL_INDEX_KEY, self.NODE_META_KEY, self.MODEL_DIGESTS_KEY, self.TAGS_ETAG_KEY]
+        values = cache.get_many(keys)
+        index = values.get(self.MODEL_INDEX_KEY)
+        if not isinstance(index, dict):
+            index = self._load_model_index(active)
+        meta = values.get(self.NODE_META_KEY) or {}
+        return {
+            "version": version,
+            "active": list(active),
+            "active_set": frozenset(active),
+            "index": index,
+            "latencies": {a: values.get(self.LATENCY_KEY_PREFIX + a, float("inf")) for a in active},
+            "running": {a: values.get(self.RUNNING_KEY_PREFIX + a) or {} for a in active},
+            "weights": {a: (meta.get(a) or {}).get("weight") or 1.0 for a in active},
+            # 0 = unlimited
+            "caps": {a: (meta.get(a) or {}).get("max_concurrency") or self._default_cap() for a in active},
+            # ring over the whole active pool so a prefix keeps its node when
+            # other models come and go; callers filter it to their candidates
+            "ring": HashRing(active),
+            "strategy": values.get(self.STRATEGY_KEY),
+            "digests": values.get(self.MODEL_DIGESTS_KEY) or {},
+            "tags_etag": values.get(self.TAGS_ETAG_KEY),
+            "built_at": time.time(),
+        }
+
+    def routing_snapshot(self) -> dict:
+        """Return the worker-local routing snapshot (pools, model index, latencies, strategy).
+
+        The snapshot is rebuilt only when the shared `ROUTING_VERSION_KEY`
+        changes. The version itself is polled at most once per
+        `PROXY_ROUTING_SNAPSHOT_TTL` seconds, so a routing decision normally
+        costs no Redis round-trip besides the atomic in-flight increment.
+        """
+        from django.conf import settings
+        ttl = getattr(settings, 'PROXY_ROUTING_SNAPSHOT_TTL', 1.0)
+        now = time.monotonic()
+        snap = self._snapshot
+        if snap is not None and now - self._snapshot_checked_at < ttl:
+            return snap
+        with self._snapshot_lock:
+            snap = self._snapshot
+            if snap is not None and now - self._snapshot_checked_at < ttl:
+                return snap
+            try:
+                version = cache.get(self.ROUTING_VERSION_KEY)
+            except Exception as e:
+                logger.debug("routing_snapshot: version check failed: %s", e)
+                version = None
+            # an unversioned cache (no leader has published yet) is always re-read
+            if snap is None or version is None or snap["version"] != version:
+                snap = self._build_snapshot(version)
+                self._snapshot = snap
+                self.response_cache.sync_digests(snap["digests"])
+                logger.debug("routing_snapshot: rebuilt snapshot version=%s active=%d", version, len(snap["active"]))
+            self._snapshot_checked_at = now
+            return snap
+
+    async def arouting_snapshot(self) -> dict:
+        """`routing_snapshot` for the event loop, which never waits for the cache.
+
+        The worker-local snapshot is returned as is; once its TTL is up the
+        version check (and rebuild) runs on the default executor in the
+        background, for later calls to see. Only a worker without a snapshot
+        waits for one to be built, off the loop.
+        """
+        snap = self._snapshot
+        if snap is None:
+            return await sync_to_async(self.routing_snapshot, thread_sensitive=False)()
+        from django.conf import settings
+        ttl = getattr(settings, 'PROXY_ROUTING_SNAPSHOT_TTL', 1.0)
+        refresh = self._snapshot_refresh
+        if time.monotonic() - self._snapshot_checked_at >= ttl and (refresh is None or refresh.done()):
+            self._snapshot_refresh = asyncio.ensure_future(self._refresh_snapshot())
+        return snap
+
+    async def _refresh_snapshot(self) -> None:
+        try:
+            await sync_to_async(self.routing_snapshot, thread_sensitive=False)()
+        except Exception as e:
+            logger.debug("arouting_snapshot: background refresh failed: %s", e)
+
+    def model_nodes(self, model_name: Optional[str] = None) -> List[str]:
+        """Active nodes serving `model_name`, without open circuits and ejected outliers."""
+        candidates = self._candidates(self.routing_snapshot(), model_name)
+        return self.outliers.filter(self.breaker.filter(candidates))
+
+    async def amodel_nodes(self, model_name: Optional[str] = None) -> List[str]:
+        """Async counterpart of `model_nodes`."""
+        candidates = self._candidates(await self.arouting_snapshot(), model_name)
+        return self.outliers.filter(self.breaker.filter(candidates))
+
+    def model_digest(self, model_name: Optional[str]) -> Optional[str]:
+        """Digest(s) of `model_name` from the last model refresh (None if unknown)."""
+        return self.routing_snapshot()["digests"].get(normalize_model_name(model_name))
+
+    async def amodel_digest(self, model_name: Optional[str]) -> Optional[str]:
+        """Async counterpart of `model_digest`."""
+        return (await self.arouting_snapshot())["digests"].get(normalize_model_name(model_name))
+
+    def choose_node(
+        self,
+        model_name: Optional[str] = None,
+        strategy: Optional[str] = None,
+        affinity_key: Optional[str] = None,
+        exclude: Optional[List[str]] = None,
+    ) -> Optional[str]:
         """Choose a node automatically for a given model_name.
 
-        If strategy is None, the method will read ProxyConfig from DB.
+        `affinity_key` (a stable request prefix) is only used by the
+        `prefix_affinity` strategy; without it that strategy behaves like
+        `least_active`. Nodes in `exclude` (e.g. ones that already failed
+        this request) are never chosen.
+
+        Pools, the model index, latencies and the configured strategy come from the
+        worker-local routing snapshot. If strategy is None and the snapshot has
+        none, the method will read ProxyConfig from DB (sync context only).
         Returns the chosen node address (and increments active count), or None.
         """
+        snap = self.routing_snapshot()
+        if strategy is None:
+            strategy = snap.get("strategy")
         try:
             if strategy is None:
                 from proxy.models import ProxyConfig
@@ -439,209 +1035,796 @@ class HAProxyManager:
         except Exception:
             strategy = strategy or "least_active"
 
-        active = cache.get(self.ACTIVE_POOL_KEY, [])
-        if not active:
-            logger.warning("choose_node: no active nodes available")
+        plan = self._plan(snap, strategy, model_name, affinity_key, exclude)
+        if plan is None:
             return None
+        return self._routed(self._run_plan(plan), model_name)
 
-        logger.debug("choose_node: active pool has %d nodes: %s", len(active), active)
-
-        # filter candidates by model availability
-        if model_name:
-            candidates = []
-            for a in active:
-                models = cache.get(self.MODELS_KEY_PREFIX + a, [])
-                logger.debug("choose_node: node %s has models: %s", a, models)
-                if model_name in models:
-                    candidates.append(a)
-            logger.info("choose_node: filtered to %d candidates with model '%s' from %d active nodes", 
-                       len(candidates), model_name, len(active))
+    def _routed(self, chosen: Optional[str], model_name: Optional[str]) -> Optional[str]:
+        if chosen is None:
+            logger.debug("choose_node: every candidate for '%s' is at its concurrency cap", model_name)
         else:
-            candidates = list(active)
-            logger.debug("choose_node: no model filter, using all %d active nodes", len(candidates))
+            self.breaker.routed(chosen)
+        return chosen
 
+    def _plan(
+        self,
+        snap: dict,
+        strategy: Optional[str],
+        model_name: Optional[str] = None,
+        affinity_key: Optional[str] = None,
+        exclude: Optional[List[str]] = None,
+    ) -> Optional["_Plan"]:
+        """How `strategy` picks a node for `model_name` from `snap` (None without candidates).
+
+        The strategies only score nodes; the Redis calls they need are made
+        by `_run_plan` on the blocking client or by `_arun_plan` on the
+        async one.
+        """
+        candidates = self._candidates(snap, model_name, exclude)
         if not candidates:
             logger.warning("choose_node: no candidates available for model '%s'", model_name)
             return None
+        eligible = self.outliers.filter(self.breaker.filter(candidates))
 
-        chosen = None
+        weights = snap["weights"]
+        caps = self.concurrency.caps(snap["caps"], eligible)
         if strategy == "lowest_latency":
-            best_lat = float("inf")
-            for a in candidates:
-                lat = cache.get(self.LATENCY_KEY_PREFIX + a, float("inf"))
-                if lat < best_lat:
-                    best_lat = lat
-                    chosen = a
+            return self._plan_lowest_latency(eligible, snap["latencies"], weights, caps)
+        if strategy == "p2c":
+            return self._plan_p2c(eligible, snap["latencies"], weights, caps)
+        if strategy == "prefix_affinity" and affinity_key:
+            return self._plan_affinity(eligible, affinity_key, snap["ring"], weights, caps)
+        if strategy == "warm_model" and model_name:
+            return self._plan_warm(eligible, normalize_model_name(model_name), snap["running"], weights, caps)
+        if strategy == "expected_time" and model_name:
+            return self._plan_expected_time(eligible, normalize_model_name(model_name), weights, caps)
+        if strategy == "lowest_ttft" and model_name:
+            return self._plan_lowest_ttft(eligible, normalize_model_name(model_name), weights, caps)
+        if exclude or len(eligible) < len(candidates):
+            # ROUTE_SCRIPT picks from the whole active pool; score only the eligible nodes
+            return _Plan.tiered([eligible], weights, caps)
+        return _Plan.route(eligible, model_name, weights, caps)
+
+    @staticmethod
+    def _candidates(snap: dict, model_name: Optional[str] = None, exclude: Optional[List[str]] = None) -> List[str]:
+        """Active nodes able to serve `model_name` (inverted index, O(candidates))."""
+        active = snap.get("active") or []
+        if not model_name:
+            candidates = list(active)
         else:
-            # Use Redis Lua script for atomic "read all counts, choose min, increment"
-            # This prevents race condition where multiple requests choose the same node
+            active_set = snap["active_set"]
+            candidates = [a for a in snap["index"].get(normalize_model_name(model_name), []) if a in active_set]
+            logger.debug("choose_node: filtered to %d candidates with model '%s' from %d active nodes",
+                         len(candidates), model_name, len(active))
+        if exclude:
+            candidates = [a for a in candidates if a not in exclude]
+        return candidates
+
+    async def _aget_strategy(self) -> str:
+        """Read the configured selection strategy using the async ORM."""
+        try:
+            from proxy.models import ProxyConfig
+            cfg = await ProxyConfig.objects.order_by("-updated_at").afirst()
+            if cfg:
+                return cfg.strategy
+        except Exception as e:
+            logger.debug("_aget_strategy: failed to read ProxyConfig: %s", e)
+        return "least_active"
+
+    async def achoose_node(
+        self,
+        model_name: Optional[str] = None,
+        strategy: Optional[str] = None,
+        affinity_key: Optional[str] = None,
+        exclude: Optional[List[str]] = None,
+        wait: bool = True,
+    ) -> Optional[str]:
+        """Async counterpart of `choose_node` for the native async proxy views.
+
+        When every eligible node is at its concurrency cap the request waits
+        in the admission queue; NodesSaturated is raised if no slot frees up.
+        With `wait=False` None is returned instead of queueing.
+
+        The routing scripts are awaited on the async Redis client (see
+        `AsyncRedisClients`). Without one (the cache is not Redis) the
+        blocking selection runs on the default executor, not the
+        thread-sensitive one, so concurrent requests are not serialized.
+        """
+        if strategy is None:
+            # only fall back to the DB when no strategy has been published yet
+            strategy = (await self.arouting_snapshot()).get("strategy") or await self._aget_strategy()
+        conn = self.aredis.get()
+
+        async def _try_choose() -> Optional[str]:
+            if conn is None:
+                return await sync_to_async(self.choose_node, thread_sensitive=False)(
+                    model_name=model_name, strategy=strategy, affinity_key=affinity_key, exclude=exclude
+                )
+            plan = self._plan(await self.arouting_snapshot(), strategy, model_name, affinity_key, exclude)
+            if plan is None:
+                return None
+            return self._routed(await self._arun_plan(conn, plan), model_name)
+
+        chosen = await _try_choose()
+        if chosen is None and wait:
+            if self._candidates(await self.arouting_snapshot(), model_name, exclude):
+                # nodes exist but are all at their concurrency cap: wait for a slot
+                # (raises NodesSaturated when the queue is full or the wait times out)
+                chosen = await self.admission.wait_for_node(_try_choose)
+        return chosen
+
+    async def arelease_node(
+        self,
+        addr: str,
+        latency: Optional[float] = None,
+        ok: Optional[bool] = True,
+        model: Optional[str] = None,
+        ttfb: Optional[float] = None,
+        final: Optional[dict] = None,
+        notify: bool = True,
+    ) -> None:
+        """Async counterpart of `release_node`; the lease is dropped on the async Redis client."""
+        conn = self.aredis.get()
+        lease = self._pop_lease(addr) if conn is not None else None
+        if lease is None:
+            # no async client, or a claim taken through the cache fallback
+            await sync_to_async(self.release_node, thread_sensitive=False)(
+                addr, notify=notify, latency=latency, ok=ok, model=model, ttfb=ttfb, final=final
+            )
+            return
+        current = None
+        try:
+            remaining = await self._get_ascript(conn, self.LEASE_RELEASE_SCRIPT)(
+                keys=[self._lease_key(addr), self._active_count_key(addr)], args=[lease, time.time()], client=conn
+            )
+            current = int(remaining) + 1
+            logger.info("release_node: released lease %s, %s now at %s", lease, addr, remaining)
+        except Exception as e:
+            logger.warning("release_node: lease release failed (%s); %s expires with its TTL", e, lease)
+        self._released(addr, current, await self.arouting_snapshot(), notify, latency, ok, model, ttfb, final)
+
+    def get_client(self, addr: str) -> httpx.AsyncClient:
+        """Return the pooled upstream client for `addr` on the running event loop."""
+        return self.client_pool.get(addr)
+
+    async def warm_clients(self, addrs: Optional[List[str]] = None) -> None:
+        """Pre-open keep-alive connections to the given (default: active) nodes."""
+        if addrs is None:
+            addrs = cache.get(self.ACTIVE_POOL_KEY, []) or list(self.nodes)
+        await self.client_pool.warm(addrs)
+
+    def runtime_stats(self) -> dict:
+        """Worker-local runtime statistics exposed by `/api/proxy/state`."""
+        return {
+            "pools": self.client_pool.stats(),
+            "admission": self.admission.stats(),
+            "concurrency": self.concurrency.stats(),
+            "leases": self.held_leases(),
+            "circuits": self.breaker.stats(),
+            "outliers": self.outliers.stats(),
+            "hedging": self.hedger.stats(),
+            "coalescing": self.coalescer.stats(),
+            "response_cache": self.response_cache.stats(),
+            "embed_batching": self.embed_batcher.stats(),
+            "embedding_store": self.embedding_store.stats(),
+        }
+
+    def held_leases(self) -> Dict[str, int]:
+        """{addr: number of in-flight leases held by this worker}."""
+        with self._leases_lock:
+            return {a: len(ids) for a, ids in self._leases.items() if ids}
+
+    def traffic_stats(self, addr: str) -> dict:
+        """Worker-local EWMA response statistics of `addr`, keyed by model."""
+        return self.traffic.node_stats(addr)
+
+    def _active_count_key(self, addr: str) -> str:
+        return self.ACTIVE_COUNT_KEY_PREFIX + addr
+
+    def _lease_key(self, addr: str) -> str:
+        return self.LEASE_KEY_PREFIX + addr
+
+    @staticmethod
+    def _lease_ttl() -> float:
+        from django.conf import settings
+        return getattr(settings, 'PROXY_LEASE_TTL', 60.0)
+
+    def _new_lease(self) -> tuple[str, float]:
+        """Return a fresh (lease id, expiry timestamp) owned by this worker."""
+        return f"{self._lease_owner}:{next(self._lease_seq)}", time.time() + self._lease_ttl()
+
+    def _hold_lease(self, addr: str, lease: str) -> None:
+        with self._leases_lock:
+            self._leases.setdefault(addr, []).append(lease)
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(
+                    target=self._heartbeat_loop, name="ha-lease-heartbeat", daemon=True
+                )
+                self._heartbeat.start()
+
+    def _pop_lease(self, addr: str) -> Optional[str]:
+        # leases of one node are interchangeable; the newest one is popped so
+        # `_claim` rolls back exactly the lease it just took
+        with self._leases_lock:
+            held = self._leases.get(addr)
+            return held.pop() if held else None
+
+    def _heartbeat_loop(self) -> None:
+        while not self._closing.wait(self._lease_ttl() / 3):
+            self.renew_leases()
+
+    def renew_leases(self) -> None:
+        """Push the expiry of every lease held by this worker (long streams).
+
+        ZADD XX never re-creates a lease that was already reaped.
+        """
+        with self._leases_lock:
+            held = {a: list(ids) for a, ids in self._leases.items() if ids}
+        if not held:
+            return
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            expiry = time.time() + self._lease_ttl()
+            pipe = conn.pipeline(transaction=False)
+            for addr, ids in held.items():
+                pipe.zadd(self._lease_key(addr), {lease: expiry for lease in ids}, xx=True)
+            pipe.execute()
+        except Exception as e:
+            logger.debug("renew_leases: heartbeat failed: %s", e)
+
+    def reap_leases(self) -> None:
+        """Drop expired leases (crashed workers) and re-derive the in-flight counts. Leader only."""
+        if not self._can_write_cache():
+            return
+        active = cache.get(self.ACTIVE_POOL_KEY, []) or []
+        standby = cache.get(self.STANDBY_POOL_KEY, []) or []
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            script = self._get_script(conn, self.LEASE_RELEASE_SCRIPT)
+            now = time.time()
+            for addr in {*active, *standby, *self.nodes}:
+                script(keys=[self._lease_key(addr), self._active_count_key(addr)], args=["", now], client=conn)
+        except Exception as e:
+            logger.debug("reap_leases: failed: %s", e)
+
+    def _get_script(self, conn, source: str):
+        script = self._scripts.get(source)
+        if script is None:
+            script = conn.register_script(source)
             try:
-                from django_redis import get_redis_connection
-                conn = get_redis_connection('default')
-                
-                # Build list of keys for all candidate nodes
-                keys = [self._active_count_key(a) for a in candidates]
-                
-                # Debug: log current counts before selection
-                current_counts = {}
-                for a in candidates:
-                    try:
-                        val = conn.get(self._active_count_key(a))
-                        if val is not None:
-                            current_counts[a] = int(val) if isinstance(val, (bytes, str)) else val
-                        else:
-                            current_counts[a] = 0
-                    except Exception:
-                        current_counts[a] = 0
-                logger.info("choose_node: current counts before selection: %s", current_counts)
-                
-                # Lua script: get all counts, find index of minimum, increment that key
-                # KEYS: array of count keys
-                # Returns: {chosen_index (1-based), new_count, chosen_addr}
-                lua_script = """
-                local min_count = nil
-                local min_idx = 1
-                for i, key in ipairs(KEYS) do
-                    local count = redis.call('GET', key)
-                    if count == false then
-                        count = 0
-                    else
-                        count = tonumber(count)
-                    end
-                    if min_count == nil or count < min_count then
-                        min_count = count
-                        min_idx = i
-                    end
-                end
-                local chosen_key = KEYS[min_idx]
-                local new_count = redis.call('INCR', chosen_key)
-                return {min_idx, new_count}
-                """
-                
-                result = conn.eval(lua_script, len(keys), *keys)
-                chosen_idx = int(result[0]) - 1  # Lua is 1-based, Python is 0-based
-                new_count = int(result[1])
-                chosen = candidates[chosen_idx]
-                logger.info("choose_node: atomically chose %s with new count %s (had %d candidates)", 
-                           chosen, new_count, len(candidates))
+                # preload so the first EVALSHA does not hit NOSCRIPT
+                conn.script_load(source)
             except Exception as e:
-                logger.warning("choose_node: Redis Lua script failed (%s), falling back to non-atomic", e)
-                # Fallback to non-atomic operation
-                best_cnt = None
-                for a in candidates:
-                    try:
-                        from django_redis import get_redis_connection
-                        conn = get_redis_connection('default')
-                        val = conn.get(self._active_count_key(a))
-                        if val is not None:
-                            cnt = int(val) if isinstance(val, (bytes, str)) else val
-                        else:
-                            cnt = 0
-                    except Exception:
-                        cnt = cache.get(self._active_count_key(a), 0)
-                    
-                    if best_cnt is None or cnt < best_cnt:
-                        best_cnt = cnt
-                        chosen = a
-                
-                # Increment after choosing (non-atomic fallback)
+                logger.debug("_get_script: SCRIPT LOAD failed: %s", e)
+            self._scripts[source] = script
+        return script
+
+    def _get_ascript(self, conn, source: str):
+        """Async counterpart of `_get_script` (same source, so the SHA loaded by `_get_script`)."""
+        script = self._ascripts.get(source)
+        if script is None:
+            # EVALSHA first, SCRIPT LOAD only on NOSCRIPT
+            script = self._ascripts[source] = conn.register_script(source)
+        return script
+
+    def _run_plan(self, plan: "_Plan") -> Optional[str]:
+        """Carry out `plan` on the blocking Redis client; returns the claimed node or None."""
+        if plan.kind == "route":
+            return self._pick_least_active(plan.addrs, plan.model, plan.weights, plan.caps)
+        if plan.kind == "tiers":
+            for tier in plan.tiers:
+                chosen = self._pick_least_active_among(tier, plan.weights, plan.caps)
                 if chosen:
-                    key = self._active_count_key(chosen)
-                    try:
-                        from django_redis import get_redis_connection
-                        conn = get_redis_connection('default')
-                        new_val = conn.incr(key)
-                        logger.info("choose_node: incremented %s to %s (addr=%s) [fallback]", key, new_val, chosen)
-                    except Exception as e2:
-                        logger.warning("choose_node: Redis INCR failed (%s), falling back to cache", e2)
-                        if self._can_write_cache():
-                            cache.set(key, cache.get(key, 0) + 1)
+                    return chosen
+            return None
+        conn, counts = self._read_counts(plan.addrs)
+        chosen = plan.choose(dict(zip(plan.addrs, counts)))
+        if chosen and not self._claim(conn, chosen, plan.caps):
+            return None
         return chosen
 
-    def _active_count_key(self, addr: str) -> str:
-        return self.ACTIVE_COUNT_KEY_PREFIX + addr
+    async def _arun_plan(self, conn, plan: "_Plan") -> Optional[str]:
+        """Async counterpart of `_run_plan` on the async Redis client `conn`."""
+        if plan.kind == "route":
+            return await self._apick_least_active(conn, plan.addrs, plan.model, plan.weights, plan.caps)
+        if plan.kind == "tiers":
+            for tier in plan.tiers:
+                chosen = await self._apick_least_active_among(conn, tier, plan.weights, plan.caps)
+                if chosen:
+                    return chosen
+            return None
+        counts = await self._aread_counts(conn, plan.addrs)
+        chosen = plan.choose(dict(zip(plan.addrs, counts)))
+        if chosen and not await self._aclaim(conn, chosen, plan.caps):
+            return None
+        return chosen
+
+    def _route_call(self, model_name: Optional[str]) -> Tuple[list, list, str]:
+        """(KEYS, ARGV, lease id) of a ROUTE_SCRIPT call."""
+        keys = [self.ROUTE_ACTIVE_SET_KEY, self.ROUTE_WEIGHT_KEY, self.ROUTE_CAP_KEY]
+        if model_name:
+            keys.append(self.ROUTE_MODEL_SET_PREFIX + normalize_model_name(model_name))
+        lease, expiry = self._new_lease()
+        return keys, [self.ACTIVE_COUNT_KEY_PREFIX, self._default_cap(), self.LEASE_KEY_PREFIX, lease, expiry], lease
+
+    def _candidate_call(
+        self, candidates: List[str], weights: Optional[dict], caps: Optional[dict]
+    ) -> Tuple[list, list, str]:
+        """(KEYS, ARGV, lease id) of a CANDIDATE_SCRIPT call."""
+        keys = [self._active_count_key(a) for a in candidates]
+        keys += [self._lease_key(a) for a in candidates]
+        args = [(weights or {}).get(a) or 1.0 for a in candidates]
+        args += [(caps or {}).get(a) or 0 for a in candidates]
+        lease, expiry = self._new_lease()
+        return keys, args + [lease, expiry], lease
+
+    def _pick_least_active(
+        self,
+        candidates: List[str],
+        model_name: Optional[str] = None,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> Optional[str]:
+        """Pick the least-utilized node below its cap and increment its in-flight counter.
+
+        Utilization is the in-flight count divided by the node weight, so a
+        node with weight 4 takes four times the requests of a weight 1 node.
+
+        `candidates` is the snapshot's view of eligible nodes; ROUTE_SCRIPT
+        re-checks pool and model membership server-side so the choice and the
+        increment are atomic. Falls back to a non-atomic scan of `candidates`
+        when Redis (or the published route sets) are unavailable. Returns None
+        when every candidate is at its cap.
+
+        ROUTE_SCRIPT only knows the published static caps, so with adaptive
+        concurrency the worker's learned `caps` go through CANDIDATE_SCRIPT.
+        """
+        if self.concurrency.enabled:
+            return self._pick_least_active_among(candidates, weights, caps)
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            keys, args, lease = self._route_call(model_name)
+            result = self._get_script(conn, self.ROUTE_SCRIPT)(keys=keys, args=args, client=conn)
+            if result == 0:
+                logger.debug("_pick_least_active: every candidate is at its concurrency cap")
+                return None
+            if result:
+                chosen = result[0].decode() if isinstance(result[0], bytes) else result[0]
+                self._hold_lease(chosen, lease)
+                logger.debug("_pick_least_active: atomically chose %s with new count %s", chosen, result[1])
+                return chosen
+            logger.debug("_pick_least_active: route script found no node (route sets not published?), scanning snapshot")
+        except Exception as e:
+            logger.warning("_pick_least_active: Redis routing script failed (%s), falling back to non-atomic", e)
+        return self._run_plan(self._plan_least_loaded(candidates, weights, caps))
+
+    async def _apick_least_active(
+        self,
+        conn,
+        candidates: List[str],
+        model_name: Optional[str] = None,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> Optional[str]:
+        """Async counterpart of `_pick_least_active` on the async Redis client `conn`."""
+        if self.concurrency.enabled:
+            return await self._apick_least_active_among(conn, candidates, weights, caps)
+        try:
+            keys, args, lease = self._route_call(model_name)
+            result = await self._get_ascript(conn, self.ROUTE_SCRIPT)(keys=keys, args=args, client=conn)
+            if result == 0:
+                logger.debug("_pick_least_active: every candidate is at its concurrency cap")
+                return None
+            if result:
+                chosen = result[0].decode() if isinstance(result[0], bytes) else result[0]
+                self._hold_lease(chosen, lease)
+                logger.debug("_pick_least_active: atomically chose %s with new count %s", chosen, result[1])
+                return chosen
+            logger.debug("_pick_least_active: route script found no node (route sets not published?), scanning snapshot")
+        except Exception as e:
+            logger.warning("_pick_least_active: Redis routing script failed (%s), falling back to non-atomic", e)
+        return await self._arun_plan(conn, self._plan_least_loaded(candidates, weights, caps))
+
+    def _pick_least_active_among(
+        self,
+        candidates: List[str],
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> Optional[str]:
+        """Least-utilized pick restricted to exactly `candidates` (atomic via CANDIDATE_SCRIPT)."""
+        if not candidates:
+            return None
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            keys, args, lease = self._candidate_call(candidates, weights, caps)
+            result = self._get_script(conn, self.CANDIDATE_SCRIPT)(keys=keys, args=args, client=conn)
+            if result == 0:
+                logger.debug("_pick_least_active_among: every candidate is at its concurrency cap")
+                return None
+            if result:
+                chosen = candidates[int(result[0]) - 1]
+                self._hold_lease(chosen, lease)
+                logger.debug("_pick_least_active_among: atomically chose %s with new count %s", chosen, result[1])
+                return chosen
+        except Exception as e:
+            logger.warning("_pick_least_active_among: Redis script failed (%s), falling back to non-atomic", e)
+        return self._run_plan(self._plan_least_loaded(candidates, weights, caps))
+
+    async def _apick_least_active_among(
+        self,
+        conn,
+        candidates: List[str],
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> Optional[str]:
+        """Async counterpart of `_pick_least_active_among` on the async Redis client `conn`."""
+        if not candidates:
+            return None
+        try:
+            keys, args, lease = self._candidate_call(candidates, weights, caps)
+            result = await self._get_ascript(conn, self.CANDIDATE_SCRIPT)(keys=keys, args=args, client=conn)
+            if result == 0:
+                logger.debug("_pick_least_active_among: every candidate is at its concurrency cap")
+                return None
+            if result:
+                chosen = candidates[int(result[0]) - 1]
+                self._hold_lease(chosen, lease)
+                logger.debug("_pick_least_active_among: atomically chose %s with new count %s", chosen, result[1])
+                return chosen
+        except Exception as e:
+            logger.warning("_pick_least_active_among: Redis script failed (%s), falling back to non-atomic", e)
+        return await self._arun_plan(conn, self._plan_least_loaded(candidates, weights, caps))
+
+    def _plan_least_loaded(
+        self,
+        candidates: List[str],
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Non-atomic fallback of the routing scripts: claim the least-utilized scanned node."""
+        weights = weights or {}
+        caps = caps or {}
+
+        def choose(counts: dict) -> Optional[str]:
+            chosen = None
+            best_load = None
+            for a in candidates:
+                cnt = counts[a]
+                if caps.get(a) and cnt >= caps[a]:
+                    continue
+                load = cnt / (weights.get(a) or 1.0)
+                if best_load is None or load < best_load:
+                    best_load = load
+                    chosen = a
+            return chosen
+
+        return _Plan.scored(candidates, choose, weights, caps)
+
+    def _plan_warm(
+        self,
+        candidates: List[str],
+        model: str,
+        running: dict,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Prefer nodes that already hold `model` in memory (per `/api/ps`).
+
+        Without a warm node, prefer the nodes with the least VRAM in use by
+        resident models (the most room for a cold load). Ties are broken by
+        the in-flight counters, so the usual release_node() accounting applies.
+        A warm node at its cap yields to the cold candidates.
+        """
+        warm = [a for a in candidates if model in running.get(a, {})]
+        tiers = [warm] if warm else []
+        if warm:
+            logger.debug("_plan_warm: %s resident on %s", model, warm)
+        cold = [a for a in candidates if a not in warm]
+        used = {a: sum(running.get(a, {}).values()) for a in cold}
+        for level in sorted(set(used.values())):
+            roomiest = [a for a in cold if used[a] == level]
+            logger.debug("_plan_warm: %s not resident, candidates with %s VRAM in use: %s", model, level, roomiest)
+            tiers.append(roomiest)
+        return _Plan.tiered(tiers, weights, caps)
+
+    def _plan_lowest_latency(
+        self,
+        candidates: List[str],
+        latencies: dict,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Claim the candidate with the lowest health-check latency (counts are read only for caps)."""
+        caps = caps or {}
+        capped = any(caps.get(a) for a in candidates)
+
+        def choose(counts: dict) -> Optional[str]:
+            chosen = None
+            best_lat = float("inf")
+            for a in candidates:
+                if capped and caps.get(a) and counts[a] >= caps[a]:
+                    continue
+                lat = latencies.get(a, float("inf"))
+                if chosen is None or lat < best_lat:
+                    best_lat = lat
+                    chosen = a
+            return chosen
+
+        return _Plan.scored(candidates if capped else [], choose, weights, caps)
+
+    def _plan_p2c(
+        self,
+        candidates: List[str],
+        latencies: dict,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Power-of-two-choices: sample two candidates, keep the lower score.
+
+        Score is (in-flight + 1) * health-check latency / weight, so an idle
+        slow node can still beat a busy fast one. Costs one MGET of the two
+        sampled nodes and one INCR regardless of the number of candidates
+        (the MGET covers every candidate when caps are configured, to sample
+        only nodes below their cap); the chosen node's counter is incremented
+        so release_node() accounting is unchanged.
+        """
+        caps = caps or {}
+        weights = weights or {}
+        capped = any(caps.get(a) for a in candidates)
+        sample = None if capped else (random.sample(candidates, 2) if len(candidates) > 2 else list(candidates))
+
+        # nodes without a measured latency score like the slowest known node
+        known = [v for v in latencies.values() if v is not None and v != float("inf")]
+        default_lat = max(known) if known else 1.0
+
+        def choose(counts: dict) -> Optional[str]:
+            pool = sample
+            if pool is None:
+                open_nodes = [a for a in candidates if not caps.get(a) or counts[a] < caps[a]]
+                pool = random.sample(open_nodes, 2) if len(open_nodes) > 2 else open_nodes
+            chosen = None
+            best_score = None
+            for a in pool:
+                lat = latencies.get(a)
+                if lat is None or lat == float("inf"):
+                    lat = default_lat
+                score = (counts[a] + 1) * lat / (weights.get(a) or 1.0)
+                if best_score is None or score < best_score:
+                    best_score = score
+                    chosen = a
+            logger.debug("_plan_p2c: chose %s from %s", chosen, pool)
+            return chosen
+
+        return _Plan.scored(candidates if capped else sample, choose, weights, caps)
+
+    def _plan_affinity(
+        self,
+        candidates: List[str],
+        affinity_key: str,
+        ring: HashRing,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Consistent-hash `affinity_key` onto the candidates, with bounded load.
+
+        Requests sharing a prompt prefix land on the same node so Ollama can
+        reuse its KV cache. A node is skipped while its in-flight count is at
+        `PROXY_AFFINITY_LOAD_FACTOR` times its weighted share of the
+        candidates' load (or at its hard cap); the request then spills over to
+        the next node on the ring.
+        """
+        from django.conf import settings
+        factor = getattr(settings, 'PROXY_AFFINITY_LOAD_FACTOR', 1.25)
+        caps = caps or {}
+        share = {a: (weights or {}).get(a) or 1.0 for a in candidates}
+        total_weight = sum(share.values())
+
+        def choose(load: dict) -> Optional[str]:
+            if not load:
+                return None
+            total = sum(load.values())
+            for rank, addr in enumerate(ring.walk(affinity_key)):
+                if addr not in load:
+                    continue
+                cap = math.ceil(factor * (total + 1) * share[addr] / total_weight)
+                if caps.get(addr):
+                    cap = min(cap, caps[addr])
+                if load[addr] < cap:
+                    if rank:
+                        logger.debug("_plan_affinity: spilled over to %s (rank %d, cap %d)", addr, rank, cap)
+                    return addr
+            # candidates outside the snapshot ring (pool changed mid-request)
+            open_nodes = [a for a in candidates if not caps.get(a) or load[a] < caps[a]]
+            if not open_nodes:
+                return None
+            return min(open_nodes, key=lambda a: load[a] / share[a])
+
+        return _Plan.scored(candidates, choose, weights, caps)
+
+    def _plan_expected_time(
+        self,
+        candidates: List[str],
+        model: str,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Pick the node with the lowest expected completion time for `model`.
+
+        The idle completion time measured from real traffic (see
+        `TrafficStats.expected_time`) is multiplied by (in-flight + 1) and
+        divided by the weight, like the p2c score. Nodes without samples for
+        the model score like the slowest measured node; without any samples
+        this falls back to least-active.
+        """
+        expected = {a: self.traffic.expected_time(a, model) for a in candidates}
+        known = [t for t in expected.values() if t is not None]
+        if not known:
+            return _Plan.tiered([candidates], weights, caps)
+        default = max(known)
+        return self._plan_min_time(
+            candidates, {a: default if t is None else t for a, t in expected.items()}, weights, caps
+        )
+
+    def _plan_lowest_ttft(
+        self,
+        candidates: List[str],
+        model: str,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Pick the node with the lowest p95 time to first token for `model`.
+
+        The p95 is multiplied by (in-flight + 1) and divided by the weight.
+        Nodes without recent streamed samples (new, or recovering after their
+        old samples decayed) score like the fastest measured node so they get
+        probed again; without any samples this falls back to least-active.
+        """
+        p95 = {}
+        for a in candidates:
+            ttft = self.traffic.ttft(a, model)
+            p95[a] = ttft["p95"] if ttft else None
+        known = [t for t in p95.values() if t is not None]
+        if not known:
+            return _Plan.tiered([candidates], weights, caps)
+        default = min(known)
+        return self._plan_min_time(
+            candidates, {a: default if t is None else t for a, t in p95.items()}, weights, caps
+        )
+
+    def _plan_min_time(
+        self,
+        candidates: List[str],
+        times: dict,
+        weights: Optional[dict] = None,
+        caps: Optional[dict] = None,
+    ) -> "_Plan":
+        """Claim the node below its cap with the lowest (in-flight + 1) * time / weight."""
+        caps = caps or {}
+        weights = weights or {}
+
+        def choose(counts: dict) -> Optional[str]:
+            chosen = None
+            best_score = None
+            for a in candidates:
+                cnt = counts[a]
+                if caps.get(a) and cnt >= caps[a]:
+                    continue
+                score = (cnt + 1) * times[a] / (weights.get(a) or 1.0)
+                if best_score is None or score < best_score:
+                    best_score = score
+                    chosen = a
+            if chosen is not None:
+                logger.debug("_plan_min_time: chose %s (score %.3fs)", chosen, best_score)
+            return chosen
+
+        return _Plan.scored(candidates, choose, weights, caps)
+
+    def _read_counts(self, addrs: List[str]):
+        """Return (redis connection or None, in-flight counts for `addrs`) with one MGET."""
+        keys = [self._active_count_key(a) for a in addrs]
+        try:
+            from django_redis import get_redis_connection
+            conn = get_redis_connection('default')
+            return conn, [int(v) if v is not None else 0 for v in conn.mget(keys)] if keys else []
+        except Exception as e:
+            logger.debug("_read_counts: Redis MGET failed (%s), reading counts from cache", e)
+            values = cache.get_many(keys)
+            return None, [int(values.get(k, 0) or 0) for k in keys]
+
+    async def _aread_counts(self, conn, addrs: List[str]) -> List[int]:
+        """Async counterpart of `_read_counts` on the async Redis client `conn`."""
+        keys = [self._active_count_key(a) for a in addrs]
+        if not keys:
+            return []
+        try:
+            return [int(v) if v is not None else 0 for v in await conn.mget(keys)]
+        except Exception as e:
+            logger.debug("_read_counts: Redis MGET failed (%s), reading counts from cache", e)
+            values = await sync_to_async(cache.get_many, thread_sensitive=False)(keys)
+            return [int(values.get(k, 0) or 0) for k in keys]
+
+    def _incr_count(self, conn, addr: str) -> Optional[int]:
+        """Take a lease on `addr` and return its new in-flight count."""
+        key = self._active_count_key(addr)
+        try:
+            if conn is None:
+                raise RuntimeError("no redis connection")
+            lease, expiry = self._new_lease()
+            new_val = self._get_script(conn, self.LEASE_ACQUIRE_SCRIPT)(
+                keys=[self._lease_key(addr), key], args=[lease, expiry], client=conn
+            )
+            self._hold_lease(addr, lease)
+            logger.debug("_incr_count: leased %s on %s, count %s", lease, addr, new_val)
+            return int(new_val)
+        except Exception as e:
+            logger.warning("_incr_count: Redis lease failed (%s), falling back to cache", e)
+            return self._incr_cached_count(key)
+
+    async def _aincr_count(self, conn, addr: str) -> Optional[int]:
+        """Async counterpart of `_incr_count` on the async Redis client `conn`."""
+        key = self._active_count_key(addr)
+        try:
+            lease, expiry = self._new_lease()
+            new_val = await self._get_ascript(conn, self.LEASE_ACQUIRE_SCRIPT)(
+                keys=[self._lease_key(addr), key], args=[lease, expiry], client=conn
+            )
+            self._hold_lease(addr, lease)
+            logger.debug("_incr_count: leased %s on %s, count %s", lease, addr, new_val)
+            return int(new_val)
+        except Exception as e:
+            logger.warning("_incr_count: Redis lease failed (%s), falling back to cache", e)
+            return await sync_to_async(self._incr_cached_count, thread_sensitive=False)(key)
+
+    def _incr_cached_count(self, key: str) -> Optional[int]:
+        if self._can_write_cache():
+            new_val = cache.get(key, 0) + 1
+            cache.set(key, new_val)
+            return new_val
+        return None
+
+    def _claim(self, conn, addr: str, caps: Optional[dict] = None) -> bool:
+        """Increment `addr`'s in-flight counter unless that would exceed its cap.
+
+        The pickers that choose from an MGET (not a script) may race with
+        other workers; a claim that lands above the cap is rolled back.
+        """
+        new_val = self._incr_count(conn, addr)
+        cap = (caps or {}).get(addr) or 0
+        if cap and new_val is not None and new_val > cap:
+            logger.debug("_claim: %s over its cap (%s > %s), rolling back", addr, new_val, cap)
+            self.release_node(addr, notify=False)
+            return False
+        return True
+
+    async def _aclaim(self, conn, addr: str, caps: Optional[dict] = None) -> bool:
+        """Async counterpart of `_claim` on the async Redis client `conn`."""
+        new_val = await self._aincr_count(conn, addr)
+        cap = (caps or {}).get(addr) or 0
+        if cap and new_val is not None and new_val > cap:
+            logger.debug("_claim: %s over its cap (%s > %s), rolling back", addr, new_val, cap)
+            await self.arelease_node(addr, notify=False)
+            return False
+        return True
 
     def acquire_node(self, strategy: str = "least_active") -> Optional[str]:
-        active = cache.get(self.ACTIVE_POOL_KEY, [])
+        snap = self.routing_snapshot()
+        active = snap["active"]
         if not active:
             return None
 
+        caps = self.concurrency.caps(snap["caps"], active)
         if strategy == "lowest_latency":
-            best = None
-            best_lat = float("inf")
-            for a in active:
-                lat = cache.get(self.LATENCY_KEY_PREFIX + a, float("inf"))
-                if lat < best_lat:
-                    best = a
-                    best_lat = lat
-            chosen = best
+            plan = self._plan_lowest_latency(active, snap["latencies"], snap["weights"], caps)
+        elif strategy == "p2c":
+            plan = self._plan_p2c(active, snap["latencies"], snap["weights"], caps)
         else:  # least_active
-            # Use Redis Lua script for atomic "read all counts, choose min, increment"
-            try:
-                from django_redis import get_redis_connection
-                conn = get_redis_connection('default')
-                
-                keys = [self._active_count_key(a) for a in active]
-                
-                lua_script = """
-                local min_count = nil
-                local min_idx = 1
-                for i, key in ipairs(KEYS) do
-                    local count = redis.call('GET', key)
-                    if count == false then
-                        count = 0
-                    else
-                        count = tonumber(count)
-                    end
-                    if min_count == nil or count < min_count then
-                        min_count = count
-                        min_idx = i
-                    end
-                end
-                local chosen_key = KEYS[min_idx]
-                local new_count = redis.call('INCR', chosen_key)
-                return {min_idx, new_count}
-                """
-                
-                result = conn.eval(lua_script, len(keys), *keys)
-                chosen_idx = int(result[0]) - 1
-                new_count = int(result[1])
-                chosen = active[chosen_idx]
-                logger.info("acquire_node: atomically chose %s with new count %s (had %d nodes)", 
-                           chosen, new_count, len(active))
-            except Exception as e:
-                logger.warning("acquire_node: Redis Lua script failed (%s), falling back", e)
-                # Fallback to non-atomic
-                chosen = None
-                best_cnt = None
-                for a in active:
-                    try:
-                        from django_redis import get_redis_connection
-                        conn = get_redis_connection('default')
-                        val = conn.get(self._active_count_key(a))
-                        if val is not None:
-                            cnt = int(val) if isinstance(val, (bytes, str)) else val
-                        else:
-                            cnt = 0
-                    except Exception:
-                        cnt = cache.get(self._active_count_key(a), 0)
-                    
-                    if best_cnt is None or cnt < best_cnt:
-                        best_cnt = cnt
-                        chosen = a
-                
-                if chosen:
-                    key = self._active_count_key(chosen)
-                    try:
-                        from django_redis import get_redis_connection
-                        conn = get_redis_connection('default')
-                        new_val = conn.incr(key)
-                        logger.info("acquire_node: incremented %s to %s (addr=%s) [fallback]", key, new_val, chosen)
-                    except Exception as e2:
-                        logger.warning("acquire_node: Redis INCR failed (%s), falling back to cache", e2)
-                        if self._can_write_cache():
-                            cache.set(key, cache.get(key, 0) + 1)
-        return chosen
+            plan = _Plan.route(active, None, snap["weights"], caps)
+        return self._run_plan(plan)
 
     def get_address_for_node_id(self, node_id: int) -> Optional[str]:
         """Return the configured address for a node id, or None if not found."""
@@ -683,46 +1866,88 @@ class HAProxyManager:
         active = cache.get(self.ACTIVE_POOL_KEY, [])
         if addr not in active:
             return None
-        key = self._active_count_key(addr)
-        # Use Redis INCR for atomic increment (works from any worker)
         try:
             from django_redis import get_redis_connection
             conn = get_redis_connection('default')
-            new_val = conn.incr(key)
-            logger.info("acquire_node_by_id: incremented %s to %s (addr=%s)", key, new_val, addr)
         except Exception as e:
-            logger.warning("acquire_node_by_id: Redis INCR failed (%s), falling back to cache", e)
-            # Fallback to cache.set if Redis unavailable
-            if self._can_write_cache():
-                cache.set(key, cache.get(key, 0) + 1)
+            logger.debug("acquire_node_by_id: no redis connection: %s", e)
+            conn = None
+        new_val = self._incr_count(conn, addr)
+        logger.info("acquire_node_by_id: in-flight count of %s is now %s", addr, new_val)
         return addr
 
-    def release_node(self, addr: str) -> None:
+    def release_node(
+        self,
+        addr: str,
+        notify: bool = True,
+        latency: Optional[float] = None,
+        ok: Optional[bool] = True,
+        model: Optional[str] = None,
+        ttfb: Optional[float] = None,
+        final: Optional[dict] = None,
+    ) -> None:
+        """Decrement `addr`'s in-flight counter.
+
+        `latency` (seconds since the node was chosen) and `ok` (False for
+        upstream errors, timeouts and 5xx answers, None when the client went
+        away before the outcome was known) feed the adaptive concurrency limit
+        and the node's circuit breaker. Successful requests for `model` also update the traffic statistics
+        with `ttfb` (seconds to the first upstream byte) and `final` (timing
+        fields of Ollama's final response object).
+        """
         key = self._active_count_key(addr)
-        # Use Redis DECR for atomic decrement (works from any worker)
-        try:
-            from django_redis import get_redis_connection
-            conn = get_redis_connection('default')
-            # DECR can go negative, so check first
-            val = conn.get(key)
-            if val is not None:
-                current = int(val) if isinstance(val, (bytes, str)) else val
-                if current > 0:
-                    new_val = conn.decr(key)
-                    logger.info("release_node: decremented %s to %s (addr=%s)", key, new_val, addr)
-                else:
-                    logger.debug("release_node: %s already at 0, not decrementing", key)
-            else:
-                # Key doesn't exist, set to 0
-                conn.set(key, 0)
-                logger.debug("release_node: %s didn't exist, set to 0", key)
-        except Exception as e:
-            logger.warning("release_node: Redis DECR failed (%s), falling back to cache", e)
-            # Fallback to cache operations if Redis unavailable
+        current = None
+        lease = self._pop_lease(addr)
+        if lease is not None:
+            # drop our lease; the script re-derives the count from the live leases
+            try:
+                from django_redis import get_redis_connection
+                conn = get_redis_connection('default')
+                remaining = self._get_script(conn, self.LEASE_RELEASE_SCRIPT)(
+                    keys=[self._lease_key(addr), key], args=[lease, time.time()], client=conn
+                )
+                current = int(remaining) + 1
+                logger.info("release_node: released lease %s, %s now at %s", lease, addr, remaining)
+            except Exception as e:
+                logger.warning("release_node: lease release failed (%s); %s expires with its TTL", e, lease)
+        else:
+            # taken through the cache fallback, so give it back there
             cnt = cache.get(key, 0)
-            cnt = max(0, cnt - 1)
+            current = cnt
             if self._can_write_cache():
-                cache.set(key, cnt)
+                cache.set(key, max(0, cnt - 1))
+        self._released(addr, current, self.routing_snapshot(), notify, latency, ok, model, ttfb, final)
+
+    def _released(
+        self,
+        addr: str,
+        current: Optional[int],
+        snap: dict,
+        notify: bool,
+        latency: Optional[float],
+        ok: Optional[bool],
+        model: Optional[str],
+        ttfb: Optional[float],
+        final: Optional[dict],
+    ) -> None:
+        """Bookkeeping of `release_node` and `arelease_node` once the lease is gone."""
+        if ok is not None:
+            static_cap = (snap["caps"].get(addr) or 0) if self.concurrency.enabled else 0
+            signal, sample = self.concurrency.signal(latency, final)
+            self.concurrency.record(addr, sample, ok=ok, inflight=current, max_limit=static_cap, signal=signal)
+        if latency is not None:
+            # a finished request, not a claim rolled back by `_claim`
+            self.breaker.record(addr, ok)
+        if ok and model and latency is not None:
+            self.traffic.record(addr, normalize_model_name(model), latency, ttfb=ttfb, final=final)
+            if self.outliers.due():
+                total = len(snap["active"])
+                for returned in self.outliers.evaluate(self.traffic.stats(), total):
+                    # measured while slow; the node starts over after its ejection
+                    self.traffic.forget(returned)
+        if notify:
+            # a slot is free: wake a request waiting in this worker's admission queue
+            self.admission.notify()
 
     def start_scheduler(self, interval_seconds: int = 10) -> None:
         if self._scheduler is not None:
@@ -751,6 +1976,17 @@ class HAProxyManager:
                 logger.debug("models refresh job error: %s", e)
 
         sched.add_job(_sync_models_job, "interval", minutes=1)
+
+        def _sync_running_job():
+            try:
+                import asyncio
+
+                asyncio.run(self.refresh_running_all())
+            except Exception as e:
+                logger.debug("running models refresh job error: %s", e)
+
+        from django.conf import settings
+        sched.add_job(_sync_running_job, "interval", seconds=getattr(settings, 'PROXY_RESIDENCY_REFRESH_INTERVAL', 15))
         # schedule a short-poll job to listen for external refresh requests (set by signals)
         def _sync_refresh_on_request():
             try:
@@ -786,12 +2022,16 @@ class HAProxyManager:
                 return
 
         sched.add_job(_sync_refresh_on_request, 'interval', seconds=5)
+        # expire the leases of crashed workers so their requests stop counting
+        sched.add_job(self.reap_leases, 'interval', seconds=getattr(settings, 'PROXY_LEASE_REAP_INTERVAL', 15))
         sched.start()
         self._scheduler = sched
         logger.info("HAProxyManager scheduler started (health check every %d sec)", interval_seconds)
 
     async def close(self) -> None:
-        await self._client.aclose()
+        self._closing.set()
+        await self.client_pool.aclose()
+        await self.aredis.aclose()
         if self._scheduler:
             try:
                 self._scheduler.shutdown(wait=False)
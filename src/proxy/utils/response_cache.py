@@ -0,0 +1,189 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from .coalescing import Result, pack_result, unpack_result
+
+import logging
+logger = logging.getLogger('proxy')
+
+
+class _Entry:
+    __slots__ = ("model", "result", "size", "expires_at")
+
+    def __init__(self, model: str, result: Result, expires_at: float) -> None:
+        self.model = model
+        self.result = result
+        self.size = len(result[2])
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """Cache of deterministic responses: a worker-local LRU in front of Redis.
+
+    Entries are keyed by the model digest reported by `/api/tags` and a
+    canonical request hash, so a re-pulled model never serves stale
+    responses: its new digest selects new keys, and `sync_digests` drops
+    the LRU entries of the old one (Redis entries just expire). Only
+    successful responses of at most `max_entry_bytes` are stored, for `ttl`
+    seconds; the LRU is bounded by `max_entries` and `max_bytes`.
+
+    Safe to use from any thread.
+    """
+
+    KEY_PREFIX = "ha_resp:"  # + sha256(digest, request key) -> packed result
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        endpoints: Iterable[str] = ("embed", "embeddings"),
+        ttl: float = 600.0,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        redis: bool = True,
+    ) -> None:
+        self.enabled = enabled
+        self.endpoints = frozenset(endpoints)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.redis = redis
+        self._lru: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._digests: Dict[str, str] = {}
+        self._counts = {"lru_hits": 0, "redis_hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "ResponseCache":
+        from django.conf import settings
+        return cls(
+            enabled=getattr(settings, 'PROXY_RESPONSE_CACHE', True),
+            endpoints=getattr(settings, 'PROXY_RESPONSE_CACHE_ENDPOINTS', ("embed", "embeddings")),
+            ttl=getattr(settings, 'PROXY_RESPONSE_CACHE_TTL', 600.0),
+            max_entries=getattr(settings, 'PROXY_RESPONSE_CACHE_MAX_ENTRIES', 1024),
+            max_bytes=getattr(settings, 'PROXY_RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+            max_entry_bytes=getattr(settings, 'PROXY_RESPONSE_CACHE_MAX_ENTRY_BYTES', 1024 * 1024),
+            redis=getattr(settings, 'PROXY_RESPONSE_CACHE_REDIS', True),
+        )
+
+    def applies(self, endpoint: str) -> bool:
+        return self.enabled and endpoint in self.endpoints
+
+    @classmethod
+    def cache_key(cls, digest: str, request_key: str) -> str:
+        return cls.KEY_PREFIX + hashlib.sha256(f"{digest}\x00{request_key}".encode()).hexdigest()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def _lru_get(self, key: str, now: float) -> Optional[Result]:
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                self._drop(key)
+                return None
+            self._lru.move_to_end(key)
+            return entry.result
+
+    def _lru_put(self, key: str, model: str, result: Result, expires_at: float) -> None:
+        with self._lock:
+            if key in self._lru:
+                self._drop(key)
+            entry = self._lru[key] = _Entry(model, result, expires_at)
+            self._bytes += entry.size
+            while self._lru and (len(self._lru) > self.max_entries or self._bytes > self.max_bytes):
+                self._drop(next(iter(self._lru)))
+
+    def _drop(self, key: str) -> None:
+        self._bytes -= self._lru.pop(key).size
+
+    async def get(self, digest: str, request_key: str, model: str) -> Optional[Result]:
+        """The cached response for `request_key` against `model` at `digest`, or None."""
+        key = self.cache_key(digest, request_key)
+        now = time.time()
+        result = self._lru_get(key, now)
+        if result is not None:
+            self._count("lru_hits")
+            return result
+        if self.redis:
+            try:
+                from django_redis import get_redis_connection
+                conn = get_redis_connection('default')
+                packed, ttl_ms = await sync_to_async(self._redis_get, thread_sensitive=False)(conn, key)
+                if packed is not None:
+                    result = unpack_result(packed)
+                    remaining = ttl_ms / 1000.0 if ttl_ms and ttl_ms > 0 else self.ttl
+                    self._lru_put(key, model, result, now + remaining)
+                    self._count("redis_hits")
+                    return result
+            except Exception as e:
+                logger.debug("response cache: redis lookup failed: %s", e)
+        self._count("misses")
+        return None
+
+    @staticmethod
+    def _redis_get(conn, key: str) -> Tuple[Optional[bytes], Optional[int]]:
+        pipe = conn.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.pttl(key)
+        packed, ttl_ms = pipe.execute()
+        return packed, ttl_ms
+
+    async def put(self, digest: str, request_key: str, model: str, result: Result) -> bool:
+        """Store a successful response; False when it is not cacheable."""
+        status, _, body = result
+        if status != 200 or len(body) > self.max_entry_bytes:
+            return False
+        key = self.cache_key(digest, request_key)
+        self._lru_put(key, model, result, time.time() + self.ttl)
+        self._count("stores")
+        if self.redis:
+            try:
+                from django_redis import get_redis_connection
+                conn = get_redis_connection('default')
+                await sync_to_async(conn.set, thread_sensitive=False)(key, pack_result(result), px=int(self.ttl * 1000))
+            except Exception as e:
+                logger.debug("response cache: redis store failed: %s", e)
+        return True
+
+    def invalidate(self, model: str) -> int:
+        """Drop the LRU entries of `model` (normalized); returns how many."""
+        with self._lock:
+            stale = [k for k, e in self._lru.items() if e.model == model]
+            for k in stale:
+                self._drop(k)
+            self._counts["invalidations"] += 1
+            return len(stale)
+
+    def sync_digests(self, digests: Dict[str, str]) -> None:
+        """Note the current `{model: digest}` and invalidate models whose digest changed."""
+        with self._lock:
+            previous, self._digests = self._digests, dict(digests)
+        for model, digest in previous.items():
+            if digests.get(model) != digest:
+                dropped = self.invalidate(model)
+                logger.info("response cache: digest of %s changed, dropped %d entries", model, dropped)
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._counts["lru_hits"] + self._counts["redis_hits"]
+            lookups = hits + self._counts["misses"]
+            return {
+                "enabled": self.enabled,
+                "endpoints": sorted(self.endpoints),
+                "entries": len(self._lru),
+                "bytes": self._bytes,
+                **self._counts,
+                "hit_ratio": hits / lookups if lookups else 0.0,
+                "miss_ratio": self._counts["misses"] / lookups if lookups else 0.0,
+            }
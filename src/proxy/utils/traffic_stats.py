@@ -0,0 +1,231 @@
+import math
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Ollama's final response object (the last NDJSON line of a stream) ends with
+# its timing fields, after the possibly very long `context` array, so they
+# can be read from the tail of the body without parsing the whole object.
+_FINAL_FIELDS = ("total_duration", "load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration")
+_FINAL_RE = {f: re.compile(rb'"' + f.encode() + rb'"\s*:\s*(\d+)') for f in _FINAL_FIELDS}
+# bytes of the response body kept for `parse_final_stats`
+TAIL_BYTES = 4096
+
+
+def parse_final_stats(tail: bytes) -> dict:
+    """Return the timing fields (durations in ns) found in an Ollama response tail."""
+    found = {}
+    for field, pattern in _FINAL_RE.items():
+        matches = pattern.findall(tail or b"")
+        if matches:
+            found[field] = int(matches[-1])
+    return found
+
+
+class _Ewma:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value: Optional[float] = None
+
+    def update(self, sample: float, alpha: float) -> None:
+        self.value = sample if self.value is None else self.value + alpha * (sample - self.value)
+
+
+class DecayingQuantiles:
+    """Rolling percentile sketch: a log-bucketed histogram with time decay.
+
+    Bucket bounds grow by `GROWTH` (about 7% relative error on a quantile)
+    and a sample loses half its weight every `half_life` seconds, so old
+    measurements fade out. Weights are stored forward-decayed (scaled up
+    with time instead of scaling every bucket down), which keeps `add` O(1).
+    """
+
+    GROWTH = 1.15
+    MIN_VALUE = 0.001  # seconds; smaller samples share the first bucket
+
+    def __init__(self, half_life: float = 60.0) -> None:
+        self.half_life = half_life
+        self._buckets: Dict[int, float] = {}
+        self._total = 0.0
+        self._t0 = time.monotonic()
+
+    # forward-decayed weights are rebased before their scale can overflow
+    REBASE_HALF_LIVES = 64
+
+    def _scale(self, now: float) -> float:
+        return 2.0 ** ((now - self._t0) / self.half_life)
+
+    def _advance(self, now: float) -> None:
+        """Rebase the weights to `now` once `_t0` is `REBASE_HALF_LIVES` old."""
+        if now - self._t0 <= self.REBASE_HALF_LIVES * self.half_life:
+            return
+        # a negative exponent underflows to 0.0 however long the sketch was idle
+        decay = 2.0 ** (-(now - self._t0) / self.half_life)
+        self._buckets = {i: w * decay for i, w in self._buckets.items() if w * decay > 1e-6}
+        self._total = sum(self._buckets.values())
+        self._t0 = now
+
+    def add(self, value: float, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        idx = 0 if value <= self.MIN_VALUE else int(math.log(value / self.MIN_VALUE, self.GROWTH)) + 1
+        w = self._scale(now)
+        self._buckets[idx] = self._buckets.get(idx, 0.0) + w
+        self._total += w
+
+    def weight(self, now: Optional[float] = None) -> float:
+        """Decayed number of samples (1.0 = one fresh sample)."""
+        now = time.monotonic() if now is None else now
+        self._advance(now)
+        return self._total / self._scale(now)
+
+    def quantile(self, q: float, now: Optional[float] = None) -> Optional[float]:
+        self._advance(time.monotonic() if now is None else now)
+        if self._total <= 0:
+            return None
+        target = q * self._total
+        seen = 0.0
+        for idx in sorted(self._buckets):
+            seen += self._buckets[idx]
+            if seen >= target:
+                break
+        # geometric midpoint of the bucket
+        return self.MIN_VALUE if idx == 0 else self.MIN_VALUE * self.GROWTH ** (idx - 0.5)
+
+
+class _ModelStats:
+    __slots__ = ("ttfb", "ttft", "duration", "tokens_per_second", "eval_count", "samples", "updated_at")
+
+    def __init__(self, ttft_half_life: float = 60.0) -> None:
+        self.ttfb = _Ewma()
+        # time to first token of streamed responses
+        self.ttft = DecayingQuantiles(ttft_half_life)
+        self.duration = _Ewma()
+        self.tokens_per_second = _Ewma()
+        self.eval_count = _Ewma()
+        self.samples = 0
+        self.updated_at = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "ttfb": self.ttfb.value,
+            "ttft_p50": self.ttft.quantile(0.5),
+            "ttft_p95": self.ttft.quantile(0.95),
+            "duration": self.duration.value,
+            "tokens_per_second": self.tokens_per_second.value,
+            "eval_count": self.eval_count.value,
+            "samples": self.samples,
+            "updated_at": self.updated_at,
+        }
+
+
+class TrafficStats:
+    """Per-node, per-model EWMA statistics of proxied responses.
+
+    Fed from `release_node` with the time to first byte, the total duration
+    and the `eval_count`/`eval_duration` of Ollama's final response object.
+    `expected_time()` turns them into the expected completion time of the
+    next request, used by the `expected_time` strategy. Streamed responses
+    also feed a decaying time-to-first-token sketch (`ttft()`, used by
+    `lowest_ttft`). Worker-local and safe to update from any thread.
+    """
+
+    def __init__(self, alpha: float = 0.2, ttft_half_life: float = 60.0) -> None:
+        self.alpha = alpha
+        self.ttft_half_life = ttft_half_life
+        self._stats: Dict[Tuple[str, str], _ModelStats] = {}
+        # generated tokens per request, per model across all nodes
+        self._tokens: Dict[str, _Ewma] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "TrafficStats":
+        from django.conf import settings
+        return cls(
+            alpha=getattr(settings, 'PROXY_TRAFFIC_EWMA_ALPHA', 0.2),
+            ttft_half_life=getattr(settings, 'PROXY_TTFT_HALF_LIFE', 60.0),
+        )
+
+    def record(
+        self,
+        addr: str,
+        model: str,
+        duration: float,
+        ttfb: Optional[float] = None,
+        final: Optional[dict] = None,
+    ) -> None:
+        """Add one successful response (`model` normalized, times in seconds).
+
+        `ttfb` is only known for streamed responses, where the first chunk
+        carries the first token, so it doubles as the time to first token.
+        """
+        final = final or {}
+        eval_count = final.get("eval_count")
+        eval_duration = final.get("eval_duration")
+        with self._lock:
+            stats = self._stats.get((addr, model))
+            if stats is None:
+                stats = self._stats[(addr, model)] = _ModelStats(self.ttft_half_life)
+            stats.samples += 1
+            stats.updated_at = time.time()
+            stats.duration.update(duration, self.alpha)
+            if ttfb is not None:
+                stats.ttfb.update(ttfb, self.alpha)
+                stats.ttft.add(ttfb)
+            if eval_count:
+                stats.eval_count.update(eval_count, self.alpha)
+                self._tokens.setdefault(model, _Ewma()).update(eval_count, self.alpha)
+                if eval_duration:
+                    stats.tokens_per_second.update(eval_count / (eval_duration / 1e9), self.alpha)
+
+    def expected_time(self, addr: str, model: str) -> Optional[float]:
+        """Expected seconds to complete a `model` request on `addr` when idle (None if unknown).
+
+        With a measured generation speed this is the time to first byte plus
+        the model's typical output length (across all nodes, so a node that
+        happened to get short requests does not look faster) divided by the
+        node's tokens per second; otherwise the node's mean duration.
+        """
+        with self._lock:
+            stats = self._stats.get((addr, model))
+            if stats is None:
+                return None
+            tokens = self._tokens.get(model)
+            tps = stats.tokens_per_second.value
+            if tps and tokens is not None and tokens.value:
+                return (stats.ttfb.value or 0.0) + tokens.value / tps
+            return stats.duration.value
+
+    def ttft(self, addr: str, model: str) -> Optional[dict]:
+        """{"p50", "p95"} time to first token of `model` on `addr`.
+
+        None when the node has no recent streamed samples: once the decayed
+        weight drops below half a sample (a single sample one half-life old)
+        the old measurements no longer count.
+        """
+        with self._lock:
+            stats = self._stats.get((addr, model))
+            if stats is None or stats.ttft.weight() < 0.5:
+                return None
+            return {"p50": stats.ttft.quantile(0.5), "p95": stats.ttft.quantile(0.95)}
+
+    def forget(self, addr: str) -> None:
+        """Drop every statistic of `addr` (e.g. measured before it was ejected)."""
+        with self._lock:
+            for key in [k for k in self._stats if k[0] == addr]:
+                del self._stats[key]
+
+    def node_stats(self, addr: str) -> dict:
+        """{model: stats} for one node."""
+        with self._lock:
+            return {model: s.as_dict() for (a, model), s in self._stats.items() if a == addr}
+
+    def stats(self) -> dict:
+        """{addr: {model: stats}} for every node seen by this worker."""
+        out: Dict[str, dict] = {}
+        with self._lock:
+            for (addr, model), s in self._stats.items():
+                out.setdefault(addr, {})[model] = s.as_dict()
+        return out
@@ -74,6 +74,7 @@ def _get_active_count(mgr, addr: str) -> int:
                 'latencies': {'type': 'object'},
                 'active_counts': {'type': 'object'},
                 'models': {'type': 'object'},
+                'runtime': {'type': 'object', 'description': 'Worker-local runtime statistics (upstream connection pools, admission queue, ...).'},
             }
         },
         503: {'type': 'object', 'properties': {'error': {'type': 'string'}}},
@@ -109,6 +110,11 @@ def state(request):
                 models = {a: cache.get(mgr.MODELS_KEY_PREFIX + a, []) for a in list({*active, *standby})}
             except Exception:
                 logger.debug("refresh_from_db failed in state handler")
+        try:
+            runtime = mgr.runtime_stats()
+        except Exception:
+            logger.debug("runtime_stats failed in state handler")
+            runtime = {}
         return JsonResponse({
 			"active": active,
 			"standby": standby,
@@ -116,6 +122,7 @@ def state(request):
 			"latencies": latencies,
 			"active_counts": active_counts,
 			"models": models,
+			"runtime": runtime,
 		})
     except Exception as e:
         logger.exception("failed to read state")
@@ -200,6 +207,7 @@ def proxy_config(request):
 							'status': {'type': 'string', 'enum': ['active', 'standby'], 'description': 'Node status'},
 							'latency': {'type': 'number', 'description': 'Last measured latency in seconds'},
 							'models': {'type': 'array', 'items': {'type': 'string'}, 'description': 'Available models'},
+							'traffic': {'type': 'object', 'description': 'Per-model EWMA statistics of proxied responses seen by the serving worker (ttfb, ttft_p50, ttft_p95, duration, tokens_per_second, eval_count, samples)'},
 						}
 					}
 				},
@@ -218,7 +226,7 @@ def proxy_config(request):
 			type=OpenApiTypes.INT,
 		),
 	],
-	description='Get active request counts for all nodes or a specific node. Returns detailed information about each node including active requests, status, latency, and available models.'
+	description='Get active request counts for all nodes or a specific node. Returns detailed information about each node including active requests, status, latency, available models and response statistics per model.'
 )
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -299,6 +307,11 @@ def active_requests(request):
 						models = node.available_models
 				except Exception:
 					models = []
+			try:
+				traffic = mgr.traffic_stats(addr)
+			except Exception:
+				logger.debug("active_requests: traffic_stats failed for %s", addr)
+				traffic = {}
 			
 			nodes_data.append({
 				'id': node.id,
@@ -307,7 +320,8 @@ def active_requests(request):
 				'active_requests': active_count,
 				'status': status_str,
 				'latency': latency,
-				'models': models
+				'models': models,
+				'traffic': traffic,
 			})
 			total_active += active_count
 		
@@ -1,15 +1,573 @@
 import json
 import asyncio
+import time
 
+from django.conf import settings
 from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 import logging
 logger = logging.getLogger('proxy')
-from drf_spectacular.utils import extend_schema
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import OpenApiParameter, extend_schema
 from .views import _get_manager
-from . import streaming as _streaming
-from asgiref.sync import async_to_sync
+from .utils.admission import NodesSaturated
+from .utils.coalescing import request_key
+from .utils.embed_batcher import EmbedBatcher
+from .utils.embedding_codec import BINARY_CONTENT_TYPE, base64_vectors, negotiate, pack_vectors
+from .utils.proxy_manager import build_tags_payload, normalize_model_name
+from .utils.traffic_stats import TAIL_BYTES, parse_final_stats
+from asgiref.sync import sync_to_async
+
+
+def _async_api_view(methods):
+    """Serve `func` as a native async Django view.
+
+    DRF's `@api_view` is sync-only, so under ASGI its views run on the
+    thread-sensitive executor and in-flight upstream calls queue behind each
+    other. The returned view is the plain coroutine function; a DRF-wrapped
+    copy is attached only so drf-spectacular keeps documenting the endpoint.
+    """
+    def decorator(func):
+        view = csrf_exempt(require_http_methods(methods)(func))
+        schema_view = api_view(methods)(permission_classes([AllowAny])(func))
+        view.cls = schema_view.cls
+        view.initkwargs = schema_view.initkwargs
+        return view
+    return decorator
+
+
+def _read_payload(request):
+    """Return the raw request body and its decoded JSON payload (or None)."""
+    body_bytes = request.body or b""
+    payload = None
+    if body_bytes:
+        try:
+            payload = json.loads(body_bytes.decode())
+        except Exception:
+            payload = None
+    return body_bytes, payload
+
+
+def _affinity_key(payload, endpoint: str):
+    """Stable prompt prefix used by the `prefix_affinity` strategy (or None).
+
+    Chat: the system messages plus the first `PROXY_AFFINITY_PREFIX_MESSAGES`
+    other messages, which stay identical across the turns of a conversation.
+    Generate: `system` plus the head of `context` (or of `prompt`).
+    """
+    if not isinstance(payload, dict):
+        return None
+    parts = [str(payload.get("model") or "")]
+    if endpoint == "chat":
+        messages = payload.get("messages")
+        if not isinstance(messages, list) or not messages:
+            return None
+        limit = getattr(settings, 'PROXY_AFFINITY_PREFIX_MESSAGES', 1)
+        others = 0
+        for m in messages:
+            if not isinstance(m, dict):
+                continue
+            if m.get("role") != "system":
+                if others >= limit:
+                    break
+                others += 1
+            parts.append(f"{m.get('role')}:{m.get('content')}")
+    else:
+        chars = getattr(settings, 'PROXY_AFFINITY_PREFIX_CHARS', 512)
+        parts.append(str(payload.get("system") or ""))
+        context = payload.get("context")
+        if isinstance(context, list) and context:
+            parts.append(json.dumps(context[:chars]))
+        else:
+            parts.append(str(payload.get("prompt") or "")[:chars])
+    return "\x1f".join(parts)
+
+
+def _saturated_response(exc: NodesSaturated) -> JsonResponse:
+    resp = JsonResponse({"error": f"all nodes are busy: {exc}"}, status=503)
+    resp["Retry-After"] = "1"
+    return resp
+
+
+def _forward_headers(request) -> dict:
+    return {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+
+
+class _UpstreamCall:
+    """Timing and outcome of one proxied request, reported when its node is released.
+
+    The manager feeds them to the adaptive concurrency limits, the node's
+    circuit breaker and the per-node traffic statistics. `ok` stays None
+    when the client goes away before the outcome is known. Only the tail of the body is kept, which is
+    where Ollama's final object carries `eval_count`/`eval_duration`.
+    """
+
+    def __init__(self, mgr, node_addr: str, model_name=None) -> None:
+        self.mgr = mgr
+        self.node_addr = node_addr
+        self.model_name = model_name
+        self.started = time.monotonic()
+        self.ttfb = None
+        self.ok = None
+        self._tail = b""
+
+    def chunk(self, data: bytes) -> None:
+        """Record a streamed chunk; the first one fixes the time to first byte."""
+        if self.ttfb is None:
+            self.ttfb = time.monotonic() - self.started
+        self._tail = (self._tail + data)[-TAIL_BYTES:]
+
+    def failed(self) -> None:
+        """Record a connect error, timeout or broken upstream stream."""
+        self.ok = False
+
+    def response(self, resp) -> None:
+        """Record a buffered upstream response."""
+        self.ok = resp.status_code < 500
+        self._tail = resp.content[-TAIL_BYTES:]
+
+    async def release(self) -> None:
+        try:
+            await self.mgr.arelease_node(
+                self.node_addr,
+                latency=time.monotonic() - self.started,
+                ok=self.ok,
+                model=self.model_name,
+                ttfb=self.ttfb,
+                final=parse_final_stats(self._tail) if self.ok else None,
+            )
+        except Exception as e:
+            logger.debug("release_node failed for %s: %s", self.node_addr, e)
+
+
+class _Failover:
+    """Picks replacement nodes for a request whose upstream failed before answering.
+
+    At most `PROXY_RETRY_ATTEMPTS` nodes are tried per request and no new
+    attempt starts once `PROXY_RETRY_DEADLINE` seconds have passed.
+    """
+
+    def __init__(self, mgr, node_addr: str, model_name=None, affinity_key=None) -> None:
+        self.mgr = mgr
+        self.model_name = model_name
+        self.affinity_key = affinity_key
+        self.tried = [node_addr]
+        self.attempts = getattr(settings, 'PROXY_RETRY_ATTEMPTS', 3)
+        self.deadline = time.monotonic() + getattr(settings, 'PROXY_RETRY_DEADLINE', 15.0)
+
+    async def next_node(self):
+        """Choose a node not tried yet, or None when attempts, time or nodes run out."""
+        remaining = self.deadline - time.monotonic()
+        if len(self.tried) >= self.attempts or remaining <= 0:
+            return None
+        try:
+            addr = await asyncio.wait_for(
+                self.mgr.achoose_node(
+                    model_name=self.model_name, affinity_key=self.affinity_key, exclude=list(self.tried)
+                ),
+                timeout=remaining,
+            )
+        except (NodesSaturated, asyncio.TimeoutError):
+            return None
+        if addr in self.tried:
+            await self.mgr.arelease_node(addr)
+            return None
+        if addr:
+            logger.warning("retrying on %s after upstream failure of %s", addr, self.tried[-1])
+            self.tried.append(addr)
+        return addr
+
+
+async def _post_with_failover(mgr, node_addr, path, headers, body, timeout, model_name=None, affinity_key=None):
+    """Buffered POST of `path` to `node_addr`.
+
+    Connect errors, timeouts and 5xx answers are retried on other nodes (see
+    `_Failover`). Returns the last upstream response, or raises the last
+    error when no node answered at all.
+    """
+    failover = _Failover(mgr, node_addr, model_name, affinity_key)
+    addr = node_addr
+    while True:
+        call = _UpstreamCall(mgr, addr, model_name)
+        resp = error = None
+        try:
+            resp = await mgr.get_client(addr).post(
+                addr.rstrip("/") + path, headers=headers, content=body, timeout=timeout
+            )
+            call.response(resp)
+        except Exception as e:
+            call.failed()
+            error = e
+        finally:
+            await call.release()
+        if resp is not None and resp.status_code < 500:
+            return resp
+        addr = await failover.next_node()
+        if addr is None:
+            if resp is not None:
+                return resp
+            raise error
+
+
+async def _stream_with_failover(mgr, node_addr, path, headers, body, timeout, model_name=None, affinity_key=None):
+    """Stream `path` from `node_addr`, moving to another node while nothing was sent yet.
+
+    A connect error, a timeout or a 5xx status before the first byte is
+    retried on other nodes (see `_Failover`). If every node fails, a final
+    NDJSON `{"error": ...}` line is sent, as Ollama does for stream errors.
+    """
+    failover = _Failover(mgr, node_addr, model_name, affinity_key)
+    addr = node_addr
+    while addr is not None:
+        call = _UpstreamCall(mgr, addr, model_name)
+        try:
+            async with mgr.get_client(addr).stream(
+                "POST", addr.rstrip("/") + path, headers=headers, content=body, timeout=timeout
+            ) as resp:
+                if resp.status_code >= 500:
+                    call.failed()
+                    retry = await failover.next_node()
+                    if retry is not None:
+                        addr = retry
+                        continue
+                async for chunk in resp.aiter_bytes():
+                    if chunk:
+                        call.chunk(chunk)
+                        yield chunk
+                call.ok = resp.status_code < 500
+                return
+        except Exception as e:
+            call.failed()
+            if call.ttfb is not None:
+                # part of the answer already went to the client
+                logger.exception("proxy stream from %s broke: %s", addr, e)
+                raise
+            logger.warning("proxy stream from %s failed before the first byte: %s", addr, e)
+            addr = await failover.next_node()
+        finally:
+            await call.release()
+    yield json.dumps({"error": "upstream request failed"}).encode() + b"\n"
+
+
+def _short_generate(payload) -> bool:
+    """A buffered generate request capped at `PROXY_HEDGE_MAX_PREDICT` tokens (hedgeable)."""
+    options = payload.get("options") if isinstance(payload, dict) else None
+    num_predict = options.get("num_predict") if isinstance(options, dict) else None
+    return isinstance(num_predict, int) and 0 < num_predict <= getattr(settings, 'PROXY_HEDGE_MAX_PREDICT', 64)
+
+
+async def _post_hedged(mgr, node_addr, endpoint, path, headers, body, timeout, model_name=None):
+    """Buffered POST of `path` that races a second node when the first is slow.
+
+    Unless hedging is enabled for `endpoint` and the model this is a single
+    attempt. Otherwise, when `node_addr` has not answered within the hedge
+    delay (or failed), the same request goes to another node with a free
+    slot, budget permitting. The first non-5xx answer wins and the other
+    attempt is cancelled, which releases its node. Returns the winning (or
+    last) response, or raises the last error.
+    """
+    hedger = mgr.hedger
+    model = normalize_model_name(model_name)
+
+    async def attempt(addr):
+        call = _UpstreamCall(mgr, addr, model_name)
+        try:
+            resp = await mgr.get_client(addr).post(
+                addr.rstrip("/") + path, headers=headers, content=body, timeout=timeout
+            )
+            call.response(resp)
+            return resp, time.monotonic()
+        except Exception:
+            call.failed()
+            raise
+        finally:
+            await call.release()
+
+    if not hedger.applies(endpoint, model):
+        resp, _ = await attempt(node_addr)
+        return resp
+
+    hedger.started(endpoint)
+    finished = []
+
+    def _answer(done):
+        finished.extend(done)
+        for task in done:
+            if task.exception() is None and task.result()[0].status_code < 500:
+                return task
+        return None
+
+    started = time.monotonic()
+    primary = asyncio.ensure_future(attempt(node_addr))
+    hedges = set()
+    pending = {primary}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=hedger.delay(endpoint, model))
+        winner = _answer(done)
+        if winner is None and hedger.try_hedge(endpoint):
+            try:
+                addr = await mgr.achoose_node(model_name=model_name, exclude=[node_addr], wait=False)
+            except NodesSaturated:
+                addr = None
+            if addr and addr != node_addr:
+                logger.debug("hedging %s request to %s after waiting for %s", endpoint, addr, node_addr)
+                hedge = asyncio.ensure_future(attempt(addr))
+                hedges.add(hedge)
+                pending.add(hedge)
+            else:
+                if addr:
+                    await mgr.arelease_node(addr)
+                hedger.refund()
+        while winner is None and pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = _answer(done)
+    finally:
+        for task in pending:
+            task.cancel()
+        # let the losers run their release before answering
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    if winner is not None:
+        resp, finished_at = winner.result()
+        # measured from the primary's start: a hedge's own time would shrink the delay
+        hedger.observe(endpoint, model, finished_at - started, hedge_won=winner in hedges)
+        return resp
+    for task in reversed(finished):
+        if task.exception() is None:
+            return task.result()[0]
+    raise finished[-1].exception()
+
+
+def _deterministic_key(endpoint: str, payload):
+    """Canonical key of a deterministic, non-streaming request (or None).
+
+    Embedding requests always qualify. Generate and chat only when buffered
+    and either `temperature` is 0 or a `seed` is fixed, since otherwise two
+    identical requests are expected to get different answers.
+    """
+    if not isinstance(payload, dict):
+        return None
+    if endpoint in ("generate", "chat"):
+        # buffered generate is opt-out of streaming, buffered chat opt-in
+        streaming = payload.get("stream") is True if endpoint == "generate" else payload.get("stream") is not False
+        options = payload.get("options")
+        options = options if isinstance(options, dict) else {}
+        if streaming or not (options.get("temperature") == 0 or options.get("seed") is not None):
+            return None
+    return request_key(endpoint, dict(payload, model=normalize_model_name(payload.get("model"))))
+
+
+def _result_response(result) -> HttpResponse:
+    status, content_type, content = result
+    resp = HttpResponse(content, status=status, content_type=content_type)
+    if status == 503:
+        resp["Retry-After"] = "1"
+    return resp
+
+
+async def _shared_response(mgr, endpoint, payload, proxy):
+    """Serve a deterministic request from the response cache or a shared call.
+
+    Requests without a `_deterministic_key` go straight through. Others are
+    looked up in the response cache (when enabled for `endpoint` and the
+    model's digest is known), then concurrent identical ones run `proxy()`
+    once; successful answers are cached. Waiters get the leader's status,
+    content type and body; of its other headers only the `Retry-After` of a
+    saturated (503) answer is kept.
+    """
+    key = _deterministic_key(endpoint, payload)
+    if key is None:
+        return await proxy()
+
+    responses = mgr.response_cache
+    model = normalize_model_name(payload.get("model"))
+    digest = await mgr.amodel_digest(model) if responses.applies(endpoint) else None
+    if digest:
+        cached = await responses.get(digest, key, model)
+        if cached is not None:
+            return _result_response(cached)
+
+    async def run():
+        resp = await proxy()
+        result = resp.status_code, resp.get("Content-Type", "application/json"), resp.content
+        if digest:
+            await responses.put(digest, key, model, result)
+        return result
+
+    return _result_response(await mgr.coalescer.do(key, run))
+
+
+async def _embed_batched(mgr, batch_key, payload, headers):
+    """Send an embed request as part of a micro-batch (see `EmbedBatcher`).
+
+    Returns None when the batch failed, and the caller then sends the
+    request on its own (which also surfaces its own error).
+    """
+    model_name = payload.get("model")
+
+    async def send(body):
+        node_addr = await mgr.achoose_node(model_name=model_name)
+        if not node_addr:
+            raise LookupError(f"model not available on any node: {model_name}")
+        resp = await _post_hedged(
+            mgr, node_addr, "embed", "/api/embed", headers, json.dumps(body).encode(), 60.0, model_name
+        )
+        return resp.status_code, resp.content
+
+    result = await mgr.embed_batcher.submit(batch_key, payload, send)
+    return JsonResponse(result) if result is not None else None
+
+
+# request fields that do not change the vectors of an input
+_STORE_IGNORED_FIELDS = ("model", "input", "prompt", "keep_alive", "stream")
+
+
+async def _from_embedding_store(mgr, endpoint, payload, upstream):
+    """Serve stored embeddings and send only the missing inputs upstream.
+
+    `upstream(payload, body)` proxies an `endpoint` request; new vectors it
+    returns are added to the store (see `EmbeddingStore`). Returns None
+    when the store does not apply: it is off, the input is not text or the
+    model's digest is not known yet.
+    """
+    store = mgr.embedding_store
+    if not store.enabled or not isinstance(payload, dict):
+        return None
+    if endpoint == "embed":
+        inputs = EmbedBatcher.inputs(payload)
+    else:
+        inputs = [payload["prompt"]] if isinstance(payload.get("prompt"), str) else None
+    digest = await mgr.amodel_digest(payload.get("model"))
+    if not inputs or not digest:
+        return None
+
+    scope = request_key(endpoint, {k: v for k, v in payload.items() if k not in _STORE_IGNORED_FIELDS})
+    keys = [store.key(digest, scope, text) for text in inputs]
+    vectors = await sync_to_async(store.get_many, thread_sensitive=False)(keys)
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    data = {"model": payload.get("model"), "total_duration": 0, "load_duration": 0, "prompt_eval_count": 0}
+    if missing:
+        sub = dict(payload, input=[inputs[i] for i in missing]) if endpoint == "embed" else payload
+        resp = await upstream(sub, json.dumps(sub).encode())
+        if resp.status_code != 200:
+            return resp
+        data = json.loads(resp.content)
+        fresh = data.get("embeddings") if endpoint == "embed" else [data.get("embedding")]
+        if not isinstance(fresh, list) or len(fresh) != len(missing):
+            return resp
+        await sync_to_async(store.put_many, thread_sensitive=False)(
+            [(keys[i], vector) for i, vector in zip(missing, fresh)]
+        )
+        if len(missing) == len(inputs):
+            return resp
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+    if endpoint == "embed":
+        return JsonResponse(dict(data, embeddings=vectors))
+    return JsonResponse(dict(data, embedding=vectors[0]))
+
+def _embedding_encoding(request):
+    """(encoding, dtype) asked for with `?encoding=`/`?dtype=` or `Accept`; None for JSON."""
+    return negotiate(request.GET.get("encoding"), request.GET.get("dtype"), request.headers.get("Accept", ""))
+
+
+def _encode_embeddings(resp, field: str, encoding):
+    """Re-encode the vectors in `field` of a successful JSON embed response.
+
+    `binary` returns the packed little-endian vectors with their shape and
+    dtype in `X-Embedding-*` headers; `base64` replaces `field` with an
+    object holding the packed data and its shape. Responses that cannot be
+    converted are returned unchanged.
+    """
+    if encoding is None or resp.status_code != 200:
+        return resp
+    kind, dtype = encoding
+    try:
+        data = json.loads(resp.content)
+        single = field == "embedding"
+        vectors = [data[field]] if single else data[field]
+        if kind == "binary":
+            packed, shape = pack_vectors(vectors, dtype)
+            out = HttpResponse(packed, content_type=BINARY_CONTENT_TYPE)
+            out["X-Embedding-Shape"] = ",".join(str(n) for n in (shape[1:] if single else shape))
+            out["X-Embedding-Dtype"] = dtype
+            out["X-Embedding-Model"] = str(data.get("model") or "")
+            return out
+        encoded = base64_vectors(vectors, dtype)
+        if single:
+            encoded["shape"] = encoded["shape"][1:]
+        return JsonResponse(dict(data, **{field: encoded}))
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning("cannot encode %s as %s/%s, returning JSON: %s", field, kind, dtype, e)
+        return resp
+
+
+class _ChunkRejected(Exception):
+    """A scattered embed chunk got a non-200 answer from every node tried."""
+
+    def __init__(self, resp) -> None:
+        super().__init__(resp.status_code)
+        self.resp = resp
+
+
+async def _embed_scattered(mgr, payload, inputs, headers):
+    """Split a large embed `input` across the nodes serving the model.
+
+    Chunks of `PROXY_EMBED_SHARD_SIZE` inputs each go to the least busy
+    node, with up to `PROXY_EMBED_SHARD_PER_NODE` chunks per node in flight.
+    A chunk whose node fails is retried on other nodes (see
+    `_post_with_failover`). The embeddings are reassembled in input order;
+    `prompt_eval_count` is summed and `total_duration` is the wall time.
+    Returns None when fewer than two nodes serve the model.
+    """
+    model_name = payload.get("model")
+    nodes = await mgr.amodel_nodes(model_name)
+    if len(nodes) < 2:
+        return None
+    size = getattr(settings, 'PROXY_EMBED_SHARD_SIZE', 128)
+    chunks = [inputs[i:i + size] for i in range(0, len(inputs), size)]
+    results = [None] * len(chunks)
+    pending = iter(range(len(chunks)))
+    started = time.monotonic()
+
+    async def worker():
+        # workers share `pending`, so each chunk is taken exactly once
+        for i in pending:
+            node_addr = await mgr.achoose_node(model_name=model_name, strategy="least_active")
+            if not node_addr:
+                raise LookupError(f"model not available on any node: {model_name}")
+            body = json.dumps(dict(payload, input=chunks[i])).encode()
+            resp = await _post_with_failover(mgr, node_addr, "/api/embed", headers, body, 60.0, model_name)
+            if resp.status_code != 200:
+                raise _ChunkRejected(resp)
+            results[i] = resp.json()
+
+    parallel = min(len(chunks), len(nodes) * getattr(settings, 'PROXY_EMBED_SHARD_PER_NODE', 2))
+    logger.debug("scattering %d embed inputs as %d chunks over %d nodes", len(inputs), len(chunks), len(nodes))
+    tasks = [asyncio.ensure_future(worker()) for _ in range(parallel)]
+    try:
+        await asyncio.gather(*tasks)
+    except _ChunkRejected as e:
+        return HttpResponse(e.resp.content, status=e.resp.status_code,
+                            content_type=e.resp.headers.get("content-type", "application/json"))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    embeddings = [vector for r in results for vector in r.get("embeddings") or []]
+    if len(embeddings) != len(inputs):
+        raise ValueError(f"expected {len(inputs)} embeddings, got {len(embeddings)}")
+    return JsonResponse({
+        "model": results[0].get("model", model_name),
+        "embeddings": embeddings,
+        "total_duration": int((time.monotonic() - started) * 1e9),
+        "load_duration": max(r.get("load_duration") or 0 for r in results),
+        "prompt_eval_count": sum(r.get("prompt_eval_count") or 0 for r in results),
+    })
+
 
 @extend_schema(
     tags=['Proxy'],
@@ -63,78 +621,53 @@ from asgiref.sync import async_to_sync
         "All durations are returned in nanoseconds."
     )
 )
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def proxy_generate(request):
+@_async_api_view(['POST'])
+async def proxy_generate(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
 
-    body_bytes = request.body or b""
-    payload = None
-    if body_bytes:
-        try:
-            payload = json.loads(body_bytes.decode())
-        except Exception:
-            payload = None
+    body_bytes, payload = _read_payload(request)
 
     if payload and payload.get("node_id") is not None:
         return JsonResponse({"error": "specifying node_id is not allowed"}, status=400)
 
-    model_name = payload.get("model") if payload else None
-    node_addr = mgr.choose_node(model_name=model_name)
-    if not node_addr:
-        return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
-
-    url = node_addr.rstrip("/") + "/api/generate"
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
-    # support streaming when payload contains "stream": true
-    stream_flag = payload and payload.get("stream") is True
-    if stream_flag:
-        async def stream_generator():
-            try:
-                import httpx
-                from django.conf import settings
-                timeout = getattr(settings, 'PROXY_UPSTREAM_TIMEOUT', 30.0)
-                async with httpx.AsyncClient(timeout=timeout) as client:
-                    async with client.stream("POST", url, headers=headers, content=body_bytes) as resp:
-                        content_type = resp.headers.get("content-type", "application/x-ndjson")
-                        # yield chunks as they arrive
-                        async for chunk in resp.aiter_bytes():
-                            if chunk:
-                                yield chunk
-            except Exception as e:
-                logger.exception("proxy stream_generator upstream error: %s", e)
-                raise
-            finally:
-                try:
-                    mgr.release_node(node_addr)
-                except Exception as e:
-                    logger.debug("proxy stream_generator: release_node failed: %s", e)
-
-        # Do not set Content-Length so response is streamed
-        return StreamingHttpResponse(stream_generator(), content_type="application/x-ndjson")
-
-    # non-streaming path (buffered)
-    import httpx
-    from django.conf import settings
-    
-    async def do_request():
+    async def _proxy():
+        model_name = payload.get("model") if payload else None
+        affinity_key = _affinity_key(payload, "generate")
+        try:
+            node_addr = await mgr.achoose_node(model_name=model_name, affinity_key=affinity_key)
+        except NodesSaturated as e:
+            return _saturated_response(e)
+        if not node_addr:
+            return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
+
+        headers = _forward_headers(request)
+        # support streaming when payload contains "stream": true
+        stream_flag = payload and payload.get("stream") is True
+        if stream_flag:
+            timeout = getattr(settings, 'PROXY_UPSTREAM_TIMEOUT', 30.0)
+            stream = _stream_with_failover(
+                mgr, node_addr, "/api/generate", headers, body_bytes, timeout, model_name, affinity_key
+            )
+            # Do not set Content-Length so response is streamed
+            return StreamingHttpResponse(stream, content_type="application/x-ndjson")
+
+        # non-streaming path (buffered)
         timeout = getattr(settings, 'PROXY_UPSTREAM_TIMEOUT', 60.0)
         try:
-            async with httpx.AsyncClient(timeout=timeout) as client:
-                resp = await client.post(url, headers=headers, content=body_bytes)
-                return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
+            if _short_generate(payload) and mgr.hedger.applies("generate", normalize_model_name(model_name)):
+                resp = await _post_hedged(mgr, node_addr, "generate", "/api/generate", headers, body_bytes, timeout, model_name)
+            else:
+                resp = await _post_with_failover(
+                    mgr, node_addr, "/api/generate", headers, body_bytes, timeout, model_name, affinity_key
+                )
+            return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
         except Exception as e:
             logger.exception("proxy generate request failed: %s", e)
             return JsonResponse({"error": "upstream request failed"}, status=502)
-        finally:
-            try:
-                mgr.release_node(node_addr)
-            except Exception as e:
-                logger.debug("proxy do_request: release_node failed: %s", e)
-    
-    return async_to_sync(do_request)()
+
+    return await _shared_response(mgr, "generate", payload, _proxy)
 
 
 @extend_schema(
@@ -206,64 +739,66 @@ def proxy_generate(request):
         "and `keep_alive` (seconds, 0 to unload)."
     )
 )
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def proxy_chat(request):
+@_async_api_view(['POST'])
+async def proxy_chat(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
 
-    body_bytes = request.body or b""
-    payload = None
-    if body_bytes:
-        try:
-            payload = json.loads(body_bytes.decode())
-        except Exception:
-            payload = None
+    body_bytes, payload = _read_payload(request)
 
     if payload and payload.get("node_id") is not None:
         return JsonResponse({"error": "specifying node_id is not allowed"}, status=400)
 
-    model_name = payload.get("model") if payload else None
-    node_addr = mgr.choose_node(model_name=model_name)
-    if not node_addr:
-        return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
-
-    url = node_addr.rstrip("/") + "/api/chat"
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+    async def _proxy():
+        model_name = payload.get("model") if payload else None
+        affinity_key = _affinity_key(payload, "chat")
+        try:
+            node_addr = await mgr.achoose_node(model_name=model_name, affinity_key=affinity_key)
+        except NodesSaturated as e:
+            return _saturated_response(e)
+        if not node_addr:
+            return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
 
-    # non-streaming
-    if payload and payload.get("stream") is False:
-        import httpx
+        headers = _forward_headers(request)
 
-        async def do_request():
+        # non-streaming
+        if payload and payload.get("stream") is False:
             try:
-                async with httpx.AsyncClient(timeout=120.0) as client:
-                    resp = await client.post(url, headers=headers, content=body_bytes)
-                    return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
+                resp = await _post_with_failover(
+                    mgr, node_addr, "/api/chat", headers, body_bytes, 120.0, model_name, affinity_key
+                )
+                return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
             except Exception:
                 logger.exception("proxy chat request failed")
                 return JsonResponse({"error": "upstream request failed"}, status=502)
-            finally:
-                try:
-                    mgr.release_node(node_addr)
-                except Exception as e:
-                    logger.debug("proxy_chat non-stream release_node failed: %s", e)
-        
-        return async_to_sync(do_request)()
-
-    # streaming path
-    async def _stream_and_release():
-        try:
-            async for chunk in _streaming.stream_post_bytes(url, headers, body_bytes):
-                yield chunk
-        finally:
-            try:
-                mgr.release_node(node_addr)
-            except Exception as e:
-                logger.debug("proxy_embed do_request release_node failed: %s", e)
 
-    return StreamingHttpResponse(_stream_and_release(), content_type="application/json")
+        # streaming path
+        timeout = getattr(settings, 'PROXY_UPSTREAM_TIMEOUT', 30.0)
+        stream = _stream_with_failover(mgr, node_addr, "/api/chat", headers, body_bytes, timeout, model_name, affinity_key)
+        return StreamingHttpResponse(stream, content_type="application/json")
+
+    return await _shared_response(mgr, "chat", payload, _proxy)
+
+
+_EMBEDDING_ENCODING_PARAMETERS = [
+    OpenApiParameter(
+        name='encoding',
+        location=OpenApiParameter.QUERY,
+        description='`binary` (packed vectors, also chosen by `Accept: application/octet-stream`) or `base64` (packed vectors inside the JSON). Defaults to JSON arrays.',
+        required=False,
+        type=OpenApiTypes.STR,
+        enum=['json', 'binary', 'base64'],
+    ),
+    OpenApiParameter(
+        name='dtype',
+        location=OpenApiParameter.QUERY,
+        description='Little-endian float type of packed vectors.',
+        required=False,
+        type=OpenApiTypes.STR,
+        enum=['float32', 'float16'],
+    ),
+]
 
 
 @extend_schema(
@@ -306,52 +841,67 @@ def proxy_chat(request):
     description=(
         "Generate embeddings from a model. `input` may be a string or an array of strings. "
         "Advanced parameters: `truncate` (defaults true), `options`, and `keep_alive`. "
-        "Durations are returned in nanoseconds."
-    )
+        "Durations are returned in nanoseconds. With `?encoding=binary` the body is the packed "
+        "vectors and `X-Embedding-Shape`/`X-Embedding-Dtype` describe them."
+    ),
+    parameters=_EMBEDDING_ENCODING_PARAMETERS,
 )
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def proxy_embed(request):
+@_async_api_view(['POST'])
+async def proxy_embed(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
 
-    body_bytes = request.body or b""
-    payload = None
-    if body_bytes:
-        try:
-            payload = json.loads(body_bytes.decode())
-        except Exception:
-            payload = None
+    body_bytes, payload = _read_payload(request)
 
     if payload and payload.get("node_id") is not None:
         return JsonResponse({"error": "specifying node_id is not allowed"}, status=400)
+    try:
+        encoding = _embedding_encoding(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    headers = _forward_headers(request)
 
-    model_name = payload.get("model") if payload else None
-    node_addr = mgr.choose_node(model_name=model_name)
-    if not node_addr:
-        return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
+    async def _upstream(payload, body_bytes):
+        model_name = payload.get("model") if payload else None
+        batch_key = mgr.embed_batcher.key(payload)
+        if batch_key is not None:
+            resp = await _embed_batched(mgr, batch_key, payload, headers)
+            if resp is not None:
+                return resp
+        inputs = mgr.embed_batcher.inputs(payload) if isinstance(payload, dict) else None
+        if inputs and len(inputs) > getattr(settings, 'PROXY_EMBED_SHARD_SIZE', 128) > 0:
+            try:
+                resp = await _embed_scattered(mgr, payload, inputs, headers)
+            except NodesSaturated as e:
+                return _saturated_response(e)
+            except Exception:
+                logger.exception("proxy embed scatter-gather failed")
+                return JsonResponse({"error": "upstream request failed"}, status=502)
+            if resp is not None:
+                return resp
 
-    url = node_addr.rstrip("/") + "/api/embed"
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+        try:
+            node_addr = await mgr.achoose_node(model_name=model_name)
+        except NodesSaturated as e:
+            return _saturated_response(e)
+        if not node_addr:
+            return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
 
-    import httpx
-    
-    async def do_request():
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.post(url, headers=headers, content=body_bytes)
-                return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
+            resp = await _post_hedged(mgr, node_addr, "embed", "/api/embed", headers, body_bytes, 60.0, model_name)
+            return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
         except Exception:
             logger.exception("proxy embed request failed")
             return JsonResponse({"error": "upstream request failed"}, status=502)
-        finally:
-            try:
-                mgr.release_node(node_addr)
-            except Exception as e:
-                logger.debug("proxy_embeddings do_request release_node failed: %s", e)
-    
-    return async_to_sync(do_request)()
+
+    async def _proxy():
+        resp = await _from_embedding_store(mgr, "embed", payload, _upstream)
+        return resp if resp is not None else await _upstream(payload, body_bytes)
+
+    resp = await _shared_response(mgr, "embed", payload, _proxy)
+    return _encode_embeddings(resp, "embeddings", encoding)
 
 
 @extend_schema(
@@ -386,56 +936,61 @@ def proxy_embed(request):
     },
     description=(
         "Generate an embedding for the provided prompt. This endpoint has been superseded by /api/embed. "
-        "Durations are returned in nanoseconds."
-    )
+        "Durations are returned in nanoseconds. Supports the same `encoding`/`dtype` options as /api/embed."
+    ),
+    parameters=_EMBEDDING_ENCODING_PARAMETERS,
 )
-@api_view(['POST'])
-@permission_classes([AllowAny])
-def proxy_embeddings(request):
+@_async_api_view(['POST'])
+async def proxy_embeddings(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
 
-    body_bytes = request.body or b""
-    payload = None
-    if body_bytes:
-        try:
-            payload = json.loads(body_bytes.decode())
-        except Exception:
-            payload = None
+    body_bytes, payload = _read_payload(request)
 
     if payload and payload.get("node_id") is not None:
         return JsonResponse({"error": "specifying node_id is not allowed"}, status=400)
+    try:
+        encoding = _embedding_encoding(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
 
-    model_name = payload.get("model") if payload else None
-    node_addr = mgr.choose_node(model_name=model_name)
-    if not node_addr:
-        return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
-
-    url = node_addr.rstrip("/") + "/api/embeddings"
-    headers = {k: v for k, v in request.headers.items() if k.lower() not in ("host", "content-length")}
+    async def _upstream(payload, body_bytes):
+        model_name = payload.get("model") if payload else None
+        try:
+            node_addr = await mgr.achoose_node(model_name=model_name)
+        except NodesSaturated as e:
+            return _saturated_response(e)
+        if not node_addr:
+            return JsonResponse({"error": f"model not available on any node: {model_name}"}, status=404)
 
-    import httpx
-    
-    async def do_request():
+        headers = _forward_headers(request)
         try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                resp = await client.post(url, headers=headers, content=body_bytes)
-                return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
+            resp = await _post_hedged(mgr, node_addr, "embeddings", "/api/embeddings", headers, body_bytes, 60.0, model_name)
+            return HttpResponse(resp.content, status=resp.status_code, content_type=resp.headers.get("content-type", "application/json"))
         except Exception:
             logger.exception("proxy embeddings request failed")
             return JsonResponse({"error": "upstream request failed"}, status=502)
-        finally:
-            try:
-                mgr.release_node(node_addr)
-            except Exception as e:
-                logger.debug("proxy embeddings do_request release_node failed: %s", e)
-    
-    return async_to_sync(do_request)()
+
+    async def _proxy():
+        resp = await _from_embedding_store(mgr, "embeddings", payload, _upstream)
+        return resp if resp is not None else await _upstream(payload, body_bytes)
+
+    resp = await _shared_response(mgr, "embeddings", payload, _proxy)
+    return _encode_embeddings(resp, "embedding", encoding)
 
 
 @extend_schema(
     tags=['Proxy'],
+    parameters=[
+        OpenApiParameter(
+            name='refresh',
+            location=OpenApiParameter.QUERY,
+            description='Query every node now instead of serving the published aggregate (admins only).',
+            required=False,
+            type=OpenApiTypes.BOOL,
+        ),
+    ],
     responses={
         200: {
             'type': 'object',
@@ -464,18 +1019,21 @@ def proxy_embeddings(request):
                 }
             }
         },
+        304: None,
         400: {'type': 'object', 'properties': {'error': {'type': 'string'}}},
+        403: {'type': 'object', 'properties': {'error': {'type': 'string'}}},
         503: {'type': 'object', 'properties': {'error': {'type': 'string'}}},
     },
     description=(
         "List models available across all proxy nodes (aggregated). Returns metadata for each unique model including `name`, `modified_at` (RFC3339), "
         "`size` (bytes), `digest`, and a `details` object with format/family/parameter_size/quantization_level. "
-        "Models with the same name from different nodes are deduplicated, keeping the most recently modified version."
+        "Models with the same name from different nodes are deduplicated, keeping the most recently modified version. "
+        "The list is the aggregate built by the periodic model refresh and carries an `ETag`; send it back in "
+        "`If-None-Match` to get `304 Not Modified` while it is unchanged. Admins can pass `refresh=true` to query the nodes now."
     )
 )
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def proxy_tags(request):
+@_async_api_view(['GET'])
+async def proxy_tags(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
@@ -483,58 +1041,74 @@ def proxy_tags(request):
     if request.GET.get("node_id") is not None:
         return JsonResponse({"error": "specifying node_id is not allowed"}, status=400)
 
-    # Get all active and standby nodes
+    force = str(request.GET.get("refresh", "")).lower() in ("1", "true", "yes")
+    if force and not await sync_to_async(_is_admin)(request):
+        return JsonResponse({"error": "refresh requires an admin user"}, status=403)
+
+    # the aggregate published by the periodic model refresh
+    tags = None if force else await mgr.atags_payload()
+    if tags is None:
+        tags = await _fetch_tags(mgr)
+        if tags is None:
+            return JsonResponse({"error": "no nodes available"}, status=503)
+        await sync_to_async(mgr.publish_tags, thread_sensitive=False)(tags)
+
+    etag, body = tags
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        resp = HttpResponse(status=304)
+    else:
+        resp = HttpResponse(body, content_type="application/json")
+    resp["ETag"] = etag
+    return resp
+
+
+def _is_admin(request) -> bool:
+    """Whether the request authenticates (with DRF's configured schemes) as a staff user."""
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return bool(getattr(drf_request.user, "is_staff", False))
+    except Exception as e:
+        logger.debug("admin check failed: %s", e)
+        return False
+
+
+def _etag_matches(if_none_match, etag: str) -> bool:
+    """Whether an `If-None-Match` header matches `etag` (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+
+async def _fetch_tags(mgr):
+    """Query `/api/tags` on every active and standby node now; `(etag, body)` or None."""
     from django.core.cache import cache
-    active = cache.get(mgr.ACTIVE_POOL_KEY, [])
-    standby = cache.get(mgr.STANDBY_POOL_KEY, [])
+    active = await cache.aget(mgr.ACTIVE_POOL_KEY, [])
+    standby = await cache.aget(mgr.STANDBY_POOL_KEY, [])
     all_nodes = list({*active, *standby})
 
     if not all_nodes:
-        return JsonResponse({"error": "no nodes available"}, status=503)
-
-    # Query /api/tags from all nodes concurrently
-    import httpx
+        return None
 
     async def fetch_node_tags(addr):
         url = addr.rstrip("/") + "/api/tags"
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp = await client.get(url)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return data.get("models", []) if isinstance(data, dict) else []
+            client = mgr.get_client(addr)
+            resp = await client.get(url, timeout=10.0)
+            if resp.status_code == 200:
+                data = resp.json()
+                return data.get("models", []) if isinstance(data, dict) else []
         except Exception as e:
             logger.debug("failed to fetch tags from %s: %s", addr, e)
         return []
 
-    async def fetch_all():
-        tasks = [fetch_node_tags(addr) for addr in all_nodes]
-        return await asyncio.gather(*tasks, return_exceptions=True)
-
-    # Fetch from all nodes concurrently (use async_to_sync for sync view)
-    results = async_to_sync(fetch_all)()
-
-    # Aggregate models: deduplicate by name, keep most recent modified_at
-    models_dict = {}
-    for result in results:
-        if isinstance(result, list):
-            for model in result:
-                if isinstance(model, dict) and model.get("name"):
-                    name = model["name"]
-                    # If model name already exists, compare modified_at and keep newer
-                    if name in models_dict:
-                        existing_modified = models_dict[name].get("modified_at", "")
-                        new_modified = model.get("modified_at", "")
-                        # Simple string comparison works for RFC3339 timestamps
-                        if new_modified > existing_modified:
-                            models_dict[name] = model
-                    else:
-                        models_dict[name] = model
-
-    # Sort by name for consistent ordering
-    models_list = sorted(models_dict.values(), key=lambda m: m.get("name", ""))
-
-    return JsonResponse({"models": models_list}, safe=False)
+    # Fetch from all nodes concurrently
+    results = await asyncio.gather(*[fetch_node_tags(addr) for addr in all_nodes], return_exceptions=True)
+    return build_tags_payload({
+        addr: result for addr, result in zip(all_nodes, results) if isinstance(result, list)
+    })
 
 
 @extend_schema(
@@ -542,40 +1116,34 @@ def proxy_tags(request):
     responses={200: {'type': 'object'}},
     description='List running models loaded into memory on all nodes (aggregated).'
 )
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def proxy_ps(request):
+@_async_api_view(['GET'])
+async def proxy_ps(request):
     mgr = _get_manager()
     if mgr is None:
         return JsonResponse({"error": "no proxy nodes configured"}, status=503)
 
     from django.core.cache import cache
-    active = cache.get(mgr.ACTIVE_POOL_KEY, [])
-    standby = cache.get(mgr.STANDBY_POOL_KEY, [])
+    active = await cache.aget(mgr.ACTIVE_POOL_KEY, [])
+    standby = await cache.aget(mgr.STANDBY_POOL_KEY, [])
     all_nodes = list({*active, *standby})
 
     if not all_nodes:
         return JsonResponse({"error": "no nodes available"}, status=503)
 
-    import httpx
     # fetch runtime ps from nodes
     async def fetch_node_ps(addr):
         url = addr.rstrip('/') + '/api/ps'
         try:
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                resp = await client.get(url)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    return data.get('models', []) if isinstance(data, dict) else []
+            client = mgr.get_client(addr)
+            resp = await client.get(url, timeout=10.0)
+            if resp.status_code == 200:
+                data = resp.json()
+                return data.get('models', []) if isinstance(data, dict) else []
         except Exception as e:
             logger.debug('failed to fetch /api/ps from %s: %s', addr, e)
         return []
 
-    async def fetch_all():
-        tasks = [fetch_node_ps(addr) for addr in all_nodes]
-        return await asyncio.gather(*tasks, return_exceptions=True)
-
-    results = async_to_sync(fetch_all)()
+    results = await asyncio.gather(*[fetch_node_ps(addr) for addr in all_nodes], return_exceptions=True)
 
     # Build map of runtime loaded models -> set of node addrs
     running_map: dict[str, list[str]] = {}
@@ -593,7 +1161,7 @@ def proxy_ps(request):
     # Read DB node.available_models for all nodes in DB
     try:
         from proxy.models import node as NodeModel
-        db_nodes = NodeModel.objects.filter(active=True)
+        db_nodes = [n async for n in NodeModel.objects.filter(active=True)]
     except Exception:
         db_nodes = []
 